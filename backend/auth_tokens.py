@@ -0,0 +1,122 @@
+"""
+Auth Tokens - Shared JWT verification dependency
+Bounded LRU of verified tokens so repeat requests skip decode + HMAC
+"""
+
+from collections import OrderedDict
+from typing import Any
+import hashlib
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import jwt
+
+from backend.settings import get_settings
+
+type AuthData = dict[str, Any]
+type TokenCacheStats = dict[str, int | float | None]
+
+security = HTTPBearer()
+
+
+class VerifiedTokenCache:
+    """LRU of JWT payloads that already passed signature verification.
+
+    The frontend sends the same bearer token on every call, so each entry is
+    keyed by the SHA-256 digest of the token (the raw token is never kept)
+    and served until the token's own `exp`, after which it is evicted and
+    reported as expired exactly like a fresh decode would. Tokens without
+    `exp` are verified every time. At most `max_entries` payloads are held;
+    the least recently used is dropped first.
+
+    verify_token is a sync dependency, so FastAPI calls this from its
+    threadpool; every access to the LRU happens under `_lock`.
+    """
+
+    def __init__(self, max_entries: int | None = None):
+        """Initialize from arguments or AUTH_TOKEN_CACHE_SIZE."""
+        self.max_entries = max_entries or int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+        self._entries: OrderedDict[str, tuple[AuthData, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def verify(self, token: str) -> AuthData:
+        """Decoded payload of a valid token, from cache when possible.
+
+        Raises:
+            HTTPException: 401 if the token is expired or invalid
+        """
+        key = self._digest(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at > time.time():
+                    self._hits += 1
+                    self._entries.move_to_end(key)
+                    return dict(payload)
+                self._expired += 1
+                self._entries.pop(key, None)
+                raise HTTPException(status_code=401, detail="Token expired")
+            self._misses += 1
+
+        settings = get_settings()
+        try:
+            payload: AuthData = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        expires_at = payload.get("exp")
+        if isinstance(expires_at, (int, float)):
+            with self._lock:
+                self._entries[key] = (payload, float(expires_at))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evicted += 1
+
+        return dict(payload)
+
+    def clear(self) -> None:
+        """Drop every cached token (e.g. after rotating JWT_SECRET_KEY)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> TokenCacheStats:
+        """Hit rate and eviction counters."""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+            "expired": self._expired,
+            "evicted": self._evicted
+        }
+
+
+# Singleton instance
+verified_token_cache = VerifiedTokenCache()
+
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthData:
+    """Verify JWT token and return user data (FastAPI dependency shared by all routers).
+
+    Raises:
+        HTTPException: 401 if token expired or invalid
+    """
+    return verified_token_cache.verify(credentials.credentials)
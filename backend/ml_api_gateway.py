@@ -0,0 +1,395 @@
+"""
+MercadoLibre API Gateway - Rate limiting, backoff, circuit breaking and priority lanes
+httpx transport wrapped around the shared pool so every ML call is throttled centrally
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Iterator
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+import httpx
+
+from backend.ml_circuit_breaker import CircuitBreaker, LatencyWindow
+
+type GatewayStats = dict[str, Any]
+
+
+class MLPriority(str, Enum):
+    """Request lanes: interactive requests are always served first."""
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+# First path segment -> endpoint family with its own circuit breaker
+_ENDPOINT_FAMILIES = {"orders": "orders", "users": "users", "oauth": "oauth"}
+
+_request_priority: ContextVar[MLPriority] = ContextVar("ml_request_priority", default=MLPriority.INTERACTIVE)
+
+
+@contextmanager
+def ml_priority(priority: MLPriority) -> Iterator[None]:
+    """Run ML calls made inside the block (and tasks it spawns) in a priority lane.
+
+    Example:
+        with ml_priority(MLPriority.BACKGROUND):
+            await sync_store_orders(...)
+    """
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.interactive_waiting = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, reserve: float = 0.0) -> float:
+        """Seconds until one token is available above `reserve` (0 = available now)."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        missing = 1.0 + reserve - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+    def block(self, seconds: float) -> None:
+        """Hold all requests for `seconds` (ML answered 429 with Retry-After)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class MLGatewayTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport with ML-aware throttling.
+
+    Every request takes a token from the application-wide bucket and from
+    its seller's bucket (keyed by a digest of the bearer token, i.e. one
+    bucket per connected store). Background requests (syncs, token refresh,
+    webhooks) leave `background_reserve` of each bucket to interactive
+    requests and yield to interactive requests waiting on the same seller
+    bucket or on the application bucket; another seller's backlog does
+    not hold them up.
+
+    A 429 blocks that seller's bucket for Retry-After (or a jittered
+    exponential backoff) and the request is retried; idempotent GETs are
+    also retried on 5xx and connection errors. Interactive requests that
+    would wait longer than `max_wait` get a synthetic 429 instead of
+    hanging the handler; `max_wait` is an overall deadline for them, so
+    retries and backoff stop once it would be passed, and timeouts are
+    not retried on the interactive lane.
+
+    Each endpoint family (orders, users, oauth, other) has a circuit
+    breaker: while it is open, requests get a synthetic 503 immediately
+    instead of tying up a worker for the full timeout. With hedging on,
+    an interactive GET still unanswered after the family's p95 latency is
+    sent a second time (if a token is free) and the first answer wins.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        """Wrap a transport; limits come from ML_GATEWAY_* environment variables."""
+        self._transport = transport
+        self.app_rate = float(os.getenv("ML_GATEWAY_APP_RATE", "25"))
+        self.app_burst = float(os.getenv("ML_GATEWAY_APP_BURST", "50"))
+        self.seller_rate = float(os.getenv("ML_GATEWAY_SELLER_RATE", "5"))
+        self.seller_burst = float(os.getenv("ML_GATEWAY_SELLER_BURST", "10"))
+        self.background_reserve = float(os.getenv("ML_GATEWAY_BACKGROUND_RESERVE", "0.2"))
+        self.max_retries = int(os.getenv("ML_GATEWAY_MAX_RETRIES", "3"))
+        self.max_wait = float(os.getenv("ML_GATEWAY_MAX_WAIT", "20"))
+        self.backoff_base = float(os.getenv("ML_GATEWAY_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("ML_GATEWAY_BACKOFF_MAX", "30"))
+        self.hedge_enabled = os.getenv("ML_HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_min_delay = float(os.getenv("ML_HEDGE_MIN_DELAY", "0.1"))
+        self.idle_bucket_ttl = 600.0
+
+        self._app_bucket = TokenBucket(self.app_rate, self.app_burst)
+        self._seller_buckets: dict[str, TokenBucket] = {}
+        self._waiting = {priority: 0 for priority in MLPriority}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latency: dict[str, LatencyWindow] = {}
+        self._counters = {
+            "requests": 0,
+            "throttled": 0,
+            "retries": 0,
+            "rejected": 0,
+            "upstream_429": 0,
+            "short_circuited": 0,
+            "hedged": 0,
+            "hedge_wins": 0
+        }
+        self._wait_seconds = {priority: 0.0 for priority in MLPriority}
+
+    def _seller_key(self, request: httpx.Request) -> str:
+        """Bucket key: digest of the bearer token, or the path for unauthenticated calls."""
+        authorization = request.headers.get('Authorization', '')
+        if authorization:
+            return hashlib.sha256(authorization.encode()).hexdigest()[:16]
+        return request.url.path
+
+    def _family(self, request: httpx.Request) -> str:
+        """Endpoint family of a request, e.g. /orders/search -> orders."""
+        segment = request.url.path.strip('/').split('/', 1)[0]
+        family = _ENDPOINT_FAMILIES.get(segment, "other")
+        if family not in self._breakers:
+            self._breakers[family] = CircuitBreaker(family)
+            self._latency[family] = LatencyWindow()
+        return family
+
+    def _seller_bucket(self, key: str) -> TokenBucket:
+        bucket = self._seller_buckets.get(key)
+        if bucket is None:
+            self._evict_idle_buckets()
+            bucket = TokenBucket(self.seller_rate, self.seller_burst)
+            self._seller_buckets[key] = bucket
+        return bucket
+
+    def _evict_idle_buckets(self) -> None:
+        """Drop buckets for tokens unused for a while (refreshed tokens get new keys)."""
+        cutoff = time.monotonic() - self.idle_bucket_ttl
+        for key in [k for k, b in self._seller_buckets.items() if b.updated_at < cutoff and b.blocked_until < cutoff]:
+            del self._seller_buckets[key]
+
+    def _backoff(self, attempt: int, response: httpx.Response | None = None) -> float:
+        """Retry-After when ML sent one, else jittered exponential backoff."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return float(retry_after) + random.uniform(0, self.backoff_base)
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def _acquire(self, seller_bucket: TokenBucket, priority: MLPriority, deadline: float) -> bool:
+        """Wait for a token in both buckets; False if an interactive wait would pass `deadline`."""
+        reserve = 0.0
+        if priority is MLPriority.BACKGROUND:
+            reserve = self.background_reserve
+
+        started = time.monotonic()
+        throttled = False
+        # Bucket an interactive request is currently held up by (counted in its interactive_waiting)
+        waiting_on: TokenBucket | None = None
+        self._waiting[priority] += 1
+        try:
+            while True:
+                if priority is MLPriority.BACKGROUND and (
+                    seller_bucket.interactive_waiting or self._app_bucket.interactive_waiting
+                ):
+                    wait = 0.05
+                else:
+                    app_wait = self._app_bucket.wait_time(reserve * self.app_burst)
+                    seller_wait = seller_bucket.wait_time(reserve * self.seller_burst)
+                    wait = max(app_wait, seller_wait)
+                    if wait <= 0:
+                        self._app_bucket.take()
+                        seller_bucket.take()
+                        return True
+                    if priority is MLPriority.INTERACTIVE:
+                        bucket = self._app_bucket if app_wait >= seller_wait else seller_bucket
+                        if bucket is not waiting_on:
+                            if waiting_on is not None:
+                                waiting_on.interactive_waiting -= 1
+                            bucket.interactive_waiting += 1
+                            waiting_on = bucket
+
+                if priority is MLPriority.INTERACTIVE and time.monotonic() + wait > deadline:
+                    return False
+                if not throttled:
+                    self._counters["throttled"] += 1
+                    throttled = True
+                await asyncio.sleep(wait)
+        finally:
+            if waiting_on is not None:
+                waiting_on.interactive_waiting -= 1
+            self._waiting[priority] -= 1
+            self._wait_seconds[priority] += time.monotonic() - started
+
+    def _rejection(self, request: httpx.Request, seller_bucket: TokenBucket) -> httpx.Response:
+        """Local 429 for a request that could not get a token within max_wait."""
+        self._counters["rejected"] += 1
+        retry_after = max(1, int(seller_bucket.wait_time() + 0.999))
+        return httpx.Response(
+            429,
+            headers={'Retry-After': str(retry_after)},
+            json={"message": "MercadoLibre rate limit reached, retry shortly", "error": "local_throttle"},
+            request=request
+        )
+
+    def _circuit_open(self, request: httpx.Request, breaker: CircuitBreaker) -> httpx.Response:
+        """Local 503 for a request refused by an open breaker."""
+        self._counters["short_circuited"] += 1
+        return httpx.Response(
+            503,
+            headers={'Retry-After': str(max(1, int(breaker.retry_after() + 0.999)))},
+            json={
+                "message": f"MercadoLibre {breaker.name} API is failing, retry shortly",
+                "error": "circuit_open"
+            },
+            request=request
+        )
+
+    def _try_take(self, seller_bucket: TokenBucket) -> bool:
+        """Take a token from both buckets only if one is free right now."""
+        if self._app_bucket.wait_time() > 0 or seller_bucket.wait_time() > 0:
+            return False
+        self._app_bucket.take()
+        seller_bucket.take()
+        return True
+
+    @staticmethod
+    def _discard(task: asyncio.Task) -> None:
+        """Cancel a losing attempt and close its response if it already arrived."""
+        def close(finished: asyncio.Task) -> None:
+            if not finished.cancelled() and finished.exception() is None:
+                asyncio.ensure_future(finished.result().aclose())
+
+        task.cancel()
+        task.add_done_callback(close)
+
+    async def _send_hedged(
+        self,
+        request: httpx.Request,
+        delay: float,
+        seller_bucket: TokenBucket
+    ) -> httpx.Response:
+        """Send, and send again after `delay` if no answer yet; first answer wins."""
+        primary = asyncio.create_task(self._transport.handle_async_request(request))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and self._try_take(seller_bucket):
+                self._counters["hedged"] += 1
+                pending.add(asyncio.create_task(self._transport.handle_async_request(request)))
+
+            error: BaseException | None = None
+            while done or pending:
+                if not done:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    for task in done - {winner}:
+                        self._discard(task)
+                    if winner is not primary:
+                        self._counters["hedge_wins"] += 1
+                    return winner.result()
+                error = error or next(iter(done)).exception()
+                done = set()
+            raise error
+        finally:
+            for task in pending:
+                self._discard(task)
+
+    async def _send(
+        self,
+        request: httpx.Request,
+        family: str,
+        hedge: bool,
+        seller_bucket: TokenBucket
+    ) -> httpx.Response:
+        """One attempt, hedged when enabled and the family has a p95 to go by."""
+        p95 = self._latency[family].p95() if hedge else None
+        if p95 is None:
+            return await self._transport.handle_async_request(request)
+        return await self._send_hedged(request, max(self.hedge_min_delay, p95), seller_bucket)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Throttle, send and retry one request."""
+        priority = _request_priority.get()
+        seller_bucket = self._seller_bucket(self._seller_key(request))
+        idempotent = request.method in ("GET", "HEAD")
+        family = self._family(request)
+        breaker = self._breakers[family]
+        interactive = priority is MLPriority.INTERACTIVE
+        hedge = self.hedge_enabled and idempotent and interactive
+        # Interactive requests get max_wait overall, across throttling, retries and backoff
+        deadline = time.monotonic() + self.max_wait
+        self._counters["requests"] += 1
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                return self._circuit_open(request, breaker)
+            if not await self._acquire(seller_bucket, priority, deadline):
+                # Never reached ML: don't let a reserved half-open probe block the family
+                breaker.release_probe()
+                return self._rejection(request, seller_bucket)
+
+            last_attempt = attempt == self.max_retries
+            started = time.monotonic()
+            try:
+                response = await self._send(request, family, hedge, seller_bucket)
+            except httpx.TransportError as e:
+                breaker.record(False)
+                if not idempotent or last_attempt:
+                    raise
+                # A timed-out interactive call already used the client timeout; don't repeat it
+                if interactive and isinstance(e, httpx.TimeoutException):
+                    raise
+                delay = self._backoff(attempt)
+                if interactive and time.monotonic() + delay > deadline:
+                    raise
+                self._counters["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+
+            latency = time.monotonic() - started
+            breaker.record(response.status_code < 500, latency)
+            if response.status_code < 500:
+                self._latency[family].add(latency)
+
+            if response.status_code == 429:
+                self._counters["upstream_429"] += 1
+                delay = self._backoff(attempt, response)
+                seller_bucket.block(delay)
+            elif response.status_code >= 500 and idempotent:
+                delay = self._backoff(attempt)
+            else:
+                return response
+
+            if last_attempt or (interactive and time.monotonic() + delay > deadline):
+                return response
+
+            await response.aclose()
+            self._counters["retries"] += 1
+            if response.status_code != 429:
+                await asyncio.sleep(delay)
+            # 429: the blocked bucket makes the next _acquire wait out the delay
+
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def stats(self) -> GatewayStats:
+        """Bucket configuration, queue lengths and throttling counters."""
+        return {
+            "app_rate": self.app_rate,
+            "seller_rate": self.seller_rate,
+            "seller_buckets": len(self._seller_buckets),
+            "hedge_enabled": self.hedge_enabled,
+            "circuits": {family: breaker.stats() for family, breaker in self._breakers.items()},
+            "p95_latency": {
+                family: round(p95, 3) if (p95 := window.p95()) is not None else None
+                for family, window in self._latency.items()
+            },
+            "waiting": {priority.value: count for priority, count in self._waiting.items()},
+            "wait_seconds": {priority.value: round(total, 3) for priority, total in self._wait_seconds.items()},
+            **self._counters
+        }
@@ -0,0 +1,136 @@
+"""
+MercadoLibre Circuit Breaker - Fail fast while an ML endpoint family is down
+Rolling error/latency windows that trip per family and feed hedged-read delays
+"""
+
+from collections import deque
+from enum import Enum
+from typing import Any
+import os
+import time
+
+type BreakerStats = dict[str, Any]
+
+
+class CircuitState(str, Enum):
+    """Breaker states."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, size: int = 200, min_samples: int | None = None):
+        self.min_samples = min_samples or int(os.getenv("ML_HEDGE_MIN_SAMPLES", "20"))
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float | None:
+        """Latency below which `fraction` of samples fall (None until min_samples)."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def p95(self) -> float | None:
+        return self.percentile(0.95)
+
+
+class CircuitBreaker:
+    """Error-rate breaker over the last `window` calls to one endpoint family.
+
+    A call fails if it raised, answered 5xx, or took longer than
+    `slow_call_seconds`. Once at least `min_calls` are recorded and the
+    failure ratio reaches `failure_ratio`, the breaker opens and callers
+    are refused for `reset_timeout` seconds. It then lets a single probe
+    through (half-open): success closes it, failure opens it again.
+    """
+
+    def __init__(self, name: str):
+        """Initialize from ML_BREAKER_* environment variables."""
+        self.name = name
+        self.failure_ratio = float(os.getenv("ML_BREAKER_FAILURE_RATIO", "0.5"))
+        self.min_calls = int(os.getenv("ML_BREAKER_MIN_CALLS", "10"))
+        self.slow_call_seconds = float(os.getenv("ML_BREAKER_SLOW_CALL", "10"))
+        self.reset_timeout = float(os.getenv("ML_BREAKER_RESET_TIMEOUT", "30"))
+
+        self.state = CircuitState.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=int(os.getenv("ML_BREAKER_WINDOW", "20")))
+        self._opened_at = 0.0
+        self._probe_started_at: float | None = None
+        self._times_opened = 0
+        self._rejected = 0
+
+    def allow(self) -> bool:
+        """True if a call may go out now."""
+        if self.state is CircuitState.CLOSED:
+            return True
+
+        now = time.monotonic()
+        if self.state is CircuitState.OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                self._rejected += 1
+                return False
+            self.state = CircuitState.HALF_OPEN
+            self._probe_started_at = None
+
+        # Half-open: one probe at a time; a probe that never reported back is given up on
+        if self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout:
+            self._rejected += 1
+            return False
+        self._probe_started_at = now
+        return True
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot that was allowed but never sent."""
+        if self.state is CircuitState.HALF_OPEN:
+            self._probe_started_at = None
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a probe through."""
+        if self.state is CircuitState.CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record(self, success: bool, latency: float | None = None) -> None:
+        """Record a call outcome; slow successes count as failures."""
+        if success and latency is not None and latency > self.slow_call_seconds:
+            success = False
+
+        if self.state is CircuitState.HALF_OPEN:
+            if success:
+                self.state = CircuitState.CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            self._probe_started_at = None
+            return
+
+        self._outcomes.append(success)
+        if len(self._outcomes) < self.min_calls:
+            return
+        failures = self._outcomes.count(False)
+        if failures / len(self._outcomes) >= self.failure_ratio:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._times_opened += 1
+        print(f"WARNING: ML circuit '{self.name}' opened for {self.reset_timeout:.0f}s")
+
+    def stats(self) -> BreakerStats:
+        """State and counters."""
+        return {
+            "state": self.state.value,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "times_opened": self._times_opened,
+            "rejected": self._rejected,
+            "retry_after": round(self.retry_after(), 1)
+        }
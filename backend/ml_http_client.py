@@ -0,0 +1,155 @@
+"""
+MercadoLibre HTTP Client Pool - Shared keep-alive connections
+Single process-wide httpx client reused by every ML API call
+"""
+
+from typing import Any
+import importlib.util
+import os
+import httpx
+
+from backend.ml_api_gateway import MLGatewayTransport
+
+ML_API_BASE_URL = "https://api.mercadolibre.com"
+
+type PoolStats = dict[str, Any]
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class MLHttpClientPool:
+    """Lifespan-managed httpx.AsyncClient with keep-alive and HTTP/2.
+
+    The client is created on `start()` (FastAPI lifespan startup) and closed
+    on `aclose()`. Callers that run outside the lifespan (scripts, tests) get
+    a client lazily on first use.
+
+    Every request is traced through httpcore so we can tell whether it reused
+    a pooled connection (hit) or had to open a new TCP+TLS connection (miss).
+    """
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        max_keepalive_connections: int | None = None,
+        keepalive_expiry: float | None = None,
+        timeout: float | None = None,
+        http2: bool | None = None
+    ):
+        """Initialize pool limits from arguments or ML_HTTP_* environment variables."""
+        self.max_connections = max_connections or _env_int("ML_HTTP_MAX_CONNECTIONS", 100)
+        self.max_keepalive_connections = max_keepalive_connections or _env_int(
+            "ML_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20
+        )
+        self.keepalive_expiry = keepalive_expiry or _env_float("ML_HTTP_KEEPALIVE_EXPIRY", 30.0)
+        self.timeout = timeout or _env_float("ML_HTTP_TIMEOUT", 30.0)
+
+        if http2 is None:
+            http2 = os.getenv("ML_HTTP2", "true").lower() in ("1", "true", "yes")
+        # HTTP/2 needs the optional `h2` package (httpx[http2])
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+
+        self._client: httpx.AsyncClient | None = None
+        self._gateway: MLGatewayTransport | None = None
+        self._requests = 0
+        self._pool_hits = 0
+        self._pool_misses = 0
+
+    @property
+    def is_running(self) -> bool:
+        """True while a client is open."""
+        return self._client is not None and not self._client.is_closed
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared client, created lazily if the lifespan has not started it."""
+        if not self.is_running:
+            self._client = self._build_client()
+        return self._client
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Build the pooled client with configured limits behind the rate-limit gateway."""
+        pooled = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            )
+        )
+        self._gateway = MLGatewayTransport(pooled)
+        return httpx.AsyncClient(
+            base_url=ML_API_BASE_URL,
+            transport=self._gateway,
+            timeout=self.timeout,
+            headers={'Accept': 'application/json'},
+            event_hooks={'request': [self._attach_trace]}
+        )
+
+    async def start(self) -> None:
+        """Open the shared client (FastAPI lifespan startup)."""
+        if not self.is_running:
+            self._client = self._build_client()
+
+    async def aclose(self) -> None:
+        """Close the shared client and its pooled connections (lifespan shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _attach_trace(self, request: httpx.Request) -> None:
+        """Install an httpcore trace hook that records pool hit/miss for this request."""
+        self._requests += 1
+        state = {'counted': False}
+
+        async def trace(event_name: str, info: dict[str, Any]) -> None:
+            if state['counted']:
+                return
+            if event_name == "connection.connect_tcp.started":
+                self._pool_misses += 1
+                state['counted'] = True
+            elif event_name.endswith("send_request_headers.started"):
+                # Headers sent without a TCP connect: the connection came from the pool
+                self._pool_hits += 1
+                state['counted'] = True
+
+        request.extensions = {**request.extensions, 'trace': trace}
+
+    def stats(self) -> PoolStats:
+        """Pool configuration plus hit/miss counters."""
+        connections_seen = self._pool_hits + self._pool_misses
+        return {
+            "running": self.is_running,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "requests": self._requests,
+            "pool_hits": self._pool_hits,
+            "pool_misses": self._pool_misses,
+            "hit_rate": round(self._pool_hits / connections_seen, 4) if connections_seen else None,
+            "gateway": self._gateway.stats() if self._gateway is not None else None
+        }
+
+
+# Singleton instance
+ml_http_pool = MLHttpClientPool()
+
+
+def get_ml_http_client() -> httpx.AsyncClient:
+    """FastAPI dependency returning the shared ML HTTP client."""
+    return ml_http_pool.client
@@ -14,6 +14,8 @@ import os
 from cryptography.fernet import Fernet
 import base64
 
+from backend.ml_http_client import MLHttpClientPool, ml_http_pool
+
 # Type aliases compatible with Python 3.11+
 from typing import Dict, Any, Union
 
@@ -21,6 +23,12 @@ MLTokens = Dict[str, Union[str, int]]
 MLUserInfo = Dict[str, Any]
 StoreConfig = Dict[str, Union[str, int, None]]
 
+class RefreshTokenRevoked(HTTPException):
+    """ML answered invalid_grant: the refresh token is revoked or expired and retrying cannot help."""
+    
+    def __init__(self, detail: str = "ML refresh token revoked or expired; reconnect the store"):
+        super().__init__(status_code=401, detail=detail)
+
 class MLOAuthService:
     """Professional MercadoLibre OAuth service with security best practices."""
     
@@ -31,8 +39,14 @@ class MLOAuthService:
         'MPE': {'name': 'Perú', 'domain': 'com.pe', 'flag': '🇵🇪', 'currency': 'PEN'}
     }
     
-    def __init__(self, encryption_key: Optional[str] = None):
-        """Initialize with optional encryption for secrets."""
+    def __init__(
+        self,
+        encryption_key: Optional[str] = None,
+        http_pool: Optional[MLHttpClientPool] = None
+    ):
+        """Initialize with optional encryption for secrets and a shared HTTP pool."""
+        self.http_pool = http_pool or ml_http_pool
+        
         if encryption_key:
             self.cipher = Fernet(encryption_key.encode()[:32].ljust(32, b'0'))
         else:
@@ -101,8 +115,8 @@ class MLOAuthService:
         if site_id not in self.ML_SITES:
             raise ValueError(f"Invalid site_id: {site_id}")
         
-        # ML token endpoint
-        token_url = "https://api.mercadolibre.com/oauth/token"
+        # ML token endpoint (relative to the pooled client's base URL)
+        token_url = "/oauth/token"
         
         # Prepare request data
         data = {
@@ -113,43 +127,43 @@ class MLOAuthService:
             'redirect_uri': redirect_uri
         }
         
-        # Make request with timeout
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    token_url,
-                    data=data,
-                    headers={'Accept': 'application/json'}
-                )
-                
-                if response.status_code != 200:
-                    error_data = response.json() if response.text else {}
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"ML OAuth error: {error_data.get('message', 'Unknown error')}"
-                    )
-                
-                tokens = response.json()
-                
-                # Validate response has required fields
-                if 'access_token' not in tokens or 'refresh_token' not in tokens:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Invalid token response from MercadoLibre"
-                    )
-                
-                return tokens
-                
-            except httpx.TimeoutException:
+        # Make request through the shared pooled client
+        client = self.http_pool.client
+        try:
+            response = await client.post(
+                token_url,
+                data=data,
+                headers={'Accept': 'application/json'}
+            )
+            
+            if response.status_code != 200:
+                error_data = response.json() if response.text else {}
                 raise HTTPException(
-                    status_code=504,
-                    detail="Timeout connecting to MercadoLibre"
+                    status_code=400,
+                    detail=f"ML OAuth error: {error_data.get('message', 'Unknown error')}"
                 )
-            except Exception as e:
+            
+            tokens = response.json()
+            
+            # Validate response has required fields
+            if 'access_token' not in tokens or 'refresh_token' not in tokens:
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"Error exchanging code: {str(e)}"
+                    status_code=400,
+                    detail="Invalid token response from MercadoLibre"
                 )
+            
+            return tokens
+            
+        except httpx.TimeoutException:
+            raise HTTPException(
+                status_code=504,
+                detail="Timeout connecting to MercadoLibre"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error exchanging code: {str(e)}"
+            )
     
     async def refresh_access_token(
         self, 
@@ -160,7 +174,7 @@ class MLOAuthService:
     ) -> MLTokens:
         """Refresh an expired access token."""
         
-        token_url = "https://api.mercadolibre.com/oauth/token"
+        token_url = "/oauth/token"
         
         data = {
             'grant_type': 'refresh_token',
@@ -169,56 +183,64 @@ class MLOAuthService:
             'refresh_token': refresh_token
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    token_url,
-                    data=data,
-                    headers={'Accept': 'application/json'}
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Failed to refresh token"
-                    )
-                
-                return response.json()
-                
-            except Exception as e:
+        client = self.http_pool.client
+        try:
+            response = await client.post(
+                token_url,
+                data=data,
+                headers={'Accept': 'application/json'}
+            )
+            
+            if response.status_code != 200:
+                try:
+                    error = response.json().get('error')
+                except ValueError:
+                    error = None
+                if error == 'invalid_grant':
+                    raise RefreshTokenRevoked()
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"Error refreshing token: {str(e)}"
+                    status_code=401,
+                    detail="Failed to refresh token"
                 )
+            
+            return response.json()
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error refreshing token: {str(e)}"
+            )
     
     async def get_user_info(self, access_token: str) -> MLUserInfo:
         """Get ML user information using access token."""
         
-        url = "https://api.mercadolibre.com/users/me"
+        url = "/users/me"
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    url,
-                    headers={
-                        'Authorization': f'Bearer {access_token}',
-                        'Accept': 'application/json'
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Invalid or expired access token"
-                    )
-                
-                return response.json()
-                
-            except Exception as e:
+        client = self.http_pool.client
+        try:
+            response = await client.get(
+                url,
+                headers={
+                    'Authorization': f'Bearer {access_token}',
+                    'Accept': 'application/json'
+                }
+            )
+            
+            if response.status_code != 200:
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"Error getting user info: {str(e)}"
+                    status_code=401,
+                    detail="Invalid or expired access token"
                 )
+            
+            return response.json()
+            
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error getting user info: {str(e)}"
+            )
     
     def validate_state_token(self, state: str, expected_user_id: int) -> bool:
         """Validate the state parameter to prevent CSRF attacks."""
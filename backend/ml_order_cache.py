@@ -0,0 +1,184 @@
+"""
+MercadoLibre Order Cache - Order detail LRU backed by ml_orders.order_data
+Status-based TTLs and ETags so repeat opens of an order skip the ML API
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+import hashlib
+import json
+import os
+import time
+
+from backend.supabase_repository import SupabaseRepository
+
+type OrderData = dict[str, Any]
+type OrderCacheStats = dict[str, int | float | None]
+
+# Order statuses that never change again
+FINAL_STATUSES = {"cancelled", "invalid"}
+
+# Paid orders still pick up shipping/feedback changes, but rarely
+SETTLED_STATUSES = {"paid"}
+
+
+def order_etag(order_data: OrderData) -> str:
+    """Strong ETag for an order payload (stable across key order)."""
+    canonical = json.dumps(order_data, sort_keys=True, separators=(',', ':'), default=str)
+    return '"' + hashlib.sha256(canonical.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True if an If-None-Match header covers `etag`."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in candidates or etag in candidates
+
+
+class CachedOrder:
+    """An order payload, its ETag and when it must be re-fetched."""
+
+    def __init__(self, order_data: OrderData, etag: str, expires_at: float, source: str):
+        self.order_data = order_data
+        self.etag = etag
+        self.expires_at = expires_at
+        self.source = source
+
+
+class MLOrderCache:
+    """In-memory LRU of order details over the ml_orders table.
+
+    Lookups check memory first, then the `order_data` column written by
+    syncs and webhooks; only when both are missing or stale does the caller
+    go to ML. How long a copy counts as fresh depends on the order status:
+    cancelled/invalid orders are final, paid orders change rarely, and
+    orders still awaiting payment change often.
+    """
+
+    def __init__(self, max_entries: int | None = None):
+        """Initialize from arguments or ML_ORDER_CACHE_* environment variables."""
+        self.max_entries = max_entries or int(os.getenv("ML_ORDER_CACHE_SIZE", "5000"))
+        self.ttl_open = float(os.getenv("ML_ORDER_CACHE_TTL_OPEN", "60"))
+        self.ttl_settled = float(os.getenv("ML_ORDER_CACHE_TTL_SETTLED", "600"))
+        self.ttl_final = float(os.getenv("ML_ORDER_CACHE_TTL_FINAL", "86400"))
+
+        self._entries: OrderedDict[tuple[int, str], CachedOrder] = OrderedDict()
+        self._memory_hits = 0
+        self._db_hits = 0
+        self._misses = 0
+
+    def ttl_for(self, order_data: OrderData) -> float:
+        """Seconds an order payload stays fresh, by status."""
+        status = order_data.get('status')
+        if status in FINAL_STATUSES:
+            return self.ttl_final
+        if status in SETTLED_STATUSES:
+            return self.ttl_settled
+        return self.ttl_open
+
+    def put(self, store_id: int, order_data: OrderData, age: float = 0.0, source: str = "ml_api") -> CachedOrder:
+        """Cache a payload that is `age` seconds old."""
+        key = (int(store_id), str(order_data['id']))
+        entry = CachedOrder(
+            order_data,
+            order_etag(order_data),
+            time.monotonic() + self.ttl_for(order_data) - age,
+            source
+        )
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get_cached(self, store_id: int, order_id: str) -> CachedOrder | None:
+        """Fresh in-memory entry, if any."""
+        key = (int(store_id), str(order_id))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def get_many(
+        self,
+        db: SupabaseRepository,
+        store_id: int,
+        order_ids: list[str]
+    ) -> dict[str, CachedOrder]:
+        """Fresh copies of several orders from memory, then ml_orders (one query).
+
+        Returns:
+            Entries by order id; ids missing from the result must be fetched from ML
+        """
+        found: dict[str, CachedOrder] = {}
+        missing: list[str] = []
+
+        for order_id in order_ids:
+            entry = self.get_cached(store_id, order_id)
+            if entry is not None:
+                self._memory_hits += 1
+                found[str(order_id)] = entry
+            else:
+                missing.append(str(order_id))
+
+        # ml_order_id is BIGINT; anything else cannot be in the table
+        numeric_ids = [order_id for order_id in missing if order_id.isdigit()]
+
+        if numeric_ids and db:
+            response = await db.execute(
+                db.table('ml_orders').select("ml_order_id, order_data, synced_at").eq(
+                    'store_id', store_id
+                ).in_('ml_order_id', numeric_ids)
+            )
+            for row in response.data or []:
+                order_data = row.get('order_data')
+                if not order_data:
+                    continue
+                age = self._row_age(row)
+                if age is None or age >= self.ttl_for(order_data):
+                    continue
+                self._db_hits += 1
+                found[str(row['ml_order_id'])] = self.put(store_id, order_data, age=age, source="local")
+
+        self._misses += sum(1 for order_id in missing if order_id not in found)
+        return found
+
+    async def get(self, db: SupabaseRepository, store_id: int, order_id: str) -> CachedOrder | None:
+        """Fresh copy of one order from memory or ml_orders (None = fetch from ML)."""
+        return (await self.get_many(db, store_id, [str(order_id)])).get(str(order_id))
+
+    @staticmethod
+    def _row_age(row: dict[str, Any]) -> float | None:
+        """Seconds since an ml_orders row was synced (synced_at is naive local time)."""
+        try:
+            synced_at = datetime.fromisoformat(str(row['synced_at']))
+        except (KeyError, TypeError, ValueError):
+            return None
+        now = datetime.now(synced_at.tzinfo) if synced_at.tzinfo else datetime.now()
+        return max(0.0, (now - synced_at).total_seconds())
+
+    def invalidate(self, store_id: int, order_id: str) -> None:
+        """Forget an order (e.g. after a webhook says it changed)."""
+        self._entries.pop((int(store_id), str(order_id)), None)
+
+    def stats(self) -> OrderCacheStats:
+        """Hit rates by tier."""
+        lookups = self._memory_hits + self._db_hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self._memory_hits,
+            "db_hits": self._db_hits,
+            "misses": self._misses,
+            "hit_rate": round((self._memory_hits + self._db_hits) / lookups, 4) if lookups else None
+        }
+
+
+# Singleton instance
+ml_order_cache = MLOrderCache()
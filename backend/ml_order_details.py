@@ -0,0 +1,149 @@
+"""
+MercadoLibre Order Details - Batched order fetches
+Groups order ids into ML multiget requests fetched with bounded concurrency
+"""
+
+from typing import Any
+import asyncio
+import os
+import re
+
+import httpx
+
+type OrderData = dict[str, Any]
+type OrderError = dict[str, Any]
+
+# Ids per ML multiget request (ML caps multiget at 20)
+MULTIGET_BATCH_SIZE = int(os.getenv("ML_ORDER_MULTIGET_SIZE", "20"))
+
+# Multiget requests in flight per call
+MULTIGET_CONCURRENCY = int(os.getenv("ML_ORDER_MULTIGET_CONCURRENCY", "4"))
+
+# ML order ids are numeric; anything else would change the requested path or ids= query
+ORDER_ID = re.compile(r"[0-9]+")
+
+# Statuses meaning the multiget route itself is unavailable, not that an order is missing
+_MULTIGET_UNSUPPORTED = {400, 404, 405}
+
+
+class OrderDetailsResult:
+    """Orders fetched by id plus per-id errors."""
+
+    def __init__(self):
+        self.orders: dict[str, OrderData] = {}
+        self.errors: dict[str, OrderError] = {}
+        self.unauthorized = False
+
+
+def _error_message(response: httpx.Response) -> str:
+    """ML error message from a response body, if any."""
+    try:
+        return response.json().get('message', response.reason_phrase)
+    except ValueError:
+        return response.reason_phrase
+
+
+async def _fetch_single(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    order_id: str,
+    result: OrderDetailsResult
+) -> None:
+    """GET /orders/{id} into `result`."""
+    response = await client.get(f"/orders/{order_id}", headers=headers)
+    if response.status_code == 200:
+        result.orders[order_id] = response.json()
+    elif response.status_code == 401:
+        result.unauthorized = True
+    else:
+        result.errors[order_id] = {"status": response.status_code, "message": _error_message(response)}
+
+
+async def _fetch_batch(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    order_ids: list[str],
+    result: OrderDetailsResult
+) -> None:
+    """GET /orders?ids=... into `result`, falling back to single GETs if multiget is refused."""
+    response = await client.get("/orders", params={'ids': ",".join(order_ids)}, headers=headers)
+
+    if response.status_code == 401:
+        result.unauthorized = True
+        return
+
+    if response.status_code in _MULTIGET_UNSUPPORTED:
+        for order_id in order_ids:
+            await _fetch_single(client, headers, order_id, result)
+        return
+
+    if response.status_code != 200:
+        for order_id in order_ids:
+            result.errors[order_id] = {"status": response.status_code, "message": _error_message(response)}
+        return
+
+    try:
+        items = response.json()
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        for order_id in order_ids:
+            result.errors[order_id] = {"status": 502, "message": "Unexpected multiget response"}
+        return
+
+    # Multiget answers [{"code": 200, "body": {...}}, ...] in request order
+    for index, order_id in enumerate(order_ids):
+        item = items[index] if index < len(items) else None
+        body = (item.get('body') or {}) if isinstance(item, dict) else None
+        if not isinstance(body, dict):
+            result.errors[order_id] = {"status": 502, "message": "Unexpected multiget response"}
+        elif item.get('code') == 200:
+            result.orders[str(body.get('id', order_id))] = body
+        else:
+            result.errors[order_id] = {
+                "status": item.get('code'),
+                "message": body.get('message', 'Order not available')
+            }
+
+
+async def fetch_order_details(
+    client: httpx.AsyncClient,
+    access_token: str,
+    order_ids: list[str],
+    batch_size: int | None = None,
+    concurrency: int | None = None
+) -> OrderDetailsResult:
+    """Fetch many orders from ML in multiget batches.
+
+    Args:
+        client: Shared ML HTTP client
+        access_token: Valid ML access token for the store
+        order_ids: Order ids to fetch (deduplicated by the caller)
+        batch_size: Ids per multiget (defaults to ML_ORDER_MULTIGET_SIZE)
+        concurrency: Batches in flight (defaults to ML_ORDER_MULTIGET_CONCURRENCY)
+
+    Returns:
+        Orders and errors by id; `unauthorized` is set if ML rejected the token
+    """
+    batch_size = batch_size or MULTIGET_BATCH_SIZE
+    semaphore = asyncio.Semaphore(concurrency or MULTIGET_CONCURRENCY)
+    headers = {'Authorization': f'Bearer {access_token}', 'Accept': 'application/json'}
+    result = OrderDetailsResult()
+
+    # Never send a non-numeric id with the seller's token
+    for order_id in order_ids:
+        if not ORDER_ID.fullmatch(order_id):
+            result.errors[order_id] = {"status": 400, "message": "Invalid order id"}
+    order_ids = [order_id for order_id in order_ids if order_id not in result.errors]
+
+    async def run(batch: list[str]) -> None:
+        async with semaphore:
+            try:
+                await _fetch_batch(client, headers, batch, result)
+            except httpx.HTTPError as e:
+                for order_id in batch:
+                    result.errors.setdefault(order_id, {"status": 502, "message": str(e)[:200]})
+
+    batches = [order_ids[i:i + batch_size] for i in range(0, len(order_ids), batch_size)]
+    await asyncio.gather(*(run(batch) for batch in batches))
+    return result
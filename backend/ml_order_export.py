@@ -0,0 +1,89 @@
+"""
+MercadoLibre Order Export - Streamed NDJSON/CSV of synced orders
+Encodes ml_orders chunks as they are read so exports never buffer the full set
+"""
+
+from enum import Enum
+from typing import Any, AsyncIterator
+import csv
+import io
+import json
+
+type OrderRow = dict[str, Any]
+
+CSV_COLUMNS = [
+    "ml_order_id",
+    "date_created",
+    "date_closed",
+    "status",
+    "total_amount",
+    "currency_id",
+    "buyer_id",
+    "buyer_nickname",
+    "items",
+    "item_titles",
+    "shipping_id",
+    "payment_ids"
+]
+
+
+class ExportFormat(str, Enum):
+    """Export file format."""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+    @property
+    def media_type(self) -> str:
+        return "application/x-ndjson" if self is ExportFormat.NDJSON else "text/csv"
+
+
+def order_csv_row(row: OrderRow) -> list[Any]:
+    """Flatten an ml_orders row (its order_data payload) to CSV_COLUMNS."""
+    order = row.get('order_data') or {}
+    buyer = order.get('buyer') or {}
+    items = order.get('order_items') or []
+    payments = order.get('payments') or []
+    shipping = order.get('shipping') or {}
+
+    return [
+        row.get('ml_order_id', order.get('id')),
+        row.get('date_created', order.get('date_created')),
+        order.get('date_closed'),
+        order.get('status'),
+        order.get('total_amount'),
+        order.get('currency_id'),
+        buyer.get('id'),
+        buyer.get('nickname'),
+        sum(item.get('quantity', 0) for item in items),
+        "; ".join((item.get('item') or {}).get('title', '') for item in items),
+        shipping.get('id'),
+        "; ".join(str(payment.get('id')) for payment in payments if payment.get('id'))
+    ]
+
+
+async def encode_ndjson(chunks: AsyncIterator[list[OrderRow]]) -> AsyncIterator[str]:
+    """One full order payload per line, one yielded string per DB chunk."""
+    async for rows in chunks:
+        yield "".join(json.dumps(row.get('order_data'), default=str) + "\n" for row in rows)
+
+
+async def encode_csv(chunks: AsyncIterator[list[OrderRow]]) -> AsyncIterator[str]:
+    """Header line, then one yielded block of CSV lines per DB chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(order_csv_row(row) for row in rows)
+        yield buffer.getvalue()
+
+
+def encode_export(export_format: ExportFormat, chunks: AsyncIterator[list[OrderRow]]) -> AsyncIterator[str]:
+    """Stream encoder for the requested format."""
+    if export_format is ExportFormat.CSV:
+        return encode_csv(chunks)
+    return encode_ndjson(chunks)
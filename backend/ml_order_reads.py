@@ -0,0 +1,313 @@
+"""
+MercadoLibre Order Reads - Keyset pagination for order listings
+Local read model over ml_orders plus cursor paging over the live ML API
+"""
+
+from datetime import datetime
+from itertools import islice, repeat
+from typing import Any, AsyncIterator, Callable, Iterable
+import base64
+import heapq
+import json
+
+from fastapi import HTTPException
+
+from backend.supabase_repository import SupabaseRepository
+
+type OrderRow = dict[str, Any]
+type OrderPage = dict[str, Any]
+type CursorPosition = dict[str, Any]
+type StorePositions = dict[int, str | None]
+
+# Cursor sources: which read path issued the cursor
+LOCAL_SOURCE = "local"
+LIVE_SOURCE = "ml_api"
+
+
+def encode_cursor(payload: dict[str, Any]) -> str:
+    """Encode a pagination position as an opaque URL-safe token."""
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor: str) -> CursorPosition:
+    """Decode a token produced by `encode_cursor`.
+
+    Cursors come back from clients, so every field is checked and
+    `date_created` is re-serialized from the parsed datetime before it is
+    used in a PostgREST filter or an ML query.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, dict):
+            raise ValueError("cursor is not an object")
+        source = payload.get('source', LOCAL_SOURCE)
+        if source not in (LOCAL_SOURCE, LIVE_SOURCE):
+            raise ValueError("unknown cursor source")
+        if not _is_int(payload['ml_order_id']) or not _is_int(payload['total']):
+            raise ValueError("cursor ids must be integers")
+        created = datetime.fromisoformat(str(payload['date_created']).replace('Z', '+00:00'))
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return {
+        'source': source,
+        # Same instant as the client sent, keeping ML's millisecond format when exact
+        'date_created': created.isoformat(timespec='microseconds' if created.microsecond % 1000 else 'milliseconds'),
+        'ml_order_id': payload['ml_order_id'],
+        'total': payload['total']
+    }
+
+
+def cursor_source(cursor: str) -> str:
+    """Read path (`local` or `ml_api`) that issued a cursor."""
+    return decode_cursor(cursor).get('source', LOCAL_SOURCE)
+
+
+def next_page_cursor(source: str, last_order: dict[str, Any], total: int) -> str:
+    """Cursor pointing just after `last_order` in (date_created, ml_order_id) DESC order."""
+    return encode_cursor({
+        'source': source,
+        'date_created': last_order['date_created'],
+        'ml_order_id': last_order['ml_order_id'],
+        'total': total
+    })
+
+
+def _local_orders_query(
+    db: SupabaseRepository,
+    store_id: int,
+    columns: str,
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    after: CursorPosition | None = None,
+    count: str | None = None
+) -> Any:
+    """ml_orders query for one store, newest first, optionally resuming after a keyset position."""
+    query = db.table('ml_orders').select(columns, count=count).eq('store_id', store_id)
+
+    if status:
+        query = query.eq('status', status)
+    if date_from:
+        query = query.gte('date_created', date_from.isoformat())
+    if date_to:
+        query = query.lte('date_created', date_to.isoformat())
+
+    if after:
+        # Rows strictly after the last one served, in (date_created, ml_order_id) DESC order
+        last_date = after['date_created']
+        last_id = after['ml_order_id']
+        query = query.or_(
+            f'date_created.lt."{last_date}",'
+            f'and(date_created.eq."{last_date}",ml_order_id.lt.{last_id})'
+        )
+
+    return query.order('date_created', desc=True).order('ml_order_id', desc=True)
+
+
+async def fetch_local_orders(
+    db: SupabaseRepository,
+    store_id: int,
+    limit: int,
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    cursor: str | None = None
+) -> OrderPage:
+    """Read one page of a store's orders from ml_orders, newest first.
+
+    Pages are keyset-paginated on `(date_created, ml_order_id)` so every page
+    is an index range scan no matter how deep it is. The total is counted on
+    the first page only and carried forward inside the cursor.
+
+    Args:
+        db: Supabase repository
+        store_id: ml_accounts.id
+        limit: Page size
+        status: Optional order status filter
+        date_from: Optional lower bound on date_created
+        date_to: Optional upper bound on date_created
+        cursor: Token from a previous page's `next_cursor`
+
+    Returns:
+        Rows (`order_data` payloads), total and the next page cursor (None on the last page)
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position and position.get('source', LOCAL_SOURCE) != LOCAL_SOURCE:
+        raise HTTPException(status_code=400, detail="Cursor was issued by another read path")
+
+    query = _local_orders_query(
+        db,
+        store_id,
+        "ml_order_id, date_created, order_data",
+        status=status,
+        date_from=date_from,
+        date_to=date_to,
+        after=position,
+        count=None if position else "exact"
+    )
+    response = await db.execute(query.limit(limit + 1))
+
+    rows: list[OrderRow] = response.data or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    total = position['total'] if position else (response.count or 0)
+
+    next_cursor = next_page_cursor(LOCAL_SOURCE, rows[-1], total) if has_more and rows else None
+
+    return {
+        "orders": [row['order_data'] for row in rows],
+        "total": total,
+        "next_cursor": next_cursor
+    }
+
+
+async def iter_local_orders(
+    db: SupabaseRepository,
+    store_id: int,
+    chunk_size: int,
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None
+) -> AsyncIterator[list[OrderRow]]:
+    """Yield every matching ml_orders row of a store in keyset chunks, newest first.
+
+    Only one chunk is held in memory at a time, and each chunk is an index
+    range scan however far into the table it is.
+    """
+    position: CursorPosition | None = None
+    while True:
+        query = _local_orders_query(
+            db,
+            store_id,
+            "ml_order_id, date_created, order_data",
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            after=position
+        )
+        response = await db.execute(query.limit(chunk_size))
+        rows: list[OrderRow] = response.data or []
+        if not rows:
+            return
+
+        yield rows
+
+        # A short chunk is not the end: PostgREST caps rows per response
+        # (max-rows), so keep going until a chunk comes back empty
+        position = {'date_created': rows[-1]['date_created'], 'ml_order_id': rows[-1]['ml_order_id']}
+
+
+def live_keyset_params(cursor: str) -> tuple[CursorPosition, dict[str, Any]]:
+    """/orders/search filters that resume a live listing after a cursor.
+
+    ML's offset paging slows down and shifts as new orders arrive, so deep
+    live pages are requested as "created at or before the last order served"
+    instead; `filter_live_page` then drops the orders already returned at
+    that exact timestamp.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed or from the local path
+    """
+    position = decode_cursor(cursor)
+    if position.get('source') != LIVE_SOURCE:
+        raise HTTPException(status_code=400, detail="Cursor was issued by another read path")
+    return position, {'order.date_created.to': position['date_created'], 'offset': 0}
+
+
+def _order_key(order_data: dict[str, Any]) -> tuple[datetime, int]:
+    """Sort key matching the (date_created, ml_order_id) DESC keyset."""
+    created = datetime.fromisoformat(str(order_data['date_created']).replace('Z', '+00:00'))
+    return created, int(order_data['id'])
+
+
+def filter_live_page(
+    results: list[dict[str, Any]],
+    limit: int,
+    total: int,
+    position: CursorPosition | None = None,
+    more_available: bool = False
+) -> OrderPage:
+    """Trim an /orders/search page to the keyset window and build its next cursor.
+
+    Args:
+        results: Orders returned by ML (requested with limit + 1)
+        limit: Page size
+        total: Total for the whole listing (from the first page)
+        position: Cursor position this page resumes from, if any
+        more_available: ML reported more matches than it returned
+
+    Returns:
+        Orders, total and the next page cursor (None on the last page)
+    """
+    orders = sorted(results, key=_order_key, reverse=True)
+
+    if position:
+        boundary = _order_key({'date_created': position['date_created'], 'id': position['ml_order_id']})
+        orders = [order for order in orders if _order_key(order) < boundary]
+
+    has_more = len(orders) > limit or more_available
+    orders = orders[:limit]
+
+    next_cursor = None
+    if has_more and orders:
+        last = orders[-1]
+        next_cursor = next_page_cursor(
+            LIVE_SOURCE,
+            {'date_created': last['date_created'], 'ml_order_id': last['id']},
+            total
+        )
+
+    return {"orders": orders, "total": total, "next_cursor": next_cursor}
+
+
+def encode_multi_cursor(positions: StorePositions) -> str:
+    """Cursor for a multi-store listing: each store's own cursor (None = from the start).
+
+    Stores with no more orders are simply left out.
+    """
+    return encode_cursor({'stores': {str(store_id): cursor for store_id, cursor in positions.items()}})
+
+
+def decode_multi_cursor(cursor: str) -> StorePositions:
+    """Decode a token produced by `encode_multi_cursor`.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return {int(store_id): position for store_id, position in payload['stores'].items()}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def merge_newest_first[T](
+    pages: dict[int, list[T]],
+    limit: int,
+    key: Callable[[T], Any]
+) -> list[tuple[int, T]]:
+    """K-way merge of per-store pages (each already newest first) into one page.
+
+    Only the first `limit` items are pulled from the heap, so nothing past
+    the page boundary is compared or copied.
+
+    Returns:
+        `(store_id, item)` pairs, newest first
+    """
+    streams: list[Iterable[tuple[int, T]]] = [
+        zip(repeat(store_id), items) for store_id, items in pages.items()
+    ]
+    merged = heapq.merge(*streams, key=lambda pair: key(pair[1]), reverse=True)
+    return list(islice(merged, limit))
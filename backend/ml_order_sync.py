@@ -0,0 +1,322 @@
+"""
+MercadoLibre Order Sync Engine - Bulk persistence of ML orders
+Batched upserts into ml_orders instead of per-order select/update/insert
+"""
+
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any
+import asyncio
+import os
+import httpx
+from fastapi import HTTPException
+
+from backend.supabase_repository import SupabaseRepository
+
+type OrderData = dict[str, Any]
+type OrderRecord = dict[str, Any]
+type UpsertReport = dict[str, int]
+type SyncReport = dict[str, Any]
+
+# Rows per upsert request (PostgREST handles a few hundred rows per call comfortably)
+DEFAULT_CHUNK_SIZE = int(os.getenv("ML_SYNC_CHUNK_SIZE", "200"))
+
+# ML caps /orders/search at 51 results per page
+ORDERS_PAGE_SIZE = 50
+
+# Pages fetched in parallel during a full-history sync
+DEFAULT_PAGE_CONCURRENCY = int(os.getenv("ML_SYNC_PAGE_CONCURRENCY", "4"))
+
+# Re-read a small window before the stored cursor to absorb ML clock skew and late writes
+SYNC_CURSOR_OVERLAP = timedelta(minutes=int(os.getenv("ML_SYNC_CURSOR_OVERLAP_MINUTES", "5")))
+
+
+# Stores with a sync running in this process (scheduler, manual or background backfill)
+_syncing_stores: set[int] = set()
+
+
+class SyncMode(str, Enum):
+    """Order sync strategies"""
+    RECENT = "recent"            # Latest page only
+    FULL = "full"                # Entire order history
+    INCREMENTAL = "incremental"  # Orders updated since ml_accounts.last_sync_at
+
+
+def build_order_record(
+    order_data: OrderData,
+    store_id: int,
+    user_id: int,
+    synced_at: str | None = None
+) -> OrderRecord:
+    """Map an ML order payload to an ml_orders row."""
+    return {
+        'ml_order_id': order_data['id'],
+        'store_id': store_id,
+        'user_id': user_id,
+        'status': order_data['status'],
+        'total_amount': order_data['total_amount'],
+        'currency_id': order_data['currency_id'],
+        'buyer_nickname': order_data['buyer']['nickname'],
+        'date_created': order_data['date_created'],
+        'order_data': order_data,  # Store full JSON
+        'synced_at': synced_at or datetime.now().isoformat()
+    }
+
+
+def _chunks(records: list[OrderRecord], size: int) -> list[list[OrderRecord]]:
+    """Split records into lists of at most `size` rows."""
+    return [records[i:i + size] for i in range(0, len(records), size)]
+
+
+async def upsert_orders(
+    db: SupabaseRepository,
+    records: list[OrderRecord],
+    chunk_size: int | None = None
+) -> UpsertReport:
+    """Bulk upsert order rows into ml_orders.
+    
+    Each chunk costs two round-trips: one `in` lookup to learn which
+    ml_order_ids already exist (for the inserted/updated report) and one
+    `upsert(..., on_conflict='ml_order_id')`.
+    
+    Args:
+        db: Supabase repository
+        records: Rows built with `build_order_record`
+        chunk_size: Rows per upsert request (defaults to ML_SYNC_CHUNK_SIZE)
+        
+    Returns:
+        Counts of inserted, updated and total rows plus chunks sent
+    """
+    chunk_size = max(1, chunk_size or DEFAULT_CHUNK_SIZE)
+    
+    # Postgres rejects an upsert that touches the same row twice; keep the latest payload
+    unique_records = list({record['ml_order_id']: record for record in records}.values())
+    
+    report: UpsertReport = {"inserted": 0, "updated": 0, "total": 0, "chunks": 0}
+    
+    for chunk in _chunks(unique_records, chunk_size):
+        order_ids = [record['ml_order_id'] for record in chunk]
+        
+        existing = await db.execute(
+            db.table('ml_orders').select("ml_order_id").in_('ml_order_id', order_ids)
+        )
+        existing_ids = {str(row['ml_order_id']) for row in existing.data or []}
+        
+        await db.execute(db.table('ml_orders').upsert(chunk, on_conflict='ml_order_id'))
+        
+        updated = sum(1 for order_id in order_ids if str(order_id) in existing_ids)
+        report["updated"] += updated
+        report["inserted"] += len(chunk) - updated
+        report["total"] += len(chunk)
+        report["chunks"] += 1
+    
+    return report
+
+
+async def fetch_orders_page(
+    client: httpx.AsyncClient,
+    access_token: str,
+    params: dict[str, Any],
+    offset: int,
+    limit: int = ORDERS_PAGE_SIZE
+) -> dict[str, Any]:
+    """Fetch one /orders/search page.
+    
+    Throttling, Retry-After and 429/5xx retries are handled by the ML
+    gateway transport under the shared client.
+    
+    Raises:
+        HTTPException: with ML's status code if the page still fails
+    """
+    page_params = {**params, 'offset': offset, 'limit': limit}
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Accept': 'application/json'
+    }
+    
+    response = await client.get("/orders/search", params=page_params, headers=headers)
+    if response.status_code == 200:
+        return response.json()
+    
+    raise HTTPException(
+        status_code=response.status_code,
+        detail=f"Failed to fetch orders from ML (offset {offset})"
+    )
+
+
+async def sync_order_pages(
+    client: httpx.AsyncClient,
+    db: SupabaseRepository,
+    access_token: str,
+    ml_user_id: int | str,
+    store_id: int,
+    user_id: int,
+    search_params: dict[str, Any] | None = None,
+    max_pages: int | None = None,
+    concurrency: int | None = None,
+    chunk_size: int | None = None
+) -> SyncReport:
+    """Walk /orders/search page by page and upsert every page as it arrives.
+    
+    The first page is fetched alone to learn `paging.total`; the remaining
+    offsets are then fetched concurrently under a semaphore, and each page is
+    written to ml_orders as soon as it completes (nothing is buffered across
+    pages).
+    
+    Args:
+        client: Shared ML HTTP client
+        db: Supabase repository
+        access_token: Valid ML access token for the store
+        ml_user_id: ML seller id
+        store_id: ml_accounts.id the orders belong to
+        user_id: Owner user id
+        search_params: Extra /orders/search filters
+        max_pages: Stop after this many pages (None walks the full history)
+        concurrency: Pages in flight at once (defaults to ML_SYNC_PAGE_CONCURRENCY)
+        chunk_size: Rows per bulk upsert
+        
+    Returns:
+        Aggregated upsert counts plus pages fetched and ML's reported total
+    """
+    params = {'seller': ml_user_id, 'sort': 'date_desc', **(search_params or {})}
+    semaphore = asyncio.Semaphore(max(1, concurrency or DEFAULT_PAGE_CONCURRENCY))
+    synced_at = datetime.now().isoformat()
+    
+    report: SyncReport = {"inserted": 0, "updated": 0, "total": 0, "chunks": 0, "pages": 0}
+    
+    async def store_page(page: dict[str, Any]) -> None:
+        records = [
+            build_order_record(order_data, store_id, user_id, synced_at)
+            for order_data in page.get('results', [])
+        ]
+        page_report = await upsert_orders(db, records, chunk_size=chunk_size)
+        for key, value in page_report.items():
+            report[key] += value
+        report["pages"] += 1
+    
+    first_page = await fetch_orders_page(client, access_token, params, offset=0)
+    await store_page(first_page)
+    
+    total_orders = first_page.get('paging', {}).get('total', 0)
+    report["total_orders"] = total_orders
+    
+    offsets = list(range(ORDERS_PAGE_SIZE, total_orders, ORDERS_PAGE_SIZE))
+    if max_pages is not None:
+        offsets = offsets[:max(0, max_pages - 1)]
+    
+    async def fetch_bounded(offset: int) -> dict[str, Any]:
+        async with semaphore:
+            return await fetch_orders_page(client, access_token, params, offset=offset)
+    
+    tasks = [asyncio.create_task(fetch_bounded(offset)) for offset in offsets]
+    try:
+        for next_page in asyncio.as_completed(tasks):
+            await store_page(await next_page)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Wait for the cancelled fetches so none outlives the sync or leaves an unretrieved exception
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    return report
+
+
+def parse_sync_cursor(value: str | None) -> datetime | None:
+    """Parse a stored last_sync_at value as an aware UTC datetime."""
+    if not value:
+        return None
+    try:
+        cursor = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return cursor if cursor.tzinfo else cursor.replace(tzinfo=timezone.utc)
+
+
+def format_ml_date(value: datetime) -> str:
+    """Format a datetime the way ML date filters expect (2024-01-31T12:00:00.000-00:00)."""
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000-00:00')
+
+
+def sync_in_progress(store_id: int) -> bool:
+    """True while `sync_store_orders` is running for a store in this process."""
+    return int(store_id) in _syncing_stores
+
+
+async def sync_store_orders(
+    client: httpx.AsyncClient,
+    db: SupabaseRepository,
+    store: dict[str, Any],
+    access_token: str,
+    ml_user_id: int | str,
+    mode: SyncMode = SyncMode.INCREMENTAL,
+    concurrency: int | None = None,
+    chunk_size: int | None = None
+) -> SyncReport:
+    """Sync one store's orders and advance its high-water mark.
+    
+    Incremental mode only asks ML for orders whose `date_last_updated` is
+    after the store's `last_sync_at` cursor. A store without a cursor gets a
+    full sync first, since the cursor must only ever cover orders we have.
+    Full and incremental runs store the run's start time as the new cursor
+    once every page has been written; recent mode leaves it untouched.
+    Only one sync per store runs at a time in this process, so two runs
+    never race on `last_sync_at`.
+    
+    Args:
+        client: Shared ML HTTP client
+        db: Supabase repository
+        store: ml_accounts row
+        access_token: Valid ML access token for the store
+        ml_user_id: ML seller id
+        mode: Sync strategy
+        concurrency: Pages fetched in parallel
+        chunk_size: Rows per bulk upsert
+        
+    Returns:
+        Sync report including the effective mode and cursor used
+        
+    Raises:
+        HTTPException: 409 if a sync of the same store is already running
+    """
+    store_id = int(store['id'])
+    if store_id in _syncing_stores:
+        raise HTTPException(status_code=409, detail="A sync is already running for this store")
+    _syncing_stores.add(store_id)
+    try:
+        started_at = datetime.now(timezone.utc)
+        cursor = parse_sync_cursor(store.get('last_sync_at'))
+        
+        if mode == SyncMode.INCREMENTAL and cursor is None:
+            mode = SyncMode.FULL
+        
+        search_params: dict[str, Any] = {}
+        if mode == SyncMode.INCREMENTAL:
+            search_params['order.date_last_updated.from'] = format_ml_date(cursor - SYNC_CURSOR_OVERLAP)
+        
+        report = await sync_order_pages(
+            client,
+            db,
+            access_token=access_token,
+            ml_user_id=ml_user_id,
+            store_id=store['id'],
+            user_id=store['user_id'],
+            search_params=search_params,
+            max_pages=1 if mode == SyncMode.RECENT else None,
+            concurrency=concurrency,
+            chunk_size=chunk_size
+        )
+        
+        report["mode"] = mode.value
+        report["since"] = cursor.isoformat() if mode == SyncMode.INCREMENTAL else None
+        
+        if mode != SyncMode.RECENT:
+            await db.execute(
+                db.table('ml_accounts').update({
+                    'last_sync_at': started_at.isoformat()
+                }).eq('id', store['id'])
+            )
+            report["last_sync_at"] = started_at.isoformat()
+    finally:
+        _syncing_stores.discard(store_id)
+    
+    return report
@@ -0,0 +1,77 @@
+"""
+MercadoLibre Store Tokens - Access token lifecycle for ml_accounts rows
+Shared by request handlers and background jobs
+"""
+
+from datetime import datetime
+from typing import Any
+
+from backend.ml_oauth_service import ml_oauth_service, MLTokens, RefreshTokenRevoked
+from backend.supabase_repository import SupabaseRepository
+
+type StoreRecord = dict[str, Any]
+
+# ML access tokens live 6 hours
+DEFAULT_TOKEN_TTL = 21600
+
+# ml_accounts.status for stores whose refresh token ML no longer accepts
+EXPIRED_STATUS = 'expired'
+
+
+def parse_token_expiry(store: StoreRecord) -> datetime | None:
+    """Parse `token_expires_at` as a naive local datetime (how it is written)."""
+    token_expires = store.get('token_expires_at')
+    if not token_expires:
+        return None
+    expires_dt = datetime.fromisoformat(str(token_expires).replace('Z', '+00:00'))
+    if expires_dt.tzinfo is not None:
+        expires_dt = expires_dt.astimezone().replace(tzinfo=None)
+    return expires_dt
+
+
+async def refresh_store_tokens(db: SupabaseRepository, store: StoreRecord) -> MLTokens:
+    """Refresh a store's ML tokens and persist them to ml_accounts.
+    
+    Args:
+        db: Supabase repository
+        store: ml_accounts row with app credentials and refresh token
+        
+    Returns:
+        The ml_accounts fields that were updated
+        
+    Raises:
+        RefreshTokenRevoked: if ML rejected the refresh token; the store is
+            marked 'expired' so schedulers stop retrying it until reconnected
+    """
+    app_secret = ml_oauth_service.decrypt_secret(store['app_secret_encrypted'])
+    
+    try:
+        new_tokens = await ml_oauth_service.refresh_access_token(
+            refresh_token=store['refresh_token'],
+            client_id=store['app_id'],
+            client_secret=app_secret,
+            site_id=store['site_id']
+        )
+    except RefreshTokenRevoked:
+        # Only if the row still holds the rejected token (not reconnected meanwhile)
+        await db.execute(
+            db.table('ml_accounts').update({"status": EXPIRED_STATUS}).eq(
+                'id', store['id']
+            ).eq('refresh_token', store['refresh_token'])
+        )
+        raise
+    
+    # Update tokens in database
+    update_data = {
+        "access_token": new_tokens['access_token'],
+        "refresh_token": new_tokens.get('refresh_token', store['refresh_token']),
+        "token_refreshed_at": datetime.now().isoformat(),
+        "token_expires_at": datetime.fromtimestamp(
+            datetime.now().timestamp() + new_tokens.get('expires_in', DEFAULT_TOKEN_TTL)
+        ).isoformat()
+    }
+    
+    await db.execute(db.table('ml_accounts').update(update_data).eq('id', store['id']))
+    
+    return {**update_data, "expires_in": new_tokens.get('expires_in', DEFAULT_TOKEN_TTL)}
+
@@ -0,0 +1,220 @@
+"""
+MercadoLibre Sync Scheduler - Periodic order sync for every connected store
+In-process asyncio scheduler started from the FastAPI lifespan
+"""
+
+from datetime import datetime
+from typing import Any
+import asyncio
+import os
+import random
+import time
+
+from backend.ml_api_gateway import MLPriority, ml_priority
+from backend.ml_http_client import ml_http_pool
+from backend.ml_order_sync import SyncMode, sync_in_progress, sync_store_orders
+from backend.ml_token_cache import ml_token_cache
+from backend.supabase_repository import SupabaseRepository
+
+type StoreRecord = dict[str, Any]
+type SchedulerStats = dict[str, Any]
+
+
+class StoreSyncState:
+    """Scheduling bookkeeping for one store."""
+
+    def __init__(self, store_id: int, next_run_at: float):
+        self.store_id = store_id
+        self.next_run_at = next_run_at
+        self.queued = False
+        self.consecutive_failures = 0
+        self.last_run_at: str | None = None
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+        self.last_orders_synced = 0
+
+
+class MLSyncScheduler:
+    """Periodically runs an incremental order sync for each connected ml_accounts row.
+
+    A planner loop re-reads the connected stores every `tick_seconds` and
+    enqueues the ones that are due; `concurrency` workers drain the queue.
+    Each store's next run is spread by a random jitter so stores connected at
+    the same time do not sync in lockstep, and a store that fails is pushed
+    back exponentially (capped at `max_backoff`).
+    """
+
+    def __init__(
+        self,
+        interval: float | None = None,
+        concurrency: int | None = None,
+        jitter: float | None = None,
+        max_backoff: float | None = None,
+        tick_seconds: float = 30.0
+    ):
+        """Initialize from arguments or ML_SYNC_SCHEDULER_* environment variables."""
+        self.db: SupabaseRepository | None = None
+        self.interval = interval or float(os.getenv("ML_SYNC_SCHEDULER_INTERVAL", "900"))
+        self.concurrency = concurrency or int(os.getenv("ML_SYNC_SCHEDULER_CONCURRENCY", "3"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("ML_SYNC_SCHEDULER_JITTER", "120"))
+        self.max_backoff = max_backoff or float(os.getenv("ML_SYNC_SCHEDULER_MAX_BACKOFF", "21600"))
+        self.tick_seconds = tick_seconds
+
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._stores: dict[int, StoreSyncState] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._running = 0
+        self._last_tick_at: str | None = None
+        self._last_tick_duration: float | None = None
+        self._runs = 0
+        self._failures = 0
+
+    @property
+    def is_running(self) -> bool:
+        """True while the planner and workers are active."""
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self, db: SupabaseRepository) -> None:
+        """Start the planner loop and worker tasks (FastAPI lifespan startup)."""
+        self.db = db
+        if self.is_running or not db:
+            return
+        self._tasks = [asyncio.create_task(self._plan_loop())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """Cancel the planner and workers (FastAPI lifespan shutdown)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _load_connected_stores(self) -> list[StoreRecord]:
+        """Connected stores eligible for sync."""
+        response = await self.db.execute(
+            self.db.table('ml_accounts').select("id").eq('status', 'connected')
+        )
+        return response.data or []
+
+    async def _plan_loop(self) -> None:
+        """Enqueue every connected store whose next run is due."""
+        while True:
+            started = time.monotonic()
+            try:
+                self._plan(await self._load_connected_stores())
+            except Exception as e:
+                print(f"ERROR: Sync scheduler planning failed: {e}")
+            self._last_tick_at = datetime.now().isoformat()
+            self._last_tick_duration = round(time.monotonic() - started, 3)
+            await asyncio.sleep(self.tick_seconds)
+
+    def _plan(self, stores: list[StoreRecord]) -> None:
+        """Track new stores, forget removed ones and enqueue those that are due."""
+        now = time.monotonic()
+        connected_ids = {store['id'] for store in stores}
+
+        for store_id in list(self._stores):
+            if store_id not in connected_ids and not self._stores[store_id].queued:
+                del self._stores[store_id]
+
+        for store_id in connected_ids:
+            state = self._stores.get(store_id)
+            if state is None:
+                # First sighting: spread initial runs across the jitter window
+                state = StoreSyncState(store_id, now + random.uniform(0, self.jitter))
+                self._stores[store_id] = state
+
+            if not state.queued and state.next_run_at <= now:
+                state.queued = True
+                self._queue.put_nowait(store_id)
+
+    async def _worker(self) -> None:
+        """Sync queued stores one at a time (background ML lane)."""
+        with ml_priority(MLPriority.BACKGROUND):
+            while True:
+                store_id = await self._queue.get()
+                state = self._stores.get(store_id) or StoreSyncState(store_id, 0)
+                self._running += 1
+                started = time.monotonic()
+                try:
+                    report = await self.sync_store(store_id)
+                    state.consecutive_failures = 0
+                    state.last_error = None
+                    state.last_orders_synced = report.get("total", 0)
+                    delay = self.interval + random.uniform(0, self.jitter)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._failures += 1
+                    state.consecutive_failures += 1
+                    state.last_error = str(e)[:200]
+                    delay = min(self.max_backoff, self.interval * 2 ** state.consecutive_failures)
+                    delay += random.uniform(0, self.jitter)
+                finally:
+                    self._running -= 1
+                    self._runs += 1
+                    state.queued = False
+                    state.last_run_at = datetime.now().isoformat()
+                    state.last_duration = round(time.monotonic() - started, 3)
+                    self._queue.task_done()
+
+                state.next_run_at = time.monotonic() + delay
+
+    async def sync_store(self, store_id: int) -> dict[str, Any]:
+        """Run one incremental sync for a store."""
+        response = await self.db.execute(
+            self.db.table('ml_accounts').select("*").eq('id', store_id).eq('status', 'connected')
+        )
+
+        if not response.data:
+            return {"total": 0}
+
+        store = response.data[0]
+        access_token = await ml_token_cache.token_for_store(self.db, store)
+        ml_user_id = await ml_token_cache.ml_user_id(self.db, store, access_token)
+
+        # A manual sync of this store is running; the next scheduled run picks up from it
+        if sync_in_progress(store_id):
+            return {"total": 0, "skipped": True}
+
+        report = await sync_store_orders(
+            ml_http_pool.client,
+            self.db,
+            store=store,
+            access_token=access_token,
+            ml_user_id=ml_user_id,
+            mode=SyncMode.INCREMENTAL
+        )
+
+        if "last_sync_at" in report:
+            ml_token_cache.update_store(store_id, {'last_sync_at': report["last_sync_at"]})
+
+        return report
+
+    def stats(self) -> SchedulerStats:
+        """Queue depth, last-run timings and failing stores."""
+        durations = [s.last_duration for s in self._stores.values() if s.last_duration is not None]
+        failing = {
+            store_id: {
+                "consecutive_failures": state.consecutive_failures,
+                "last_error": state.last_error
+            }
+            for store_id, state in self._stores.items()
+            if state.consecutive_failures
+        }
+
+        return {
+            "running": self.is_running,
+            "interval_seconds": self.interval,
+            "concurrency": self.concurrency,
+            "stores_tracked": len(self._stores),
+            "queue_depth": self._queue.qsize(),
+            "in_progress": self._running,
+            "runs": self._runs,
+            "failures": self._failures,
+            "last_tick_at": self._last_tick_at,
+            "last_tick_duration": self._last_tick_duration,
+            "last_run_max_duration": max(durations) if durations else None,
+            "last_run_avg_duration": round(sum(durations) / len(durations), 3) if durations else None,
+            "failing_stores": failing
+        }
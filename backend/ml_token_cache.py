@@ -0,0 +1,232 @@
+"""
+MercadoLibre Token Cache - In-process access token resolver
+Caches ml_accounts rows per store and single-flights token refreshes
+"""
+
+from typing import Any
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException
+
+from backend.ml_oauth_service import RefreshTokenRevoked, ml_oauth_service
+from backend.ml_store_tokens import parse_token_expiry, refresh_store_tokens
+from backend.supabase_repository import SupabaseRepository
+
+type StoreRecord = dict[str, Any]
+type CacheStats = dict[str, int | float | None]
+
+
+class CachedStore:
+    """A cached ml_accounts row and when it must be re-read."""
+
+    def __init__(self, store: StoreRecord, expires_at: float):
+        self.store = store
+        self.expires_at = expires_at
+
+
+class MLTokenCache:
+    """Store-id keyed cache of ml_accounts rows with single-flight refresh.
+
+    An entry lives until shortly before the row's `token_expires_at` (minus
+    `expiry_margin`), capped at `max_ttl` so status or credential changes
+    made elsewhere are picked up. When a token needs refreshing, the first
+    coroutine starts the refresh and every concurrent caller for the same
+    store awaits that same task: ML rotates the refresh token on each use,
+    so parallel refreshes would invalidate each other.
+    """
+
+    def __init__(self, max_ttl: float | None = None, expiry_margin: float = 60.0):
+        """Initialize from arguments or ML_TOKEN_CACHE_TTL."""
+        self.max_ttl = max_ttl or float(os.getenv("ML_TOKEN_CACHE_TTL", "300"))
+        self.expiry_margin = expiry_margin
+
+        self._entries: dict[int, CachedStore] = {}
+        self._refreshing: dict[int, asyncio.Task] = {}
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._coalesced_refreshes = 0
+
+    def _seconds_until_expiry(self, store: StoreRecord) -> float | None:
+        """Seconds until the token must be refreshed (None if unknown)."""
+        expires_dt = parse_token_expiry(store)
+        if expires_dt is None:
+            return None
+        return expires_dt.timestamp() - time.time() - self.expiry_margin
+
+    def _put(self, store: StoreRecord) -> None:
+        """Cache a store row until its token nears expiry or max_ttl passes."""
+        ttl = self.max_ttl
+        remaining = self._seconds_until_expiry(store)
+        if remaining is not None:
+            ttl = min(ttl, max(0.0, remaining))
+        self._entries[int(store['id'])] = CachedStore(store, time.monotonic() + ttl)
+
+    def _get(self, store_id: int) -> StoreRecord | None:
+        """Cached row if still fresh."""
+        entry = self._entries.get(int(store_id))
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        return entry.store
+
+    def invalidate(self, store_id: int) -> None:
+        """Forget a store (after disconnect, delete or new OAuth tokens)."""
+        self._entries.pop(int(store_id), None)
+
+    def update_store(self, store_id: int, fields: dict[str, Any]) -> None:
+        """Apply fields just written to ml_accounts to the cached row."""
+        entry = self._entries.get(int(store_id))
+        if entry is not None:
+            entry.store = {**entry.store, **fields}
+
+    def expires_in(self, store_id: int) -> int | None:
+        """Seconds until the cached token for a store expires."""
+        entry = self._entries.get(int(store_id))
+        if entry is None:
+            return None
+        remaining = self._seconds_until_expiry(entry.store)
+        return None if remaining is None else int(remaining + self.expiry_margin)
+
+    def _needs_refresh(self, store: StoreRecord) -> bool:
+        """True if the token is expired or about to expire."""
+        remaining = self._seconds_until_expiry(store)
+        return remaining is not None and remaining <= 0
+
+    async def get_store(self, db: SupabaseRepository, store_id: int) -> StoreRecord:
+        """ml_accounts row for a store, from cache when possible (no ownership check).
+
+        Raises:
+            HTTPException: 503 if database unavailable, 404 if not found
+        """
+        store = self._get(store_id)
+        if store is not None:
+            self._hits += 1
+            return store
+
+        self._misses += 1
+        if not db:
+            raise HTTPException(status_code=503, detail="Database not available")
+
+        response = await db.execute(db.table('ml_accounts').select("*").eq('id', store_id))
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Store not found")
+
+        store = response.data[0]
+        self._put(store)
+        return store
+
+    async def get_access_token(
+        self,
+        db: SupabaseRepository,
+        store_id: int,
+        user_id: int | None = None
+    ) -> tuple[str, StoreRecord]:
+        """Valid access token and store row, from cache when possible.
+
+        Args:
+            db: Supabase repository (used on cache miss and refresh)
+            store_id: ml_accounts.id
+            user_id: Owner to enforce; None skips the ownership check (background jobs)
+
+        Raises:
+            HTTPException: 503 if database unavailable, 404 if not found or not owned,
+                400 if the store is not connected
+        """
+        store = await self.get_store(db, store_id)
+
+        if user_id is not None and str(store.get('user_id')) != str(user_id):
+            raise HTTPException(status_code=404, detail="Store not found")
+
+        if store.get('status') != 'connected':
+            raise HTTPException(status_code=400, detail="Store not connected")
+
+        return await self.token_for_store(db, store), self._get(store_id) or store
+
+    async def token_for_store(self, db: SupabaseRepository, store: StoreRecord) -> str:
+        """Access token for an already-loaded row, refreshing it (single-flight) if expired."""
+        if self._needs_refresh(store):
+            return await self.refresh(db, store)
+        return store['access_token']
+
+    async def ml_user_id(self, db: SupabaseRepository, store: StoreRecord, access_token: str) -> int | str:
+        """ML seller id for a store, looked up once from ML and saved to ml_accounts."""
+        if store.get('ml_user_id'):
+            return store['ml_user_id']
+
+        user_info = await ml_oauth_service.get_user_info(access_token)
+        ml_fields = {
+            'ml_user_id': user_info['id'],
+            'ml_nickname': user_info.get('nickname')
+        }
+        await db.execute(db.table('ml_accounts').update(ml_fields).eq('id', store['id']))
+        self.update_store(store['id'], ml_fields)
+        return user_info['id']
+
+    async def refresh(
+        self,
+        db: SupabaseRepository,
+        store: StoreRecord,
+        stale_token: str | None = None
+    ) -> str:
+        """Refresh a store's token, sharing one in-flight refresh per store.
+
+        Args:
+            db: Supabase repository
+            store: ml_accounts row
+            stale_token: Token ML just rejected; if the cache already holds a
+                different, unexpired token, it is returned without refreshing
+
+        Returns:
+            A fresh access token
+        """
+        store_id = int(store['id'])
+
+        if stale_token is not None:
+            cached = self._get(store_id)
+            if cached and cached.get('access_token') != stale_token and not self._needs_refresh(cached):
+                self._coalesced_refreshes += 1
+                return cached['access_token']
+
+        task = self._refreshing.get(store_id)
+        if task is not None:
+            self._coalesced_refreshes += 1
+        else:
+            self._refreshes += 1
+            task = asyncio.create_task(self._do_refresh(db, store))
+            self._refreshing[store_id] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(store_id, None))
+
+        # Shield so a cancelled caller does not abort the refresh other callers await
+        return await asyncio.shield(task)
+
+    async def _do_refresh(self, db: SupabaseRepository, store: StoreRecord) -> str:
+        """Refresh, persist and cache new tokens for a store."""
+        # Prefer the newest cached refresh token in case the caller's row is stale
+        current = self._get(store['id']) or store
+        try:
+            new_tokens = await refresh_store_tokens(db, current)
+        except RefreshTokenRevoked:
+            # Row is now 'expired'; reload it so requests see "Store not connected"
+            self.invalidate(int(store['id']))
+            raise
+        self._put({**current, **{k: v for k, v in new_tokens.items() if k != 'expires_in'}})
+        return new_tokens['access_token']
+
+    def stats(self) -> CacheStats:
+        """Hit rate and refresh counters."""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+            "refreshes": self._refreshes,
+            "coalesced_refreshes": self._coalesced_refreshes,
+            "refreshes_in_flight": len(self._refreshing)
+        }
+
+
+# Singleton instance
+ml_token_cache = MLTokenCache()
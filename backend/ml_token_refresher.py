@@ -0,0 +1,142 @@
+"""
+MercadoLibre Token Refresher - Refresh access tokens before they expire
+Background task started from the FastAPI lifespan
+"""
+
+from datetime import datetime, timedelta
+from typing import Any
+import asyncio
+import os
+import time
+
+from backend.ml_api_gateway import MLPriority, ml_priority
+from backend.ml_oauth_service import RefreshTokenRevoked
+from backend.ml_token_cache import ml_token_cache
+from backend.supabase_repository import SupabaseRepository
+
+type StoreRecord = dict[str, Any]
+type RefresherStats = dict[str, Any]
+
+
+class MLTokenRefresher:
+    """Periodically refreshes tokens that expire within `window` seconds.
+
+    Every `interval` seconds the connected ml_accounts rows whose
+    `token_expires_at` falls inside the window are refreshed through the
+    token cache (so a refresh already started by a request is shared, not
+    repeated), at most `concurrency` at a time. Requests then find a valid
+    token instead of paying for the refresh or a 401 retry. Stores whose
+    refresh token ML rejects (invalid_grant) are marked 'expired' and drop
+    out of later scans until the user reconnects them.
+    """
+
+    def __init__(
+        self,
+        window: float | None = None,
+        interval: float | None = None,
+        concurrency: int | None = None
+    ):
+        """Initialize from arguments or ML_TOKEN_REFRESH_* environment variables."""
+        self.db: SupabaseRepository | None = None
+        self.window = window or float(os.getenv("ML_TOKEN_REFRESH_WINDOW", "900"))
+        self.interval = interval or float(os.getenv("ML_TOKEN_REFRESH_INTERVAL", "300"))
+        self.concurrency = concurrency or int(os.getenv("ML_TOKEN_REFRESH_CONCURRENCY", "5"))
+
+        self._task: asyncio.Task | None = None
+        self._last_scan_at: str | None = None
+        self._last_scan_duration: float | None = None
+        self._last_batch_size = 0
+        self._refreshed = 0
+        self._failed = 0
+        self._revoked = 0
+        self._last_error: str | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """True while the refresh loop is active."""
+        return self._task is not None and not self._task.done()
+
+    async def start(self, db: SupabaseRepository) -> None:
+        """Start the refresh loop (FastAPI lifespan startup)."""
+        self.db = db
+        if self.is_running or not db:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the refresh loop (FastAPI lifespan shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """Scan and refresh on a fixed interval (background ML lane)."""
+        with ml_priority(MLPriority.BACKGROUND):
+            while True:
+                try:
+                    await self.refresh_expiring()
+                except Exception as e:
+                    self._last_error = str(e)[:200]
+                    print(f"ERROR: Token refresh scan failed: {e}")
+                await asyncio.sleep(self.interval)
+
+    async def _load_expiring_stores(self) -> list[StoreRecord]:
+        """Connected stores whose token expires within the window."""
+        # token_expires_at is written as naive local time, so compare the same way
+        cutoff = (datetime.now() + timedelta(seconds=self.window)).isoformat()
+        response = await self.db.execute(
+            self.db.table('ml_accounts').select("*").eq(
+                'status', 'connected'
+            ).lt('token_expires_at', cutoff)
+        )
+        return [store for store in response.data or [] if store.get('refresh_token')]
+
+    async def refresh_expiring(self) -> int:
+        """Refresh every token expiring within the window.
+
+        Returns:
+            Number of stores refreshed successfully
+        """
+        started = time.monotonic()
+        stores = await self._load_expiring_stores()
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def refresh_one(store: StoreRecord) -> bool:
+            async with semaphore:
+                try:
+                    await ml_token_cache.refresh(self.db, store)
+                    return True
+                except RefreshTokenRevoked:
+                    self._revoked += 1
+                    print(f"WARNING: ML refresh token revoked for store {store.get('id')}; marked expired")
+                    return False
+                except Exception as e:
+                    self._last_error = f"store {store.get('id')}: {str(e)[:200]}"
+                    return False
+
+        results = await asyncio.gather(*(refresh_one(store) for store in stores))
+        refreshed = sum(results)
+
+        self._refreshed += refreshed
+        self._failed += len(results) - refreshed
+        self._last_batch_size = len(stores)
+        self._last_scan_at = datetime.now().isoformat()
+        self._last_scan_duration = round(time.monotonic() - started, 3)
+        return refreshed
+
+    def stats(self) -> RefresherStats:
+        """Scan timings and refresh counters."""
+        return {
+            "running": self.is_running,
+            "window_seconds": self.window,
+            "interval_seconds": self.interval,
+            "concurrency": self.concurrency,
+            "last_scan_at": self._last_scan_at,
+            "last_scan_duration": self._last_scan_duration,
+            "last_batch_size": self._last_batch_size,
+            "refreshed": self._refreshed,
+            "failed": self._failed,
+            "revoked": self._revoked,
+            "last_error": self._last_error
+        }
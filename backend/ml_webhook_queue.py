@@ -0,0 +1,200 @@
+"""
+MercadoLibre Webhook Queue - Deduplicated async processing of ML notifications
+The webhook endpoint only enqueues; worker tasks fetch and persist resources
+"""
+
+from datetime import datetime
+from typing import Any
+import asyncio
+import os
+import re
+import time
+
+from backend.ml_api_gateway import MLPriority, ml_priority
+from backend.ml_http_client import ml_http_pool
+from backend.ml_order_cache import ml_order_cache
+from backend.ml_order_sync import build_order_record, upsert_orders
+from backend.ml_token_cache import ml_token_cache
+from backend.supabase_repository import SupabaseRepository
+
+type NotificationKey = tuple[str, str, str]
+type QueueStats = dict[str, Any]
+
+# Topics whose resource is an order (/orders/{id})
+ORDER_TOPICS = {"orders", "orders_v2"}
+
+# The only resource shape we fetch; the webhook body is unauthenticated, so never
+# pass it to the client as-is (an absolute URL would receive the store's token)
+ORDER_RESOURCE = re.compile(r"^/orders/(\d+)$")
+
+
+class MLWebhookQueue:
+    """Bounded in-process queue for ML notifications with resource coalescing.
+
+    A notification is keyed by `(topic, resource, user_id)`. While a key is
+    pending, further notifications for it are dropped: ML often fires several
+    notifications for the same order in a burst, and one fetch of the
+    resource returns its latest state anyway. Workers hold each key for
+    `coalesce_window` seconds after it was first enqueued before fetching, so
+    the whole burst collapses into one API call. The key is released right
+    before the fetch, so a notification that arrives mid-fetch is queued again.
+    """
+
+    def __init__(
+        self,
+        maxsize: int | None = None,
+        workers: int | None = None,
+        coalesce_window: float | None = None
+    ):
+        """Initialize from arguments or ML_WEBHOOK_* environment variables."""
+        self.maxsize = maxsize or int(os.getenv("ML_WEBHOOK_QUEUE_SIZE", "1000"))
+        self.workers = workers or int(os.getenv("ML_WEBHOOK_WORKERS", "2"))
+        self.coalesce_window = (
+            coalesce_window if coalesce_window is not None
+            else float(os.getenv("ML_WEBHOOK_COALESCE_WINDOW", "5"))
+        )
+
+        self.db: SupabaseRepository | None = None
+        self._queue: asyncio.Queue[NotificationKey] = asyncio.Queue(maxsize=self.maxsize)
+        self._pending: dict[NotificationKey, float] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._counters = {
+            "received": 0,
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "processed": 0,
+            "skipped": 0,
+            "failed": 0
+        }
+        self._last_error: str | None = None
+        self._last_processed_at: str | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """True while worker tasks are active."""
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self, db: SupabaseRepository) -> None:
+        """Start worker tasks (FastAPI lifespan startup)."""
+        self.db = db
+        if self.is_running or not db:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel worker tasks (FastAPI lifespan shutdown)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, topic: str | None, resource: str | None, user_id: Any) -> bool:
+        """Queue a notification unless the same resource is already pending.
+
+        Returns:
+            True if the notification was queued, False if coalesced or dropped
+        """
+        self._counters["received"] += 1
+        if not topic or not resource or user_id is None:
+            self._counters["skipped"] += 1
+            return False
+
+        key: NotificationKey = (str(topic), str(resource), str(user_id))
+        if key in self._pending:
+            self._counters["coalesced"] += 1
+            return False
+
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            return False
+
+        self._pending[key] = time.monotonic()
+        self._counters["enqueued"] += 1
+        return True
+
+    async def _worker(self) -> None:
+        """Process queued notifications one at a time (background ML lane)."""
+        with ml_priority(MLPriority.BACKGROUND):
+            while True:
+                key = await self._queue.get()
+                try:
+                    # Let duplicates of this burst coalesce before fetching
+                    wait = self._pending.get(key, 0) + self.coalesce_window - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._pending.pop(key, None)
+
+                    if await self.process(*key):
+                        self._counters["processed"] += 1
+                        self._last_processed_at = datetime.now().isoformat()
+                    else:
+                        self._counters["skipped"] += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._counters["failed"] += 1
+                    self._last_error = str(e)[:200]
+                    print(f"Webhook processing error for {key}: {e}")
+                finally:
+                    self._queue.task_done()
+
+    async def process(self, topic: str, resource: str, ml_user_id: str) -> bool:
+        """Fetch the notified resource and upsert it into ml_orders.
+
+        Returns:
+            True if an order was stored, False if the notification was ignored
+        """
+        if topic not in ORDER_TOPICS:
+            return False
+
+        match = ORDER_RESOURCE.match(resource)
+        if match is None:
+            return False
+        order_path = f"/orders/{match.group(1)}"
+
+        store_response = await self.db.execute(
+            self.db.table('ml_accounts').select("*").eq(
+                'ml_user_id', ml_user_id
+            ).eq('status', 'connected')
+        )
+
+        if not store_response.data:
+            return False
+
+        store = store_response.data[0]
+        access_token = await ml_token_cache.token_for_store(self.db, store)
+
+        client = ml_http_pool.client
+        response = await client.get(order_path, headers={'Authorization': f'Bearer {access_token}'})
+
+        if response.status_code == 401:
+            access_token = await ml_token_cache.refresh(self.db, store, stale_token=access_token)
+            response = await client.get(order_path, headers={'Authorization': f'Bearer {access_token}'})
+
+        response.raise_for_status()
+
+        order_data = response.json()
+        record = build_order_record(order_data, store['id'], store['user_id'])
+        await upsert_orders(self.db, [record])
+        ml_order_cache.put(store['id'], order_data)
+        return True
+
+    def stats(self) -> QueueStats:
+        """Queue depth and notification counters."""
+        return {
+            "running": self.is_running,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self.maxsize,
+            "coalesce_window_seconds": self.coalesce_window,
+            **self._counters,
+            "last_processed_at": self._last_processed_at,
+            "last_error": self._last_error
+        }
+
+
+# Singleton instance
+ml_webhook_queue = MLWebhookQueue()
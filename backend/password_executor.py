@@ -0,0 +1,118 @@
+"""
+Password Hash Executor - Bounded thread pool for bcrypt work
+Keeps login bursts off FastAPI's shared threadpool and sheds load when full
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+type ExecutorStats = dict[str, int | float | None]
+
+
+class PasswordHashExecutor:
+    """Runs password hashing/verification on a small dedicated pool.
+
+    bcrypt spends ~100ms of CPU per check on purpose. Run from a sync
+    handler, every login occupies one of FastAPI's shared threadpool slots,
+    so a login storm starves all other sync endpoints. Here at most
+    `workers` checks run at once and at most `max_queue` more wait; beyond
+    that a request is rejected immediately with 503 + Retry-After instead of
+    piling up latency for everyone.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_queue: int | None = None,
+        retry_after: int | None = None
+    ):
+        """Initialize from arguments or AUTH_HASH_* environment variables."""
+        self.workers = workers or int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("AUTH_HASH_MAX_QUEUE", "32"))
+        self.retry_after = retry_after or int(os.getenv("AUTH_HASH_RETRY_AFTER", "1"))
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        # Counters are updated from pool threads as well as the event loop
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs submitted but not yet started."""
+        return max(0, self._pending - self._running)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a hashing callable on the pool.
+
+        Raises:
+            HTTPException: 503 with Retry-After when the pool and its queue are full
+        """
+        submitted = time.perf_counter()
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Authentication service busy, please retry",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+            self._pending += 1
+            self._max_queue_depth = max(self._max_queue_depth, self.queue_depth)
+
+        def timed() -> Any:
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._total_wait += started - submitted
+                    self._total_run += time.perf_counter() - started
+
+        def release(_: Future) -> None:
+            # Runs when the job really ends (or is cancelled before it started),
+            # not when the awaiting request goes away, so admission stays exact
+            with self._lock:
+                self._pending -= 1
+
+        future = self._executor.submit(timed)
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        """Stop accepting work and let running checks finish (FastAPI lifespan shutdown)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> ExecutorStats:
+        """Queue depth, rejections and average wait/run times."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._running,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / self._completed * 1000, 2) if self._completed else None,
+                "avg_run_ms": round(self._total_run / self._completed * 1000, 2) if self._completed else None
+            }
+
+
+# Singleton instance
+password_executor = PasswordHashExecutor()
@@ -0,0 +1,104 @@
+"""
+Password Hashing - Format-aware verification and bcrypt upgrades
+Detects bcrypt vs legacy SHA-256 hashes and flags hashes that need rehashing
+"""
+
+from enum import Enum
+import hashlib
+import hmac
+import os
+import re
+
+import bcrypt
+
+type HashReport = dict[str, int | dict[str, int]]
+
+# bcrypt cost factor for new and upgraded hashes (each +1 doubles login CPU time)
+BCRYPT_ROUNDS = int(os.getenv("AUTH_BCRYPT_ROUNDS", "12"))
+
+_BCRYPT_RE = re.compile(r"^\$2[aby]\$(\d{2})\$[./A-Za-z0-9]{53}$")
+_SHA256_RE = re.compile(r"^[0-9a-fA-F]{64}$")
+
+
+class HashFormat(str, Enum):
+    """Storage format of a users.password_hash value."""
+    BCRYPT = "bcrypt"
+    SHA256 = "sha256"
+    UNKNOWN = "unknown"
+
+
+def detect_hash_format(hashed: str | None) -> HashFormat:
+    """Classify a stored hash without attempting verification."""
+    if hashed and _BCRYPT_RE.match(hashed):
+        return HashFormat.BCRYPT
+    if hashed and _SHA256_RE.match(hashed):
+        return HashFormat.SHA256
+    return HashFormat.UNKNOWN
+
+
+def bcrypt_cost(hashed: str) -> int | None:
+    """Cost factor encoded in a bcrypt hash (None for other formats)."""
+    match = _BCRYPT_RE.match(hashed or "")
+    return int(match.group(1)) if match else None
+
+
+def legacy_sha256_hash(password: str) -> str:
+    """Unsalted SHA-256 hex digest used by accounts created before bcrypt."""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def hash_password(password: str, rounds: int | None = None) -> str:
+    """bcrypt hash at the configured cost factor."""
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Verify a password with the verifier matching the stored hash format.
+
+    Args:
+        password: Plain text password
+        hashed: Stored bcrypt or legacy SHA-256 hash
+
+    Returns:
+        True if password matches hash
+    """
+    hash_format = detect_hash_format(hashed)
+
+    if hash_format is HashFormat.BCRYPT:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    if hash_format is HashFormat.SHA256:
+        return hmac.compare_digest(legacy_sha256_hash(password), hashed.lower())
+    return False
+
+
+def needs_rehash(hashed: str, rounds: int | None = None) -> bool:
+    """True for legacy hashes and bcrypt hashes at a different cost factor."""
+    return bcrypt_cost(hashed) != (rounds or BCRYPT_ROUNDS)
+
+
+def summarize_hashes(hashes: list[str | None], rounds: int | None = None) -> HashReport:
+    """Count stored hashes by format and bcrypt cost.
+
+    Returns:
+        Totals per format, per bcrypt cost and how many still need rehashing
+    """
+    by_format = {hash_format.value: 0 for hash_format in HashFormat}
+    by_cost: dict[str, int] = {}
+    pending = 0
+
+    for hashed in hashes:
+        hash_format = detect_hash_format(hashed)
+        by_format[hash_format.value] += 1
+        if hash_format is HashFormat.BCRYPT:
+            cost = str(bcrypt_cost(hashed))
+            by_cost[cost] = by_cost.get(cost, 0) + 1
+        if hashed and needs_rehash(hashed, rounds):
+            pending += 1
+
+    return {
+        "total": len(hashes),
+        "by_format": by_format,
+        "bcrypt_cost": by_cost,
+        "needs_rehash": pending
+    }
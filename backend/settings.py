@@ -0,0 +1,146 @@
+"""
+Application Settings - Environment configuration and shared clients
+One lazily created Supabase client per process, handed out as FastAPI dependencies
+"""
+
+from functools import lru_cache
+from typing import Any
+import os
+import threading
+import time
+
+from supabase import create_client, Client
+
+from backend.supabase_repository import SupabaseRepository
+
+type HealthReport = dict[str, Any]
+
+
+def clean_supabase_url(url: str) -> str:
+    """Strip whitespace/newlines pasted into SUPABASE_URL and force https://."""
+    url = url.replace('\n', '').replace(' ', '').strip()
+    if not url.startswith('https://'):
+        url = 'https://' + url.replace('https://', '')
+    return url
+
+
+class Settings:
+    """Environment configuration read once per process."""
+
+    def __init__(self):
+        raw_url = os.getenv("SUPABASE_URL")
+        raw_key = os.getenv("SUPABASE_KEY")
+
+        self.supabase_url: str | None = clean_supabase_url(raw_url) if raw_url else None
+        self.supabase_key: str | None = (
+            raw_key.replace('\n', '').replace(' ', '').strip() if raw_key else None
+        )
+        self.jwt_secret = os.getenv("JWT_SECRET_KEY", "dropux_jwt_super_secret_key_2024_v2_production")
+        self.jwt_algorithm = os.getenv("JWT_ALGORITHM", "HS256")
+        self.app_env = os.getenv("APP_ENV", "development")
+        self.health_probe_table = os.getenv("SUPABASE_HEALTH_TABLE", "ml_accounts")
+
+    @property
+    def supabase_configured(self) -> bool:
+        """True when both Supabase credentials are set."""
+        return bool(self.supabase_url and self.supabase_key)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Process-wide settings (FastAPI dependency)."""
+    return Settings()
+
+
+class SupabaseClients:
+    """Lazily creates and holds the process-wide Supabase client and repository.
+
+    The client is built on first use instead of at import time, so workers
+    that never touch the database skip the connection setup, and every
+    router reuses the same client (and its keep-alive HTTP session).
+    `use_client` swaps in another client, e.g. a local stand-in for
+    benchmarks.
+    """
+
+    def __init__(self):
+        self._client: Client | None = None
+        self._repository: SupabaseRepository | None = None
+        self._initialized = False
+        self._error: str | None = None
+        self._lock = threading.Lock()
+
+    def client(self) -> Client | None:
+        """The shared client (None if not configured or the connection failed)."""
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._client = self._create_client()
+                    self._initialized = True
+        return self._client
+
+    def _create_client(self) -> Client | None:
+        """Build the client from settings."""
+        settings = get_settings()
+        if not settings.supabase_configured:
+            print("WARNING: Supabase credentials not found")
+            return None
+
+        try:
+            client = create_client(settings.supabase_url, settings.supabase_key)
+            print(f"SUCCESS: Supabase connected successfully to {settings.supabase_url}")
+            return client
+        except Exception as e:
+            self._error = str(e)[:200]
+            print(f"ERROR: Supabase connection error: {e}")
+            return None
+
+    def repository(self) -> SupabaseRepository:
+        """Async repository over the shared client."""
+        if self._repository is None:
+            self._repository = SupabaseRepository(self.client())
+        return self._repository
+
+    def use_client(self, client: Any) -> None:
+        """Replace the shared client (local stand-ins, benchmarks)."""
+        with self._lock:
+            self._client = client
+            self._repository = None
+            self._initialized = True
+            self._error = None
+
+    async def health(self) -> HealthReport:
+        """Probe the database with a one-row select and time it."""
+        repository = self.repository()
+        if not repository:
+            return {"status": "unavailable", "error": self._error or "Supabase not configured"}
+
+        started = time.perf_counter()
+        try:
+            await repository.execute(
+                repository.table(get_settings().health_probe_table).select("id").limit(1)
+            )
+        except Exception as e:
+            return {
+                "status": "error",
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "error": str(e)[:200]
+            }
+
+        return {
+            "status": "ok",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+
+# Singleton instance
+supabase_clients = SupabaseClients()
+
+
+def get_supabase() -> Client | None:
+    """Shared Supabase client (FastAPI dependency for sync handlers)."""
+    return supabase_clients.client()
+
+
+def get_db() -> SupabaseRepository:
+    """Shared async repository (FastAPI dependency for async handlers)."""
+    return supabase_clients.repository()
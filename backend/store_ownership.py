@@ -0,0 +1,101 @@
+"""
+Store Ownership Cache - In-process user -> store ids map
+Lets store endpoints check ownership without querying ml_accounts
+"""
+
+import os
+import time
+
+from fastapi import HTTPException
+
+from backend.supabase_repository import SupabaseRepository
+
+type OwnershipStats = dict[str, int | float | None]
+
+
+class OwnedStores:
+    """Store ids owned by one user and when they must be re-read."""
+
+    def __init__(self, store_ids: set[int], expires_at: float):
+        self.store_ids = store_ids
+        self.expires_at = expires_at
+
+
+class StoreOwnershipCache:
+    """Caches the ml_accounts ids each user owns.
+
+    Store endpoints only need to know "does this user own store N" before
+    acting; the answer changes only when a store is connected or deleted,
+    and those endpoints update the cache directly. `ttl` bounds how long a
+    change made outside this process (another worker, the dashboard) can go
+    unnoticed.
+    """
+
+    def __init__(self, ttl: float | None = None):
+        """Initialize from arguments or ML_OWNERSHIP_CACHE_TTL."""
+        self.ttl = ttl or float(os.getenv("ML_OWNERSHIP_CACHE_TTL", "300"))
+
+        self._users: dict[str, OwnedStores] = {}
+        self._hits = 0
+        self._misses = 0
+
+    async def store_ids(self, db: SupabaseRepository, user_id: int | str) -> set[int]:
+        """Ids of every ml_accounts row owned by a user.
+
+        Raises:
+            HTTPException: 503 if the database is unavailable on a cache miss
+        """
+        key = str(user_id)
+        entry = self._users.get(key)
+
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._hits += 1
+            return entry.store_ids
+
+        self._misses += 1
+        if not db:
+            raise HTTPException(status_code=503, detail="Database not available")
+
+        response = await db.execute(db.table('ml_accounts').select("id").eq('user_id', user_id))
+        store_ids = {int(row['id']) for row in response.data or []}
+        self._users[key] = OwnedStores(store_ids, time.monotonic() + self.ttl)
+        return store_ids
+
+    async def require_owner(self, db: SupabaseRepository, user_id: int | str, store_id: int) -> None:
+        """Check that a user owns a store.
+
+        Raises:
+            HTTPException: 404 if the store does not exist or belongs to someone else
+        """
+        if int(store_id) not in await self.store_ids(db, user_id):
+            raise HTTPException(status_code=404, detail="Store not found")
+
+    def add_store(self, user_id: int | str, store_id: int) -> None:
+        """Record a newly connected store (no-op if the user is not cached)."""
+        entry = self._users.get(str(user_id))
+        if entry is not None:
+            entry.store_ids.add(int(store_id))
+
+    def remove_store(self, user_id: int | str, store_id: int) -> None:
+        """Forget a deleted store."""
+        entry = self._users.get(str(user_id))
+        if entry is not None:
+            entry.store_ids.discard(int(store_id))
+
+    def invalidate(self, user_id: int | str) -> None:
+        """Re-read a user's stores on next access."""
+        self._users.pop(str(user_id), None)
+
+    def stats(self) -> OwnershipStats:
+        """Hit rate counters."""
+        lookups = self._hits + self._misses
+        return {
+            "users": len(self._users),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else None
+        }
+
+
+# Singleton instance
+store_ownership = StoreOwnershipCache()
@@ -0,0 +1,75 @@
+"""
+Supabase Repository - Non-blocking data access for async handlers
+Runs the synchronous supabase/PostgREST client on a bounded thread pool
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import os
+
+type RepositoryStats = dict[str, int | bool]
+
+# One pool for every router and background job so total DB concurrency stays bounded
+DB_MAX_WORKERS = int(os.getenv("SUPABASE_MAX_WORKERS", "16"))
+_db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="supabase")
+
+
+class SupabaseRepository:
+    """Async facade over a synchronous supabase client.
+
+    The app keeps the synchronous client from `create_client` (shared with
+    the sync handlers in main.py) rather than moving every caller to
+    supabase's async client, and calling its `.execute()` from an
+    `async def` handler stalls the whole event loop for the round-trip.
+    Queries are still built with the usual fluent API through `table()`,
+    but executed with `await repo.execute(query)`, which runs the blocking
+    call on a shared, bounded thread pool.
+
+    Example:
+        response = await repo.execute(
+            repo.table('ml_accounts').select("*").eq('id', store_id)
+        )
+    """
+
+    def __init__(self, client: Any, executor: ThreadPoolExecutor | None = None):
+        """Wrap a supabase client (None when the database is not configured)."""
+        self.client = client
+        self._executor = executor or _db_executor
+        self._in_flight = 0
+        self._executed = 0
+
+    def __bool__(self) -> bool:
+        """False when no database client is configured, so `if not repo:` keeps working."""
+        return self.client is not None
+
+    def table(self, name: str) -> Any:
+        """Start a query on a table (not executed until passed to `execute`)."""
+        return self.client.table(name)
+
+    def rpc(self, fn: str, params: dict[str, Any] | None = None) -> Any:
+        """Start a stored procedure call (not executed until passed to `execute`)."""
+        return self.client.rpc(fn, params or {})
+
+    async def execute(self, query: Any) -> Any:
+        """Execute a query builder off the event loop and return its response."""
+        return await self.run(query.execute)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run any blocking callable on the database thread pool."""
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+            self._executed += 1
+
+    def stats(self) -> RepositoryStats:
+        """Pool size and query counters."""
+        return {
+            "connected": self.client is not None,
+            "max_workers": DB_MAX_WORKERS,
+            "in_flight": self._in_flight,
+            "executed": self._executed
+        }
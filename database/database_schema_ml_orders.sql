@@ -0,0 +1,43 @@
+-- MercadoLibre Orders Table (local copy synced from ML /orders/search)
+-- Written by POST /api/ml/stores/{store_id}/sync-orders
+
+CREATE TABLE IF NOT EXISTS public.ml_orders (
+    -- Primary key
+    id SERIAL PRIMARY KEY,
+    
+    -- MercadoLibre order id (upsert conflict target)
+    ml_order_id BIGINT NOT NULL,
+    
+    -- Ownership
+    store_id INTEGER NOT NULL, -- ml_accounts.id
+    user_id INTEGER NOT NULL,
+    
+    -- Order summary
+    status VARCHAR(50),
+    total_amount NUMERIC(14, 2),
+    currency_id VARCHAR(10),
+    buyer_nickname VARCHAR(255),
+    date_created TIMESTAMPTZ,
+    
+    -- Full ML order payload
+    order_data JSONB,
+    
+    -- Sync tracking
+    synced_at TIMESTAMP DEFAULT NOW(),
+    
+    -- Constraints
+    CONSTRAINT unique_ml_order_id UNIQUE(ml_order_id)
+);
+
+-- Indexes for performance
+CREATE INDEX IF NOT EXISTS idx_ml_orders_store_id ON public.ml_orders(store_id);
+CREATE INDEX IF NOT EXISTS idx_ml_orders_user_id ON public.ml_orders(user_id);
+
+COMMENT ON TABLE public.ml_orders IS 'Local copy of MercadoLibre orders, bulk upserted on ml_order_id';
+
+-- Local read model: keyset pagination on (date_created, ml_order_id) per store,
+-- optionally filtered by status
+CREATE INDEX IF NOT EXISTS idx_ml_orders_store_date
+    ON public.ml_orders(store_id, date_created DESC, ml_order_id DESC);
+CREATE INDEX IF NOT EXISTS idx_ml_orders_store_status_date
+    ON public.ml_orders(store_id, status, date_created DESC, ml_order_id DESC);
@@ -131,4 +131,7 @@ SELECT EXISTS(
     SELECT 1 FROM ml_stores 
     WHERE user_id = 1 AND site_id = 'MLC' AND status = 'connected'
 );
-*/
\ No newline at end of file
+*/
+-- Incremental order sync cursor (high-water mark written by /sync-orders).
+-- The application reads and writes it on ml_accounts.
+ALTER TABLE public.ml_accounts ADD COLUMN IF NOT EXISTS last_sync_at TIMESTAMPTZ;
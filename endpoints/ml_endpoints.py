@@ -12,56 +12,21 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from backend.ml_oauth_service import ml_oauth_service, MLTokens
+from backend.ml_store_tokens import DEFAULT_TOKEN_TTL
+from backend.ml_token_cache import ml_token_cache
+from backend.ml_webhook_queue import ml_webhook_queue
+from backend.store_ownership import store_ownership
+from backend.auth_tokens import verify_token
+from backend.settings import get_db
+from backend.supabase_repository import SupabaseRepository
 from typing import Optional, List
 
-# Import dependencies - avoiding circular imports
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import jwt
-from supabase import create_client
-import os
-
 # Type hints compatible with Python 3.11+
 from typing import Dict, Union, Optional
 
 AuthData = Dict[str, Union[str, int]]
 StoreData = Dict[str, Union[str, int, None]]
 
-# Initialize dependencies locally to avoid circular import
-security = HTTPBearer()
-JWT_SECRET = os.getenv("JWT_SECRET_KEY", "dropux_jwt_super_secret_key_2024_v2_production")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
-
-# Initialize Supabase client locally
-supabase = None
-try:
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if supabase_url and supabase_key:
-        supabase_url = supabase_url.replace('\n', '').replace(' ', '').strip()
-        supabase_key = supabase_key.replace('\n', '').replace(' ', '').strip()
-        
-        if not supabase_url.startswith('https://'):
-            supabase_url = 'https://' + supabase_url.replace('https://', '')
-        
-        supabase = create_client(supabase_url, supabase_key)
-except Exception:
-    supabase = None
-
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthData:
-    """Verify JWT token and return user data."""
-    try:
-        payload: AuthData = jwt.decode(
-            credentials.credentials, 
-            JWT_SECRET, 
-            algorithms=[JWT_ALGORITHM]
-        )
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 router = APIRouter(prefix="/api/ml", tags=["MercadoLibre"])
 
 # ==================== PYDANTIC MODELS ====================
@@ -135,14 +100,15 @@ async def get_available_sites() -> dict:
 @router.post("/connect-store", response_model=MLStoreResponse)
 async def connect_ml_store(
     request: MLStoreConnection,
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
 ) -> MLStoreResponse:
     """
     Step 1: Register ML app credentials and generate OAuth URL.
     User will be redirected to ML to authorize the connection.
     """
     
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
@@ -180,24 +146,28 @@ async def connect_ml_store(
         }
         
         # Check if store already exists for this user
-        existing = supabase.table('ml_accounts').select("*").eq(
-            'user_id', current_user["user_id"]
-        ).eq('site_id', request.site_id).eq('app_id', request.app_id).execute()
+        existing = await db.execute(
+            db.table('ml_accounts').select("*").eq(
+                'user_id', current_user["user_id"]
+            ).eq('site_id', request.site_id).eq('app_id', request.app_id)
+        )
         
         if existing.data:
             # Update existing store
-            response = supabase.table('ml_accounts').update(store_data).eq(
-                'id', existing.data[0]['id']
-            ).execute()
+            response = await db.execute(
+                db.table('ml_accounts').update(store_data).eq('id', existing.data[0]['id'])
+            )
             store_id = existing.data[0]['id']
         else:
             # Create new store
-            response = supabase.table('ml_accounts').insert(store_data).execute()
+            response = await db.execute(db.table('ml_accounts').insert(store_data))
             store_id = response.data[0]['id'] if response.data else None
         
         if not store_id:
             raise HTTPException(status_code=500, detail="Failed to save store configuration")
         
+        store_ownership.add_store(current_user["user_id"], store_id)
+        
         # Generate OAuth URL
         auth_url = ml_oauth_service.get_auth_url(
             site_id=request.site_id,
@@ -234,14 +204,15 @@ async def ml_oauth_callback(
     code: Optional[str] = None,
     state: Optional[str] = None,
     error: Optional[str] = None,
-    error_description: Optional[str] = None
+    error_description: Optional[str] = None,
+    db: SupabaseRepository = Depends(get_db)
 ) -> dict:
     """
     Step 2: Handle OAuth callback from MercadoLibre.
     Exchange authorization code for access tokens.
     """
     
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     # Handle ML authorization errors
@@ -256,9 +227,11 @@ async def ml_oauth_callback(
     
     try:
         # Find the store by state token
-        store_response = supabase.table('ml_accounts').select("*").eq(
-            'state_token', state
-        ).eq('status', 'pending_authorization').execute()
+        store_response = await db.execute(
+            db.table('ml_accounts').select("*").eq(
+                'state_token', state
+            ).eq('status', 'pending_authorization')
+        )
         
         if not store_response.data:
             raise HTTPException(status_code=404, detail="Invalid or expired authorization request")
@@ -297,7 +270,8 @@ async def ml_oauth_callback(
             ).isoformat()
         }
         
-        supabase.table('ml_accounts').update(update_data).eq('id', store['id']).execute()
+        await db.execute(db.table('ml_accounts').update(update_data).eq('id', store['id']))
+        ml_token_cache.invalidate(store['id'])
         
         # Return professional HTML success page with auto-redirect
         frontend_url = os.getenv('FRONTEND_URL', 'https://sales.dropux.co')
@@ -429,17 +403,18 @@ async def ml_oauth_callback(
 
 @router.get("/my-stores", response_model=List[MLStoreInfo])
 async def get_my_stores(
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
 ) -> List[MLStoreInfo]:
     """Get all ML stores connected by the current user."""
     
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        response = supabase.table('ml_accounts').select("*").eq(
-            'user_id', current_user["user_id"]
-        ).execute()
+        response = await db.execute(
+            db.table('ml_accounts').select("*").eq('user_id', current_user["user_id"])
+        )
         
         stores = []
         for store in response.data or []:
@@ -464,54 +439,29 @@ async def get_my_stores(
 @router.post("/refresh-token/{store_id}")
 async def refresh_store_token(
     store_id: int,
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
 ) -> dict:
     """Manually refresh access token for a specific store."""
     
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        # Get store and verify ownership
-        store_response = supabase.table('ml_accounts').select("*").eq(
-            'id', store_id
-        ).eq('user_id', current_user["user_id"]).execute()
-        
-        if not store_response.data:
-            raise HTTPException(status_code=404, detail="Store not found")
-        
-        store = store_response.data[0]
+        # Verify ownership and load the store (both served from in-process caches)
+        await store_ownership.require_owner(db, current_user["user_id"], store_id)
+        store = await ml_token_cache.get_store(db, store_id)
         
         if not store.get('refresh_token'):
             raise HTTPException(status_code=400, detail="Store not connected or missing refresh token")
         
-        # Decrypt app secret
-        app_secret = ml_oauth_service.decrypt_secret(store['app_secret_encrypted'])
-        
-        # Refresh the token
-        new_tokens = await ml_oauth_service.refresh_access_token(
-            refresh_token=store['refresh_token'],
-            client_id=store['app_id'],
-            client_secret=app_secret,
-            site_id=store['site_id']
-        )
-        
-        # Update store with new tokens
-        update_data = {
-            "access_token": new_tokens['access_token'],
-            "refresh_token": new_tokens.get('refresh_token', store['refresh_token']),
-            "token_refreshed_at": datetime.now().isoformat(),
-            "token_expires_at": datetime.fromtimestamp(
-                datetime.now().timestamp() + new_tokens.get('expires_in', 21600)
-            ).isoformat()
-        }
-        
-        supabase.table('ml_accounts').update(update_data).eq('id', store_id).execute()
+        # Refresh the token (shared with any in-flight refresh for this store) and persist it
+        await ml_token_cache.refresh(db, store)
         
         return {
             "status": "success",
             "message": "Token refreshed successfully",
-            "expires_in": new_tokens.get('expires_in', 21600)
+            "expires_in": ml_token_cache.expires_in(store_id) or DEFAULT_TOKEN_TTL
         }
         
     except HTTPException:
@@ -522,24 +472,22 @@ async def refresh_store_token(
 @router.delete("/stores/{store_id}")
 async def delete_store(
     store_id: int,
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
 ) -> dict:
     """Completely delete a ML store from user's account."""
     
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
         # Verify ownership
-        store_response = supabase.table('ml_accounts').select("*").eq(
-            'id', store_id
-        ).eq('user_id', current_user["user_id"]).execute()
-        
-        if not store_response.data:
-            raise HTTPException(status_code=404, detail="Store not found")
+        await store_ownership.require_owner(db, current_user["user_id"], store_id)
         
         # Completely delete the store
-        supabase.table('ml_accounts').delete().eq('id', store_id).execute()
+        await db.execute(db.table('ml_accounts').delete().eq('id', store_id))
+        ml_token_cache.invalidate(store_id)
+        store_ownership.remove_store(current_user["user_id"], store_id)
         
         return {
             "status": "success",
@@ -554,21 +502,17 @@ async def delete_store(
 @router.delete("/disconnect/{store_id}")
 async def disconnect_store(
     store_id: int,
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
 ) -> dict:
     """Disconnect a ML store (removes tokens but keeps configuration)."""
     
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
         # Verify ownership
-        store_response = supabase.table('ml_accounts').select("*").eq(
-            'id', store_id
-        ).eq('user_id', current_user["user_id"]).execute()
-        
-        if not store_response.data:
-            raise HTTPException(status_code=404, detail="Store not found")
+        await store_ownership.require_owner(db, current_user["user_id"], store_id)
         
         # Clear sensitive data but keep configuration
         update_data = {
@@ -578,7 +522,9 @@ async def disconnect_store(
             "disconnected_at": datetime.now().isoformat()
         }
         
-        supabase.table('ml_accounts').update(update_data).eq('id', store_id).execute()
+        await db.execute(db.table('ml_accounts').update(update_data).eq('id', store_id))
+        ml_token_cache.invalidate(store_id)
+        store_ownership.invalidate(current_user["user_id"])
         
         return {
             "status": "success",
@@ -601,28 +547,22 @@ async def ml_webhook_handler(request: dict) -> dict:
     - Payment updates  
     - Shipping updates
     - Order cancellations
+    
+    The notification is acknowledged immediately and queued; background
+    workers coalesce duplicates, fetch the resource and upsert ml_orders.
     """
     
     try:
-        # Log webhook data for debugging
-        print(f"ML Webhook received: {request}")
-        
-        # TODO: Process webhook based on topic
-        topic = request.get("topic")
-        resource = request.get("resource")
-        user_id = request.get("user_id")
-        
-        if topic == "orders":
-            # Handle order notifications
-            print(f"Order update for user {user_id}: {resource}")
-        elif topic == "payments":
-            # Handle payment notifications  
-            print(f"Payment update for user {user_id}: {resource}")
+        queued = ml_webhook_queue.enqueue(
+            topic=request.get("topic"),
+            resource=request.get("resource"),
+            user_id=request.get("user_id")
+        )
         
         # Always respond with 200 OK to acknowledge receipt
-        return {"status": "ok", "message": "Webhook processed"}
+        return {"status": "ok", "message": "Webhook queued" if queued else "Webhook acknowledged"}
         
     except Exception as e:
         print(f"Webhook error: {str(e)}")
         # Still return 200 to avoid ML retries
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
@@ -3,61 +3,68 @@ MercadoLibre Orders Endpoint - Gestión de órdenes ML
 Handles ML orders fetching and management
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from backend.ml_api_gateway import MLPriority, ml_priority
 from backend.ml_oauth_service import ml_oauth_service
-from typing import List, Optional, Dict, Any
+from backend.ml_http_client import get_ml_http_client
+from backend.ml_order_sync import (
+    SyncMode,
+    build_order_record,
+    format_ml_date,
+    parse_sync_cursor,
+    sync_in_progress,
+    sync_store_orders,
+    upsert_orders
+)
+from backend.ml_order_reads import (
+    LIVE_SOURCE,
+    LOCAL_SOURCE,
+    cursor_source,
+    decode_multi_cursor,
+    encode_multi_cursor,
+    fetch_local_orders,
+    filter_live_page,
+    iter_local_orders,
+    live_keyset_params,
+    merge_newest_first,
+    next_page_cursor
+)
+from backend.ml_order_cache import etag_matches, ml_order_cache
+from backend.ml_order_details import ORDER_ID, fetch_order_details
+from backend.ml_order_export import ExportFormat, encode_export
+from backend.ml_token_cache import ml_token_cache
+from backend.store_ownership import store_ownership
+from backend.auth_tokens import verify_token
+from backend.settings import get_db
+from backend.supabase_repository import SupabaseRepository
+from typing import List, Optional, Dict, Any, Union
+import asyncio
 import httpx
-import jwt
-from supabase import create_client
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 # Type hints compatible with Python 3.12
 type AuthData = dict[str, str | int]
 type OrderData = dict[str, Any]
 
-# Initialize dependencies
-security = HTTPBearer()
-JWT_SECRET = os.getenv("JWT_SECRET_KEY", "dropux_jwt_super_secret_key_2024_v2_production")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+router = APIRouter(prefix="/api/ml", tags=["MercadoLibre Orders"])
 
-# Initialize Supabase
-supabase = None
-try:
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if supabase_url and supabase_key:
-        supabase_url = supabase_url.replace('\n', '').replace(' ', '').strip()
-        supabase_key = supabase_key.replace('\n', '').replace(' ', '').strip()
-        
-        if not supabase_url.startswith('https://'):
-            supabase_url = 'https://' + supabase_url.replace('https://', '')
-        
-        supabase = create_client(supabase_url, supabase_key)
-except Exception:
-    supabase = None
+# Default max age (seconds) of the synced ml_orders copy before listings read the live API
+DEFAULT_FRESHNESS = int(os.getenv("ML_ORDERS_DEFAULT_FRESHNESS", "900"))
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthData:
-    """Verify JWT token and return user data."""
-    try:
-        payload: AuthData = jwt.decode(
-            credentials.credentials, 
-            JWT_SECRET, 
-            algorithms=[JWT_ALGORITHM]
-        )
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+# Per-store time budget (seconds) when listing orders across all of a user's stores
+STORE_FETCH_TIMEOUT = float(os.getenv("ML_ORDERS_STORE_TIMEOUT", "15"))
 
-router = APIRouter(prefix="/api/ml", tags=["MercadoLibre Orders"])
+# Rows per ml_orders read while streaming an export
+EXPORT_CHUNK_SIZE = int(os.getenv("ML_ORDERS_EXPORT_CHUNK_SIZE", "1000"))
+
+# Max order ids per batch details request
+MAX_DETAIL_IDS = 100
 
 # ==================== PYDANTIC MODELS ====================
 
@@ -83,58 +90,228 @@ class MLOrdersResponse(BaseModel):
     limit: int
     store_name: str
     site_id: str
+    source: str = LIVE_SOURCE  # "local" (ml_orders) or "ml_api" (live)
+    synced_at: Optional[str] = None
+    next_cursor: Optional[str] = None
+
+class MLOrderDetailsRequest(BaseModel):
+    """Order ids for a batch details request"""
+    order_ids: List[Union[int, str]] = Field(..., description=f"Numeric order ids (at most {MAX_DETAIL_IDS}), as numbers or strings")
+
+class MLStoreOrder(MLOrder):
+    """ML order tagged with the store it belongs to"""
+    store_id: int
+    site_id: str
+
+class MLStoreListingStatus(BaseModel):
+    """Per-store outcome of a multi-store listing"""
+    store_id: int
+    store_name: str
+    site_id: str
+    status: str  # "ok" or "error"
+    source: Optional[str] = None
+    total: Optional[int] = None
+    error: Optional[str] = None
+
+class MLAllOrdersResponse(BaseModel):
+    """Response for orders merged across all of a user's stores"""
+    orders: List[MLStoreOrder]
+    total: int
+    limit: int
+    stores: List[MLStoreListingStatus]
+    next_cursor: Optional[str] = None
 
 # ==================== HELPER FUNCTIONS ====================
 
-async def get_ml_access_token(store_id: int, user_id: int) -> tuple[str, dict]:
-    """Get valid access token for ML API calls, refreshing if needed."""
+def parse_ml_order(order_data: OrderData) -> MLOrder:
+    """Build an MLOrder from an ML order payload (live or stored in ml_orders)."""
+    return MLOrder(
+        id=str(order_data['id']),  # ML sends numeric ids
+        status=order_data['status'],
+        date_created=order_data['date_created'],
+        date_closed=order_data.get('date_closed'),
+        buyer_id=order_data['buyer']['id'],
+        buyer_nickname=order_data['buyer']['nickname'],
+        total_amount=order_data['total_amount'],
+        currency_id=order_data['currency_id'],
+        order_items=order_data.get('order_items', []),
+        shipping=order_data.get('shipping'),
+        payments=order_data.get('payments')
+    )
+
+def order_detail_response(
+    etag: str,
+    order_data: OrderData,
+    if_none_match: Optional[str],
+    source: str
+) -> Response:
+    """Order payload with its ETag, or 304 if the client already has it."""
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+        'X-Order-Source': source
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=order_data, headers=headers)
+
+async def get_ml_access_token(db: SupabaseRepository, store_id: int, user_id: int) -> tuple[str, dict]:
+    """Get valid access token for ML API calls, refreshing if needed.
     
-    if not supabase:
-        raise HTTPException(status_code=503, detail="Database not available")
+    Ownership and store rows are served from in-process caches, and
+    concurrent refreshes for the same store share a single request to ML.
+    """
+    await store_ownership.require_owner(db, user_id, store_id)
+    return await ml_token_cache.get_access_token(db, store_id, user_id)
+
+async def get_ml_store(db: SupabaseRepository, store_id: int, user_id: int) -> dict:
+    """Owned, connected store row without resolving its token.
     
-    # Get store from database
-    store_response = supabase.table('ml_accounts').select("*").eq(
-        'id', store_id
-    ).eq('user_id', user_id).execute()
+    For reads that may be served from ml_orders: an expired or revoked
+    token must not block rows that are already synced.
+    """
+    await store_ownership.require_owner(db, user_id, store_id)
+    store = await ml_token_cache.get_store(db, store_id)
+    if store.get('status') != 'connected':
+        raise HTTPException(status_code=400, detail="Store not connected")
+    return store
+
+async def read_store_orders(
+    client: httpx.AsyncClient,
+    db: SupabaseRepository,
+    store: dict,
+    offset: int = 0,
+    limit: int = 50,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    freshness: int = DEFAULT_FRESHNESS
+) -> MLOrdersResponse:
+    """One page of a store's orders from ml_orders or the live ML API.
     
-    if not store_response.data:
-        raise HTTPException(status_code=404, detail="Store not found")
+    Reads the synced copy when the store's last sync is within `freshness`
+    seconds (or the cursor came from the local path), otherwise proxies
+    /orders/search. Ownership must already have been checked. The access
+    token is only resolved (and refreshed if needed) on the live path.
+    """
+    store_id = store['id']
     
-    store = store_response.data[0]
+    # Local read model: fresh enough, or continuing a local page sequence
+    last_sync = parse_sync_cursor(store.get('last_sync_at'))
+    local_age = (datetime.now(timezone.utc) - last_sync).total_seconds() if last_sync else None
     
-    if store.get('status') != 'connected':
-        raise HTTPException(status_code=400, detail="Store not connected")
+    if cursor:
+        use_local = cursor_source(cursor) == LOCAL_SOURCE
+    else:
+        use_local = local_age is not None and local_age <= freshness
     
-    # Check if token is expired
-    token_expires = store.get('token_expires_at')
-    if token_expires:
-        expires_dt = datetime.fromisoformat(token_expires.replace('Z', '+00:00'))
-        if expires_dt < datetime.now():
-            # Token expired, refresh it
-            app_secret = ml_oauth_service.decrypt_secret(store['app_secret_encrypted'])
-            
-            new_tokens = await ml_oauth_service.refresh_access_token(
-                refresh_token=store['refresh_token'],
-                client_id=store['app_id'],
-                client_secret=app_secret,
-                site_id=store['site_id']
+    if use_local:
+        # The local path pages by keyset only; serving page 1 for an offset would loop clients
+        if offset:
+            raise HTTPException(
+                status_code=400,
+                detail="offset is not supported for synced orders; page with next_cursor via cursor"
             )
-            
-            # Update tokens in database
-            update_data = {
-                "access_token": new_tokens['access_token'],
-                "refresh_token": new_tokens.get('refresh_token', store['refresh_token']),
-                "token_refreshed_at": datetime.now().isoformat(),
-                "token_expires_at": datetime.fromtimestamp(
-                    datetime.now().timestamp() + new_tokens.get('expires_in', 21600)
-                ).isoformat()
-            }
-            
-            supabase.table('ml_accounts').update(update_data).eq('id', store_id).execute()
-            
-            return new_tokens['access_token'], store
+        
+        page = await fetch_local_orders(
+            db,
+            store_id=store_id,
+            limit=limit,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            cursor=cursor
+        )
+        
+        return MLOrdersResponse(
+            orders=[parse_ml_order(order_data) for order_data in page["orders"]],
+            total=page["total"],
+            offset=0,
+            limit=limit,
+            store_name=store.get('nickname', 'Unknown Store'),
+            site_id=store['site_id'],
+            source=LOCAL_SOURCE,
+            synced_at=last_sync.isoformat() if last_sync else None,
+            next_cursor=page["next_cursor"]
+        )
+    
+    access_token = await ml_token_cache.token_for_store(db, store)
+    
+    # Build ML API URL (the seller id is looked up and saved on first use)
+    ml_user_id = await ml_token_cache.ml_user_id(db, store, access_token)
+    
+    # Prepare API request (one extra row tells us whether another page exists)
+    url = "/orders/search"
+    params = {
+        'seller': ml_user_id,
+        'offset': offset,
+        'limit': limit + 1,
+        'sort': 'date_desc'
+    }
+    
+    if status:
+        params['order.status'] = status
+    if date_from:
+        params['order.date_created.from'] = format_ml_date(date_from)
+    if date_to:
+        params['order.date_created.to'] = format_ml_date(date_to)
+    
+    # Resume after the cursor by date instead of offset
+    position = None
+    if cursor:
+        position, keyset_params = live_keyset_params(cursor)
+        params.update(keyset_params)
+    
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Accept': 'application/json'
+    }
     
-    return store['access_token'], store
+    # Make request to ML API
+    response = await client.get(url, params=params, headers=headers)
+    
+    if response.status_code == 401:
+        # Token might be invalid even if not expired, try refreshing
+        access_token = await ml_token_cache.refresh(db, store, stale_token=access_token)
+        
+        # Update and retry
+        headers['Authorization'] = f'Bearer {access_token}'
+        response = await client.get(url, params=params, headers=headers)
+    
+    if response.status_code != 200:
+        error_detail = response.json() if response.text else {}
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"ML API error: {error_detail.get('message', 'Unknown error')}"
+        )
+    
+    data = response.json()
+    results = data.get('results', [])
+    matched = data.get('paging', {}).get('total', 0)
+    
+    page = filter_live_page(
+        results,
+        limit=limit,
+        total=position['total'] if position else matched,
+        position=position,
+        more_available=matched > params['offset'] + len(results)
+    )
+    
+    # Parse orders
+    orders = [parse_ml_order(order_data) for order_data in page["orders"]]
+    
+    return MLOrdersResponse(
+        orders=orders,
+        total=page["total"],
+        offset=offset,
+        limit=limit,
+        store_name=store.get('nickname', 'Unknown Store'),
+        site_id=store['site_id'],
+        source=LIVE_SOURCE,
+        synced_at=last_sync.isoformat() if last_sync else None,
+        next_cursor=page["next_cursor"]
+    )
 
 # ==================== ENDPOINTS ====================
 
@@ -142,141 +319,353 @@ async def get_ml_access_token(store_id: int, user_id: int) -> tuple[str, dict]:
 async def get_ml_orders(
     store_id: int,
     current_user: AuthData = Depends(verify_token),
-    offset: int = Query(0, ge=0, description="Starting position"),
+    client: httpx.AsyncClient = Depends(get_ml_http_client),
+    db: SupabaseRepository = Depends(get_db),
+    offset: int = Query(0, ge=0, description="Starting position of the first live page; rejected for synced reads (use cursor)"),
     limit: int = Query(50, ge=1, le=100, description="Number of orders to fetch"),
-    status: Optional[str] = Query(None, description="Filter by order status")
+    status: Optional[str] = Query(None, description="Filter by order status"),
+    date_from: Optional[datetime] = Query(None, description="Orders created on or after this date"),
+    date_to: Optional[datetime] = Query(None, description="Orders created on or before this date"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    freshness: int = Query(
+        DEFAULT_FRESHNESS, ge=0,
+        description="Max age in seconds of the synced copy; older (or 0) reads the live ML API"
+    )
 ) -> MLOrdersResponse:
     """
     Get orders from a connected MercadoLibre store.
+    Served from the synced ml_orders table when the store's last sync is
+    within `freshness` seconds; otherwise proxied to the live ML API.
+    Both paths return an opaque `next_cursor` (keyset on date_created,
+    ml_order_id); pass it back to get the next page from the same source.
     Automatically refreshes token if expired.
     """
     
     try:
-        # Get valid access token
-        access_token, store = await get_ml_access_token(store_id, current_user["user_id"])
-        
-        # Build ML API URL
-        ml_user_id = store.get('ml_user_id')
-        if not ml_user_id:
-            # Get user info first if we don't have it
-            user_info = await ml_oauth_service.get_user_info(access_token)
-            ml_user_id = user_info['id']
+        # The token is only needed (and refreshed) if the page comes from the live API
+        store = await get_ml_store(db, store_id, current_user["user_id"])
+        
+        return await read_store_orders(
+            client,
+            db,
+            store,
+            offset=offset,
+            limit=limit,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            cursor=cursor,
+            freshness=freshness
+        )
             
-            # Save ML user ID for future use
-            supabase.table('ml_accounts').update({
-                'ml_user_id': ml_user_id,
-                'ml_nickname': user_info.get('nickname')
-            }).eq('id', store_id).execute()
-        
-        # Prepare API request
-        url = f"https://api.mercadolibre.com/orders/search"
-        params = {
-            'seller': ml_user_id,
-            'offset': offset,
-            'limit': limit,
-            'sort': 'date_desc'
-        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching orders: {str(e)}")
+
+@router.get("/orders", response_model=MLAllOrdersResponse)
+async def get_all_ml_orders(
+    current_user: AuthData = Depends(verify_token),
+    client: httpx.AsyncClient = Depends(get_ml_http_client),
+    db: SupabaseRepository = Depends(get_db),
+    limit: int = Query(50, ge=1, le=100, description="Number of orders to return"),
+    status: Optional[str] = Query(None, description="Filter by order status"),
+    date_from: Optional[datetime] = Query(None, description="Orders created on or after this date"),
+    date_to: Optional[datetime] = Query(None, description="Orders created on or before this date"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    freshness: int = Query(
+        DEFAULT_FRESHNESS, ge=0,
+        description="Max age in seconds of the synced copy; older (or 0) reads the live ML API"
+    )
+) -> MLAllOrdersResponse:
+    """
+    Get orders from every connected store of the user as one page, newest first.
+    Each store's page is read concurrently (same local/live choice as the
+    per-store listing) and the pages are k-way merged on date_created.
+    A store that fails or times out is reported in `stores` with its error
+    and skipped; the other stores still return their orders.
+    """
+    
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    try:
+        response = await db.execute(
+            db.table('ml_accounts').select("*").eq(
+                'user_id', current_user["user_id"]
+            ).eq('status', 'connected')
+        )
+        stores = {int(store['id']): store for store in response.data or []}
         
-        if status:
-            params['order.status'] = status
+        # Continue only the stores that still had orders on the previous page
+        positions = decode_multi_cursor(cursor) if cursor else {store_id: None for store_id in stores}
+        stores = {store_id: store for store_id, store in stores.items() if store_id in positions}
         
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
+        async def read_one(store: dict) -> MLOrdersResponse:
+            # Stores served from ml_orders never touch their token
+            return await read_store_orders(
+                client,
+                db,
+                store,
+                limit=limit,
+                status=status,
+                date_from=date_from,
+                date_to=date_to,
+                cursor=positions.get(int(store['id'])),
+                freshness=freshness
+            )
         
-        # Make request to ML API
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, params=params, headers=headers)
-            
-            if response.status_code == 401:
-                # Token might be invalid even if not expired, try refreshing
-                app_secret = ml_oauth_service.decrypt_secret(store['app_secret_encrypted'])
-                new_tokens = await ml_oauth_service.refresh_access_token(
-                    refresh_token=store['refresh_token'],
-                    client_id=store['app_id'],
-                    client_secret=app_secret,
-                    site_id=store['site_id']
+        results = await asyncio.gather(
+            *(asyncio.wait_for(read_one(store), STORE_FETCH_TIMEOUT) for store in stores.values()),
+            return_exceptions=True
+        )
+        
+        pages: dict[int, MLOrdersResponse] = {}
+        statuses: List[MLStoreListingStatus] = []
+        for (store_id, store), result in zip(stores.items(), results):
+            listing_status = MLStoreListingStatus(
+                store_id=store_id,
+                store_name=store.get('nickname', 'Unknown Store'),
+                site_id=store['site_id'],
+                status="ok"
+            )
+            if isinstance(result, BaseException):
+                listing_status.status = "error"
+                if isinstance(result, HTTPException):
+                    listing_status.error = str(result.detail)
+                elif isinstance(result, asyncio.TimeoutError):
+                    listing_status.error = f"Timed out after {STORE_FETCH_TIMEOUT:.0f}s"
+                else:
+                    listing_status.error = str(result)[:200]
+            else:
+                pages[store_id] = result
+                listing_status.source = result.source
+                listing_status.total = result.total
+            statuses.append(listing_status)
+        
+        merged = merge_newest_first(
+            {store_id: page.orders for store_id, page in pages.items()},
+            limit,
+            key=lambda order: (order.date_created, int(order.id))
+        )
+        
+        # Where each store resumes: after its last order used on this page
+        consumed: dict[int, MLOrder] = {}
+        for store_id, order in merged:
+            consumed[store_id] = order
+        
+        next_positions: dict[int, Optional[str]] = {}
+        for store_id, page in pages.items():
+            last = consumed.get(store_id)
+            if not page.orders:
+                continue
+            if last is None:
+                next_positions[store_id] = positions.get(store_id)
+            elif last is page.orders[-1]:
+                if page.next_cursor:
+                    next_positions[store_id] = page.next_cursor
+            else:
+                next_positions[store_id] = next_page_cursor(
+                    page.source,
+                    {
+                        'date_created': last.date_created.isoformat(timespec='milliseconds'),
+                        'ml_order_id': int(last.id)
+                    },
+                    page.total
                 )
-                
-                # Update and retry
-                access_token = new_tokens['access_token']
-                headers['Authorization'] = f'Bearer {access_token}'
-                response = await client.get(url, params=params, headers=headers)
+        
+        # Failed stores are retried from the same position on the next page
+        for store_id in stores:
+            if store_id not in pages:
+                next_positions[store_id] = positions.get(store_id)
+        
+        has_more = bool(next_positions)
+        
+        return MLAllOrdersResponse(
+            orders=[
+                MLStoreOrder(**dict(order), store_id=store_id, site_id=stores[store_id]['site_id'])
+                for store_id, order in merged
+            ],
+            total=sum(page.total for page in pages.values()),
+            limit=limit,
+            stores=statuses,
+            next_cursor=encode_multi_cursor(next_positions) if has_more else None
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching orders: {str(e)}")
+
+# Registered before /stores/{store_id}/orders/{order_id} so "export" is not taken as an order id
+@router.get("/stores/{store_id}/orders/export")
+async def export_ml_orders(
+    store_id: int,
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db),
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format", description="ndjson or csv"),
+    status: Optional[str] = Query(None, description="Filter by order status"),
+    date_from: Optional[datetime] = Query(None, description="Orders created on or after this date"),
+    date_to: Optional[datetime] = Query(None, description="Orders created on or before this date")
+) -> StreamingResponse:
+    """
+    Export a store's synced orders (ml_orders) as NDJSON or CSV, newest first.
+    Rows are read in keyset chunks of ML_ORDERS_EXPORT_CHUNK_SIZE and
+    streamed as each chunk arrives, so memory stays flat however many
+    orders the store has. Run a sync first for an up-to-date export.
+    """
+    
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    # Checked before streaming starts: errors after the first byte cannot change the status code
+    await store_ownership.require_owner(db, current_user["user_id"], store_id)
+    
+    chunks = iter_local_orders(
+        db,
+        store_id=store_id,
+        chunk_size=EXPORT_CHUNK_SIZE,
+        status=status,
+        date_from=date_from,
+        date_to=date_to
+    )
+    filename = f"orders_{store_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format.value}"
+    
+    return StreamingResponse(
+        encode_export(export_format, chunks),
+        media_type=export_format.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/stores/{store_id}/orders/details")
+async def get_ml_order_details(
+    store_id: int,
+    request: MLOrderDetailsRequest,
+    background_tasks: BackgroundTasks,
+    current_user: AuthData = Depends(verify_token),
+    client: httpx.AsyncClient = Depends(get_ml_http_client),
+    db: SupabaseRepository = Depends(get_db)
+) -> dict:
+    """
+    Get details for many orders of a store in one call.
+    Orders are served from the order cache first; the rest are fetched from
+    ML in multiget batches with bounded concurrency and written back.
+    Returns a map of order id -> order, plus per-id errors.
+    """
+    
+    order_ids = list(dict.fromkeys(str(order_id) for order_id in request.order_ids))
+    if not order_ids:
+        raise HTTPException(status_code=400, detail="order_ids must not be empty")
+    if len(order_ids) > MAX_DETAIL_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_DETAIL_IDS} order ids per request")
+    invalid = [order_id for order_id in order_ids if not ORDER_ID.fullmatch(order_id)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid order ids: {', '.join(invalid[:5])}")
+    
+    try:
+        await store_ownership.require_owner(db, current_user["user_id"], store_id)
+        
+        cached = await ml_order_cache.get_many(db, store_id, order_ids)
+        orders = {order_id: entry.order_data for order_id, entry in cached.items()}
+        errors: dict[str, dict] = {}
+        fetched: dict[str, OrderData] = {}
+        
+        missing = [order_id for order_id in order_ids if order_id not in cached]
+        if missing:
+            access_token, store = await get_ml_access_token(db, store_id, current_user["user_id"])
+            result = await fetch_order_details(client, access_token, missing)
             
-            if response.status_code != 200:
-                error_detail = response.json() if response.text else {}
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"ML API error: {error_detail.get('message', 'Unknown error')}"
-                )
+            if result.unauthorized:
+                # Token rejected mid-batch: refresh once and retry what is still unresolved
+                access_token = await ml_token_cache.refresh(db, store, stale_token=access_token)
+                retry_ids = [i for i in missing if i not in result.orders and i not in result.errors]
+                retry = await fetch_order_details(client, access_token, retry_ids)
+                result.orders.update(retry.orders)
+                result.errors.update(retry.errors)
             
-            data = response.json()
+            for order_id in missing:
+                if order_id in result.orders:
+                    order_data = result.orders[order_id]
+                    ml_order_cache.put(store_id, order_data)
+                    fetched[order_id] = order_data
+                else:
+                    errors[order_id] = result.errors.get(
+                        order_id, {"status": 401, "message": "ML rejected the access token"}
+                    )
             
-            # Parse orders
-            orders = []
-            for order_data in data.get('results', []):
-                order = MLOrder(
-                    id=order_data['id'],
-                    status=order_data['status'],
-                    date_created=order_data['date_created'],
-                    date_closed=order_data.get('date_closed'),
-                    buyer_id=order_data['buyer']['id'],
-                    buyer_nickname=order_data['buyer']['nickname'],
-                    total_amount=order_data['total_amount'],
-                    currency_id=order_data['currency_id'],
-                    order_items=order_data.get('order_items', []),
-                    shipping=order_data.get('shipping'),
-                    payments=order_data.get('payments')
+            if fetched:
+                background_tasks.add_task(
+                    upsert_orders,
+                    db,
+                    [build_order_record(order_data, store_id, store['user_id']) for order_data in fetched.values()]
                 )
-                orders.append(order)
-            
-            return MLOrdersResponse(
-                orders=orders,
-                total=data.get('paging', {}).get('total', 0),
-                offset=offset,
-                limit=limit,
-                store_name=store.get('nickname', 'Unknown Store'),
-                site_id=store['site_id']
-            )
-            
+        
+        orders.update(fetched)
+        
+        return {
+            "orders": orders,
+            "errors": errors,
+            "from_cache": len(cached),
+            "from_ml": len(fetched)
+        }
+        
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching orders: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
 
 @router.get("/stores/{store_id}/orders/{order_id}")
 async def get_ml_order_detail(
     store_id: int,
     order_id: str,
-    current_user: AuthData = Depends(verify_token)
-) -> dict:
+    background_tasks: BackgroundTasks,
+    current_user: AuthData = Depends(verify_token),
+    client: httpx.AsyncClient = Depends(get_ml_http_client),
+    db: SupabaseRepository = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
+) -> Response:
     """
     Get detailed information about a specific ML order.
+    Served from the order cache (memory, then ml_orders.order_data) while
+    the copy is fresh for its status; otherwise fetched from ML and written
+    back. Responses carry an ETag; a matching If-None-Match returns 304.
     """
     
     try:
+        await store_ownership.require_owner(db, current_user["user_id"], store_id)
+        
+        cached = await ml_order_cache.get(db, store_id, order_id)
+        if cached is not None:
+            return order_detail_response(cached.etag, cached.order_data, if_none_match, cached.source)
+        
         # Get valid access token
-        access_token, store = await get_ml_access_token(store_id, current_user["user_id"])
+        access_token, store = await get_ml_access_token(db, store_id, current_user["user_id"])
         
         # Get order details from ML API
-        url = f"https://api.mercadolibre.com/orders/{order_id}"
+        url = f"/orders/{order_id}"
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Accept': 'application/json'
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers)
-            
-            if response.status_code != 200:
-                error_detail = response.json() if response.text else {}
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"ML API error: {error_detail.get('message', 'Order not found')}"
-                )
-            
-            return response.json()
+        response = await client.get(url, headers=headers)
+        
+        if response.status_code != 200:
+            error_detail = response.json() if response.text else {}
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"ML API error: {error_detail.get('message', 'Order not found')}"
+            )
+        
+        order_data = response.json()
+        entry = ml_order_cache.put(store_id, order_data)
+        
+        # Keep ml_orders.order_data current for the next cache miss and other workers
+        background_tasks.add_task(
+            upsert_orders, db, [build_order_record(order_data, store_id, store['user_id'])]
+        )
+        
+        return order_detail_response(entry.etag, order_data, if_none_match, entry.source)
             
     except HTTPException:
         raise
@@ -286,7 +675,8 @@ async def get_ml_order_detail(
 @router.get("/stores/{store_id}/user-info")
 async def get_ml_user_info(
     store_id: int,
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
 ) -> dict:
     """
     Get ML user information for a connected store.
@@ -294,17 +684,19 @@ async def get_ml_user_info(
     
     try:
         # Get valid access token
-        access_token, store = await get_ml_access_token(store_id, current_user["user_id"])
+        access_token, store = await get_ml_access_token(db, store_id, current_user["user_id"])
         
         # Get user info from ML API
         user_info = await ml_oauth_service.get_user_info(access_token)
         
         # Update in database if needed
         if not store.get('ml_user_id') or store.get('ml_user_id') != user_info['id']:
-            supabase.table('ml_accounts').update({
+            ml_fields = {
                 'ml_user_id': user_info['id'],
                 'ml_nickname': user_info.get('nickname')
-            }).eq('id', store_id).execute()
+            }
+            await db.execute(db.table('ml_accounts').update(ml_fields).eq('id', store_id))
+            ml_token_cache.update_store(store_id, ml_fields)
         
         return {
             "id": user_info['id'],
@@ -323,89 +715,124 @@ async def get_ml_user_info(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get user info: {str(e)}")
 
+async def run_order_backfill(
+    client: httpx.AsyncClient,
+    db: SupabaseRepository,
+    store: dict,
+    access_token: str,
+    ml_user_id: Union[int, str],
+    concurrency: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> None:
+    """Full-history sync run after the response (can outlive any request timeout)."""
+    store_id = store['id']
+    try:
+        with ml_priority(MLPriority.BACKGROUND):
+            report = await sync_store_orders(
+                client,
+                db,
+                store=store,
+                access_token=access_token,
+                ml_user_id=ml_user_id,
+                mode=SyncMode.FULL,
+                concurrency=concurrency,
+                chunk_size=chunk_size
+            )
+    except Exception as e:
+        print(f"ERROR: Order backfill failed for store {store_id}: {e}")
+        return
+    
+    if "last_sync_at" in report:
+        ml_token_cache.update_store(store_id, {'last_sync_at': report["last_sync_at"]})
+    print(f"Order backfill for store {store_id}: {report['total']} orders in {report['pages']} pages")
+
 @router.post("/stores/{store_id}/sync-orders")
 async def sync_ml_orders(
     store_id: int,
-    current_user: AuthData = Depends(verify_token)
+    response: Response,
+    background_tasks: BackgroundTasks,
+    current_user: AuthData = Depends(verify_token),
+    client: httpx.AsyncClient = Depends(get_ml_http_client),
+    db: SupabaseRepository = Depends(get_db),
+    mode: SyncMode = Query(
+        SyncMode.INCREMENTAL,
+        description=(
+            "incremental (default): orders updated since last sync, or a background full sync "
+            "if the store was never synced; full: entire history, in the background; "
+            "recent: latest page only"
+        )
+    ),
+    chunk_size: Optional[int] = Query(None, ge=1, le=1000, description="Rows per bulk upsert"),
+    concurrency: Optional[int] = Query(None, ge=1, le=10, description="Pages fetched in parallel")
 ) -> dict:
     """
     Sync orders from ML to local database.
+    Incremental syncs only fetch orders updated since the store's last_sync_at;
+    pages are fetched concurrently and bulk upserted as they arrive.
+    Full-history syncs (mode=full, or the default mode on a store with no
+    last_sync_at yet) run in the background and return 202 right away.
     """
     
     try:
         # Get valid access token
-        access_token, store = await get_ml_access_token(store_id, current_user["user_id"])
-        
-        # Get recent orders
-        ml_user_id = store.get('ml_user_id')
-        if not ml_user_id:
-            user_info = await ml_oauth_service.get_user_info(access_token)
-            ml_user_id = user_info['id']
-        
-        url = f"https://api.mercadolibre.com/orders/search"
-        params = {
-            'seller': ml_user_id,
-            'offset': 0,
-            'limit': 100,
-            'sort': 'date_desc'
-        }
+        access_token, store = await get_ml_access_token(db, store_id, current_user["user_id"])
         
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
+        # Resolve ML seller id (saved to ml_accounts on first use)
+        ml_user_id = await ml_token_cache.ml_user_id(db, store, access_token)
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, params=params, headers=headers)
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to fetch orders from ML"
-                )
-            
-            data = response.json()
-            orders_synced = 0
-            
-            # Save orders to database
-            for order_data in data.get('results', []):
-                # Check if order exists
-                existing = supabase.table('ml_orders').select("id").eq(
-                    'ml_order_id', order_data['id']
-                ).execute()
-                
-                order_record = {
-                    'ml_order_id': order_data['id'],
-                    'store_id': store_id,
-                    'user_id': current_user["user_id"],
-                    'status': order_data['status'],
-                    'total_amount': order_data['total_amount'],
-                    'currency_id': order_data['currency_id'],
-                    'buyer_nickname': order_data['buyer']['nickname'],
-                    'date_created': order_data['date_created'],
-                    'order_data': order_data,  # Store full JSON
-                    'synced_at': datetime.now().isoformat()
-                }
-                
-                if existing.data:
-                    # Update existing order
-                    supabase.table('ml_orders').update(order_record).eq(
-                        'ml_order_id', order_data['id']
-                    ).execute()
-                else:
-                    # Insert new order
-                    supabase.table('ml_orders').insert(order_record).execute()
-                
-                orders_synced += 1
-            
+        if sync_in_progress(store_id):
+            raise HTTPException(status_code=409, detail="A sync is already running for this store")
+        
+        # A backfill of the whole history would outlive proxy and client timeouts
+        if mode == SyncMode.FULL or (
+            mode == SyncMode.INCREMENTAL and parse_sync_cursor(store.get('last_sync_at')) is None
+        ):
+            background_tasks.add_task(
+                run_order_backfill,
+                client,
+                db,
+                store,
+                access_token,
+                ml_user_id,
+                concurrency=concurrency,
+                chunk_size=chunk_size
+            )
+            response.status_code = 202
             return {
-                "status": "success",
-                "orders_synced": orders_synced,
-                "total_orders": data.get('paging', {}).get('total', 0),
-                "message": f"Synchronized {orders_synced} orders successfully"
+                "status": "accepted",
+                "mode": SyncMode.FULL.value,
+                "since": None,
+                "message": "Full order sync started in the background; last_sync_at is set when it finishes"
             }
+        
+        report = await sync_store_orders(
+            client,
+            db,
+            store=store,
+            access_token=access_token,
+            ml_user_id=ml_user_id,
+            mode=mode,
+            concurrency=concurrency,
+            chunk_size=chunk_size
+        )
+        
+        if "last_sync_at" in report:
+            ml_token_cache.update_store(store_id, {'last_sync_at': report["last_sync_at"]})
+        
+        return {
+            "status": "success",
+            "mode": report["mode"],
+            "since": report["since"],
+            "orders_synced": report["total"],
+            "inserted": report["inserted"],
+            "updated": report["updated"],
+            "pages": report["pages"],
+            "total_orders": report["total_orders"],
+            "last_sync_at": report.get("last_sync_at", store.get('last_sync_at')),
+            "message": f"Synchronized {report['total']} orders successfully"
+        }
             
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Sync error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Sync error: {str(e)}")
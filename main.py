@@ -1,19 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import os
 import jwt
-import hashlib
-import bcrypt
 from dotenv import load_dotenv
-from supabase import create_client, Client
-# ✅ Python 3.12 - Removed typing imports (using built-in generics and | operator)
+from supabase import Client
 
-# Load environment variables
+# Load environment variables before the backend/services modules read their settings
 load_dotenv()
 
+from backend.ml_http_client import ml_http_pool
+from backend.ml_sync_scheduler import MLSyncScheduler
+from backend.ml_webhook_queue import ml_webhook_queue
+from backend.ml_token_cache import ml_token_cache
+from backend.ml_token_refresher import MLTokenRefresher
+from backend.settings import get_db, get_settings, get_supabase, supabase_clients
+from backend.auth_tokens import verified_token_cache, verify_token
+from backend.store_ownership import store_ownership
+from backend.ml_order_cache import ml_order_cache
+from backend.supabase_repository import SupabaseRepository
+from backend.password_executor import password_executor
+from backend.password_hashing import BCRYPT_ROUNDS, hash_password, needs_rehash, summarize_hashes, verify_password
+from services.logistics import logistics_services
+from services.rate_quotes import rate_quote_cache
+# ✅ Python 3.12 - Removed typing imports (using built-in generics and | operator)
+
 # Type hints compatible with Python 3.11
 from typing import Dict, Union, List, Any, Optional
 
@@ -23,35 +37,52 @@ JWTPayload = Dict[str, Union[str, int, float]]
 SupabaseResponse = Dict[str, Any]
 AuthData = Dict[str, Union[str, int]]
 
-# Initialize Supabase client
-supabase: Optional[Client] = None
-try:
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if supabase_url and supabase_key:
-        # Clean the URLs of any potential whitespace/newlines and fix malformed URLs
-        supabase_url = supabase_url.replace('\n', '').replace(' ', '').strip()
-        supabase_key = supabase_key.replace('\n', '').replace(' ', '').strip()
-        
-        # Ensure URL is properly formatted
-        if not supabase_url.startswith('https://'):
-            supabase_url = 'https://' + supabase_url.replace('https://', '')
-        
-        supabase = create_client(supabase_url, supabase_key)
-        print(f"SUCCESS: Supabase connected successfully to {supabase_url}")
-    else:
-        print("WARNING: Supabase credentials not found")
-except Exception as e:
-    print(f"ERROR: Supabase connection error: {e}")
-    supabase = None
+# Supabase client is created lazily by backend.settings and injected with Depends(get_supabase)
+
+# Background order sync for every connected store
+ml_sync_scheduler = MLSyncScheduler()
+sync_scheduler_enabled = os.getenv("ML_SYNC_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Refresh ML tokens ahead of expiry, off the request path
+ml_token_refresher = MLTokenRefresher()
+token_refresher_enabled = os.getenv("ML_TOKEN_REFRESHER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan - open shared resources on startup, close them on shutdown."""
+    # Pooled keep-alive client for every MercadoLibre API call
+    await ml_http_pool.start()
+    print(f"SUCCESS: ML HTTP pool started (http2={ml_http_pool.http2})")
+    
+    # Shared Supabase client, created once for every router and background job
+    db = get_db()
+    
+    if sync_scheduler_enabled and db:
+        await ml_sync_scheduler.start(db)
+        print(f"SUCCESS: ML sync scheduler started (every {ml_sync_scheduler.interval:.0f}s)")
+    
+    if token_refresher_enabled and db:
+        await ml_token_refresher.start(db)
+    
+    # Workers that fetch and store resources from ML webhook notifications
+    await ml_webhook_queue.start(db)
+    try:
+        yield
+    finally:
+        await ml_webhook_queue.stop()
+        await ml_token_refresher.stop()
+        await ml_sync_scheduler.stop()
+        await ml_http_pool.aclose()
+        await logistics_services.aclose()
+        password_executor.shutdown()
 
 app = FastAPI(
     title="DROPUX API", 
     version="2.0.0",
     description="Modern Dropshipping Platform - Amazon to MercadoLibre",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Import and include ML endpoints after app creation
@@ -112,37 +143,23 @@ def handle_login_options():
     return {"status": "ok"}
 
 # ==================== AUTHENTICATION ====================
-security = HTTPBearer()
-
-JWT_SECRET = os.getenv("JWT_SECRET_KEY", "dropux_jwt_super_secret_key_2024_v2_production")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_SECRET = get_settings().jwt_secret
+JWT_ALGORITHM = get_settings().jwt_algorithm
 
-def hash_password(password: str) -> str:
-    """Hash password using SHA256.
+async def upgrade_password_hash(db: SupabaseRepository, user_id: int, password: str, stored_hash: str) -> None:
+    """Replace a legacy or outdated-cost hash with bcrypt at the configured cost.
     
-    Args:
-        password: Plain text password to hash
-        
-    Returns:
-        Hexadecimal hash string
-    """
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against bcrypt hash.
-    
-    Args:
-        password: Plain text password
-        hashed: Stored bcrypt hash to compare against
-        
-    Returns:
-        True if password matches hash
+    Runs after the login response is sent; failures only delay the upgrade
+    to the user's next login. The update only applies while the row still
+    holds `stored_hash`, so a password changed in the meantime is kept.
     """
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    except Exception:
-        # Fallback to SHA256 for compatibility
-        return hash_password(password) == hashed
+        new_hash = await password_executor.run(hash_password, password)
+        await db.execute(
+            db.table('users').update({"password_hash": new_hash}).eq('id', user_id).eq('password_hash', stored_hash)
+        )
+    except Exception as e:
+        print(f"WARNING: Password rehash failed for user {user_id}: {e}")
 
 def create_jwt_token(user_data: UserRecord) -> str:
     """Create JWT token for authenticated user.
@@ -165,30 +182,6 @@ def create_jwt_token(user_data: UserRecord) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> AuthData:
-    """Verify JWT token and return user data.
-    
-    Args:
-        credentials: Bearer token from Authorization header
-        
-    Returns:
-        Decoded token payload with user data
-        
-    Raises:
-        HTTPException: 401 if token expired or invalid
-    """
-    try:
-        payload: AuthData = jwt.decode(
-            credentials.credentials, 
-            JWT_SECRET, 
-            algorithms=[JWT_ALGORITHM]
-        )
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 # ==================== PYDANTIC MODELS ====================
 class LoginRequest(BaseModel):
     email: str
@@ -258,8 +251,24 @@ def health_check() -> Dict[str, str]:
         "environment": os.getenv("APP_ENV", "development")
     }
 
+@app.get("/health/db")
+async def database_health_check() -> JSONResponse:
+    """
+    Database readiness probe.
+    
+    Returns:
+        Probe status and round-trip latency; HTTP 503 if Supabase is unreachable
+    """
+    report = await supabase_clients.health()
+    status_code = 200 if report["status"] == "ok" else 503
+    return JSONResponse(status_code=status_code, content={"database": report})
+
 @app.post("/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest) -> LoginResponse:
+async def login(
+    request: LoginRequest,
+    background_tasks: BackgroundTasks,
+    db: SupabaseRepository = Depends(get_db)
+) -> LoginResponse:
     """Login endpoint - authenticate user and return JWT token.
     
     Args:
@@ -270,23 +279,29 @@ def login(request: LoginRequest) -> LoginResponse:
         
     Raises:
         HTTPException: 401 if credentials invalid, 503 if database unavailable
+            or the password hashing pool is saturated
     """
-    if not supabase:
+    if not db:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
         # Find user by email
-        response = supabase.table('users').select("*").eq('email', request.email).execute()
+        response = await db.execute(db.table('users').select("*").eq('email', request.email))
         
         if not response.data:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         user: UserRecord = response.data[0]
         
-        # Verify password
-        if not verify_password(request.password, str(user['password_hash'])):
+        # Verify password on the bounded hashing pool (503 when saturated)
+        stored_hash = str(user['password_hash'])
+        if not await password_executor.run(verify_password, request.password, stored_hash):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
+        # Upgrade legacy SHA-256 / outdated-cost hashes once the response is sent
+        if needs_rehash(stored_hash):
+            background_tasks.add_task(upgrade_password_hash, db, user["id"], request.password, stored_hash)
+        
         # Create JWT token
         token: str = create_jwt_token(user)
         
@@ -328,7 +343,8 @@ def get_current_user(current_user: AuthData = Depends(verify_token)) -> dict[str
 @app.post("/api/ml/stores/setup", response_model=MLStoreResponse)
 def setup_ml_store(
     request: MLStoreSetup, 
-    current_user: AuthData = Depends(verify_token)
+    current_user: AuthData = Depends(verify_token),
+    supabase: Optional[Client] = Depends(get_supabase)
 ) -> MLStoreResponse:
     """Setup a new MercadoLibre store for the authenticated user.
     
@@ -369,6 +385,7 @@ def setup_ml_store(
             raise HTTPException(status_code=500, detail="Failed to create store")
         
         store_id: int = response.data[0]["id"]
+        store_ownership.add_store(current_user["user_id"], store_id)
         
         # Generate MercadoLibre OAuth URL (using provided app_id)
         auth_url: str = (
@@ -389,7 +406,10 @@ def setup_ml_store(
         raise HTTPException(status_code=500, detail=f"Setup error: {str(e)}")
 
 @app.get("/api/ml/stores")
-def get_user_stores(current_user: AuthData = Depends(verify_token)) -> dict[str, list[dict[str, str | int | None]] | int]:
+def get_user_stores(
+    current_user: AuthData = Depends(verify_token),
+    supabase: Optional[Client] = Depends(get_supabase)
+) -> dict[str, list[dict[str, str | int | None]] | int]:
     """Get all MercadoLibre stores for the authenticated user.
     
     Args:
@@ -429,7 +449,11 @@ def get_user_stores(current_user: AuthData = Depends(verify_token)) -> dict[str,
         raise HTTPException(status_code=500, detail=f"Error fetching stores: {str(e)}")
 
 @app.get("/api/ml/callback")
-def ml_oauth_callback(code: str, state: str) -> dict[str, str]:
+def ml_oauth_callback(
+    code: str,
+    state: str,
+    supabase: Optional[Client] = Depends(get_supabase)
+) -> dict[str, str]:
     """Handle MercadoLibre OAuth callback.
     
     Args:
@@ -522,7 +546,7 @@ def environment_check() -> dict[str, str | dict[str, bool] | dict[str, str | Non
     }
 
 @app.get("/status")
-def system_status():
+def system_status(supabase: Optional[Client] = Depends(get_supabase)):
     """System status and configuration info"""
     return {
         "api": "DROPUX",
@@ -542,11 +566,26 @@ def system_status():
             "supabase_connected": supabase is not None,
             "is_railway": bool(os.getenv("RAILWAY_ENVIRONMENT")),
             "port": os.getenv("PORT")
-        }
+        },
+        "ml_http_pool": ml_http_pool.stats(),
+        "ml_sync_scheduler": ml_sync_scheduler.stats(),
+        "ml_webhook_queue": ml_webhook_queue.stats(),
+        "ml_token_cache": ml_token_cache.stats(),
+        "ml_token_refresher": ml_token_refresher.stats(),
+        "supabase_repository": get_db().stats(),
+        "password_executor": password_executor.stats(),
+        "auth_token_cache": verified_token_cache.stats(),
+        "store_ownership_cache": store_ownership.stats(),
+        "ml_order_cache": ml_order_cache.stats(),
+        "logistics_services": logistics_services.stats(),
+        "rate_quote_cache": rate_quote_cache.stats()
     }
 
 @app.get("/admin/check-ml-accounts")
-def check_ml_accounts_structure(current_user: dict = Depends(verify_token)):
+def check_ml_accounts_structure(
+    current_user: dict = Depends(verify_token),
+    supabase: Optional[Client] = Depends(get_supabase)
+):
     """Check existing ml_accounts table structure"""
     if current_user.get("role") != "master_admin":
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -589,8 +628,36 @@ def check_ml_accounts_structure(current_user: dict = Depends(verify_token)):
             "error": f"General error: {str(e)[:200]}"
         }
 
+@app.get("/admin/password-hash-report")
+async def password_hash_report(
+    current_user: dict = Depends(verify_token),
+    db: SupabaseRepository = Depends(get_db)
+):
+    """Count stored password hashes by format/cost and how many still need rehashing - ADMIN ONLY"""
+    if current_user.get("role") != "master_admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if not db:
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    try:
+        response = await db.execute(db.table('users').select("password_hash"))
+        report = summarize_hashes([row.get("password_hash") for row in response.data or []])
+        
+        return {
+            "report": report,
+            "target_bcrypt_cost": BCRYPT_ROUNDS,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Report error: {str(e)}")
+
 @app.post("/admin/migrate-emails")
-def migrate_emails_to_dropux(current_user: dict = Depends(verify_token)):
+def migrate_emails_to_dropux(
+    current_user: dict = Depends(verify_token),
+    supabase: Optional[Client] = Depends(get_supabase)
+):
     """Migrate user emails from @drapify.com to @dropux.co - ADMIN ONLY"""
     if current_user.get("role") != "master_admin":
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -634,7 +701,10 @@ def migrate_emails_to_dropux(current_user: dict = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Migration error: {str(e)}")
 
 @app.post("/admin/setup-tables")
-def setup_database_tables(current_user: dict = Depends(verify_token)):
+def setup_database_tables(
+    current_user: dict = Depends(verify_token),
+    supabase: Optional[Client] = Depends(get_supabase)
+):
     """Setup required database tables - ADMIN ONLY"""
     if current_user.get("role") != "master_admin":
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -689,7 +759,7 @@ def setup_database_tables(current_user: dict = Depends(verify_token)):
     }
 
 @app.get("/db-test")
-def test_database():
+def test_database(supabase: Optional[Client] = Depends(get_supabase)):
     """Test Supabase connection and diagnose table access issues"""
     if not supabase:
         raise HTTPException(status_code=503, detail="Database not connected")
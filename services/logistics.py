@@ -1,12 +1,64 @@
 """
 Logistics providers integration service (Anicam & Chilexpress APIs)
 """
+import asyncio
+import hashlib
+import os
 import httpx
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from abc import ABC, abstractmethod
 
+# Connection pool per provider instance (tracking refreshes make thousands of calls)
+LOGISTICS_MAX_CONNECTIONS = int(os.getenv("LOGISTICS_MAX_CONNECTIONS", "20"))
+LOGISTICS_KEEPALIVE_CONNECTIONS = int(os.getenv("LOGISTICS_KEEPALIVE_CONNECTIONS", "20"))
+LOGISTICS_TIMEOUT = float(os.getenv("LOGISTICS_TIMEOUT", "30"))
+
+ServiceKey = Tuple[str, str, str]
+
 class LogisticsProvider(ABC):
-    """Abstract base class for logistics providers"""
+    """Abstract base class for logistics providers
+    
+    Each instance owns a pooled keep-alive client, created on first use
+    and kept until aclose(), so repeated calls reuse open connections.
+    """
+    
+    # Provider key used by the factory and caches ("anicam", "chilexpress")
+    name: str
+    
+    def __init__(self, api_key: str, base_url: str):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def credential_key(self) -> str:
+        """Digest of the API key and base URL, to keep per-account data apart in caches"""
+        return hashlib.sha256(f"{self.api_key}|{self.base_url}".encode()).hexdigest()[:16]
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled client for this provider (re-created if it was closed)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=LOGISTICS_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=LOGISTICS_MAX_CONNECTIONS,
+                    max_keepalive_connections=LOGISTICS_KEEPALIVE_CONNECTIONS
+                )
+            )
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close the pooled client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     @abstractmethod
     async def get_tracking_info(self, tracking_number: str) -> Dict:
@@ -17,17 +69,41 @@ class LogisticsProvider(ABC):
     async def create_shipment(self, shipment_data: Dict) -> Dict:
         """Create a new shipment"""
         pass
+    
+    async def get_tracking_batch(self, tracking_numbers: List[str], concurrency: int = 10) -> Dict[str, Dict]:
+        """
+        Get tracking information for many shipments
+        
+        Providers with a batch tracking endpoint should override this; the
+        default fans out get_tracking_info over the pooled client.
+        
+        Args:
+            tracking_numbers: Tracking numbers to query
+            concurrency: Requests in flight at once
+            
+        Returns:
+            Tracking information by tracking number; failed lookups map to {"error": ...}
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def fetch(tracking_number: str) -> Dict:
+            async with semaphore:
+                try:
+                    return await self.get_tracking_info(tracking_number)
+                except Exception as e:
+                    # HTTP errors, non-JSON bodies, unexpected payloads: one bad number must not sink the batch
+                    return {"error": f"{type(e).__name__}: {str(e)[:200]}"}
+        
+        results = await asyncio.gather(*(fetch(number) for number in tracking_numbers))
+        return dict(zip(tracking_numbers, results))
 
 class AnicamService(LogisticsProvider):
     """Anicam logistics provider service"""
     
+    name = "anicam"
+    
     def __init__(self, api_key: str, base_url: str = "https://api.anicam.com"):
-        self.api_key = api_key
-        self.base_url = base_url
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        super().__init__(api_key, base_url)
     
     async def get_tracking_info(self, tracking_number: str) -> Dict:
         """
@@ -39,13 +115,9 @@ class AnicamService(LogisticsProvider):
         Returns:
             Tracking information dictionary
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/tracking/{tracking_number}",
-                headers=self.headers
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.get(f"/tracking/{tracking_number}")
+        response.raise_for_status()
+        return response.json()
     
     async def create_shipment(self, shipment_data: Dict) -> Dict:
         """
@@ -57,14 +129,12 @@ class AnicamService(LogisticsProvider):
         Returns:
             Created shipment information
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/shipments",
-                headers=self.headers,
-                json=shipment_data
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.post(
+            "/shipments",
+            json=shipment_data
+        )
+        response.raise_for_status()
+        return response.json()
     
     async def get_shipping_rates(self, origin: str, destination: str, weight: float) -> Dict:
         """
@@ -78,29 +148,24 @@ class AnicamService(LogisticsProvider):
         Returns:
             Shipping rates information
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/rates",
-                headers=self.headers,
-                json={
-                    "origin": origin,
-                    "destination": destination,
-                    "weight": weight
-                }
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.post(
+            "/rates",
+            json={
+                "origin": origin,
+                "destination": destination,
+                "weight": weight
+            }
+        )
+        response.raise_for_status()
+        return response.json()
 
 class ChilexpressService(LogisticsProvider):
     """Chilexpress logistics provider service"""
     
+    name = "chilexpress"
+    
     def __init__(self, api_key: str, base_url: str = "https://api.chilexpress.cl"):
-        self.api_key = api_key
-        self.base_url = base_url
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        super().__init__(api_key, base_url)
     
     async def get_tracking_info(self, tracking_number: str) -> Dict:
         """
@@ -112,13 +177,9 @@ class ChilexpressService(LogisticsProvider):
         Returns:
             Tracking information dictionary
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/v1/tracking/{tracking_number}",
-                headers=self.headers
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.get(f"/v1/tracking/{tracking_number}")
+        response.raise_for_status()
+        return response.json()
     
     async def create_shipment(self, shipment_data: Dict) -> Dict:
         """
@@ -130,14 +191,12 @@ class ChilexpressService(LogisticsProvider):
         Returns:
             Created shipment information
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/v1/shipments",
-                headers=self.headers,
-                json=shipment_data
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.post(
+            "/v1/shipments",
+            json=shipment_data
+        )
+        response.raise_for_status()
+        return response.json()
     
     async def get_shipping_rates(self, origin: str, destination: str, weight: float) -> Dict:
         """
@@ -151,21 +210,63 @@ class ChilexpressService(LogisticsProvider):
         Returns:
             Shipping rates information
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/v1/rates",
-                headers=self.headers,
-                json={
-                    "origin": origin,
-                    "destination": destination,
-                    "weight": weight
-                }
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.post(
+            "/v1/rates",
+            json={
+                "origin": origin,
+                "destination": destination,
+                "weight": weight
+            }
+        )
+        response.raise_for_status()
+        return response.json()
 
 class LogisticsServiceFactory:
-    """Factory class to create logistics service instances"""
+    """Factory class to create logistics service instances
+    
+    get_service() caches one instance (and so one connection pool) per
+    provider and credential set; aclose() closes them all on shutdown.
+    """
+    
+    def __init__(self):
+        self._services: Dict[ServiceKey, LogisticsProvider] = {}
+    
+    @staticmethod
+    def _service_key(provider_name: str, credentials: Dict) -> ServiceKey:
+        """Cache key: provider, digest of the API key, base URL"""
+        api_key_digest = hashlib.sha256(str(credentials["api_key"]).encode()).hexdigest()
+        return (provider_name.lower(), api_key_digest, credentials.get("base_url") or "")
+    
+    def get_service(self, provider_name: str, credentials: Dict) -> LogisticsProvider:
+        """
+        Get the shared service instance for a provider and credential set
+        
+        Args:
+            provider_name: Name of the provider ("anicam" or "chilexpress")
+            credentials: Provider credentials
+            
+        Returns:
+            Cached LogisticsProvider instance
+        """
+        key = self._service_key(provider_name, credentials)
+        service = self._services.get(key)
+        if service is None:
+            service = self.create_service(provider_name, credentials)
+            self._services[key] = service
+        return service
+    
+    async def aclose(self) -> None:
+        """Close every cached provider's connection pool (FastAPI lifespan shutdown)"""
+        for service in self._services.values():
+            await service.aclose()
+        self._services.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Cached provider instances by provider name"""
+        counts: Dict[str, int] = {}
+        for provider_name, _, _ in self._services:
+            counts[provider_name] = counts.get(provider_name, 0) + 1
+        return counts
     
     @staticmethod
     def create_service(provider_name: str, credentials: Dict) -> LogisticsProvider:
@@ -192,4 +293,7 @@ class LogisticsServiceFactory:
                 base_url=credentials.get("base_url", "https://api.chilexpress.cl")
             )
         else:
-            raise ValueError(f"Unsupported logistics provider: {provider_name}")
\ No newline at end of file
+            raise ValueError(f"Unsupported logistics provider: {provider_name}")
+
+# Singleton instance
+logistics_services = LogisticsServiceFactory()
@@ -0,0 +1,263 @@
+"""
+Shipping rate quotes with caching (Anicam & Chilexpress)
+TTL cache with stale-while-revalidate plus parallel quoting across providers
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services.logistics import LogisticsProvider, logistics_services
+
+# Seconds a quote is served without revalidation
+RATE_QUOTE_TTL = float(os.getenv("RATE_QUOTE_TTL", "3600"))
+
+# Extra seconds an expired quote may still be served while it is refreshed in the background
+RATE_QUOTE_STALE_TTL = float(os.getenv("RATE_QUOTE_STALE_TTL", "86400"))
+
+# Weights are rounded up to this step (kg) so nearby weights share a quote
+RATE_QUOTE_WEIGHT_STEP = float(os.getenv("RATE_QUOTE_WEIGHT_STEP", "0.5"))
+
+RATE_QUOTE_MAX_ENTRIES = int(os.getenv("RATE_QUOTE_MAX_ENTRIES", "10000"))
+
+QuoteKey = Tuple[str, str, str, str, float]
+RateOption = Dict[str, object]
+
+_PRICE_KEYS = ("price", "total", "amount", "cost", "valor")
+_DAYS_KEYS = ("transit_days", "delivery_days", "days", "dias")
+
+def weight_bucket(weight: float, step: Optional[float] = None) -> float:
+    """Upper bound of the weight step a package falls in (1.2 kg -> 1.5 kg)"""
+    step = step or RATE_QUOTE_WEIGHT_STEP
+    return round(max(step, math.ceil(weight / step) * step), 3)
+
+def _first_number(option: Dict, keys: Tuple[str, ...]) -> Optional[float]:
+    for key in keys:
+        value = option.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                continue
+    return None
+
+def parse_rate_options(provider_name: str, payload: object) -> List[RateOption]:
+    """
+    Normalize a provider rates response to [{provider, service, price, days}]
+
+    Accepts a list of rates, {"rates": [...]}, {"data": [...]} or a single rate object.
+    """
+    if isinstance(payload, dict):
+        rates = payload.get("rates") or payload.get("data") or [payload]
+    elif isinstance(payload, list):
+        rates = payload
+    else:
+        rates = []
+
+    options = []
+    for rate in rates:
+        if not isinstance(rate, dict):
+            continue
+        price = _first_number(rate, _PRICE_KEYS)
+        if price is None:
+            continue
+        options.append({
+            "provider": provider_name,
+            "service": rate.get("service") or rate.get("service_name") or rate.get("servicio"),
+            "price": price,
+            "days": _first_number(rate, _DAYS_KEYS),
+            "raw": rate
+        })
+    return options
+
+class CachedQuote:
+    """A rates payload and when it goes stale / must be dropped"""
+
+    def __init__(self, payload: Dict, fetched_at: float):
+        self.payload = payload
+        self.fetched_at = fetched_at
+
+class RateQuoteCache:
+    """
+    Rate quotes keyed by (provider, credential set, origin, destination, weight bucket)
+
+    Accounts with different API keys or base URLs may have different
+    negotiated rates, so they never share entries.
+
+    Fresh quotes are served from memory. Quotes past `ttl` but within
+    `stale_ttl` are served immediately while one background task
+    refreshes them; older or missing quotes are fetched inline. Concurrent
+    misses for the same key share a single provider request.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, stale_ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl or RATE_QUOTE_TTL
+        self.stale_ttl = stale_ttl if stale_ttl is not None else RATE_QUOTE_STALE_TTL
+        self.max_entries = max_entries or RATE_QUOTE_MAX_ENTRIES
+
+        self._entries: Dict[QuoteKey, CachedQuote] = {}
+        self._inflight: Dict[QuoteKey, asyncio.Task] = {}
+        self._refresh_tasks: set = set()
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refresh_errors": 0}
+        self._last_refresh_error: Optional[str] = None
+
+    @staticmethod
+    def _key(service: LogisticsProvider, origin: str, destination: str, weight: float) -> QuoteKey:
+        # Normalized for the key only; the provider gets the caller's strings
+        return (
+            service.name,
+            service.credential_key,
+            origin.strip().upper(),
+            destination.strip().upper(),
+            weight_bucket(weight)
+        )
+
+    async def _load(self, service: LogisticsProvider, key: QuoteKey, origin: str, destination: str) -> Dict:
+        try:
+            payload = await service.get_shipping_rates(origin, destination, key[-1])
+            self._store(key, payload)
+            return payload
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _fetch(self, service: LogisticsProvider, key: QuoteKey, origin: str, destination: str) -> Dict:
+        """
+        Single-flight provider request for a key
+
+        The request runs as its own task, so a caller that times out does
+        not abort it and the next caller finds the quote cached.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(service, key, origin, destination))
+            self._inflight[key] = task
+            # Retrieve the error even if every waiter timed out
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(task)
+
+    def _store(self, key: QuoteKey, payload: Dict) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = CachedQuote(payload, time.monotonic())
+        if len(self._entries) > self.max_entries:
+            # Dicts keep insertion order: drop the oldest fetch
+            self._entries.pop(next(iter(self._entries)))
+
+    def _revalidate(self, service: LogisticsProvider, key: QuoteKey, origin: str, destination: str) -> None:
+        """Refresh a stale quote in the background (once per key)"""
+        if key in self._inflight:
+            return
+
+        async def refresh() -> None:
+            try:
+                await self._fetch(service, key, origin, destination)
+            except Exception as e:
+                # Keep serving the stale quote; the next stale hit tries again
+                self._counters["refresh_errors"] += 1
+                self._last_refresh_error = f"{service.name}: {str(e)[:200]}"
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def get_rates(self, service: LogisticsProvider, origin: str, destination: str, weight: float) -> Dict:
+        """
+        Rates for a route and weight, from cache when possible
+
+        The provider is asked for the weight bucket's upper bound, so the
+        quote is valid for every weight in the bucket.
+
+        Raises:
+            Exception: whatever the provider call raised, if no usable cached quote exists
+        """
+        key = self._key(service, origin, destination, weight)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self._counters["hits"] += 1
+                return entry.payload
+            if age < self.ttl + self.stale_ttl:
+                self._counters["stale_hits"] += 1
+                self._revalidate(service, key, origin, destination)
+                return entry.payload
+
+        self._counters["misses"] += 1
+        return await self._fetch(service, key, origin, destination)
+
+    def stats(self) -> Dict[str, object]:
+        """Entry count and hit counters"""
+        lookups = self._counters["hits"] + self._counters["stale_hits"] + self._counters["misses"]
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            **self._counters,
+            "last_refresh_error": self._last_refresh_error,
+            "hit_rate": round((lookups - self._counters["misses"]) / lookups, 4) if lookups else None
+        }
+
+# Singleton instance
+rate_quote_cache = RateQuoteCache()
+
+def _sort_key(prefer: str):
+    def days(option: RateOption) -> float:
+        return option["days"] if option["days"] is not None else math.inf
+
+    if prefer == "fastest":
+        return lambda option: (days(option), option["price"])
+    return lambda option: (option["price"], days(option))
+
+async def quote_all(
+    origin: str,
+    destination: str,
+    weight: float,
+    providers: Dict[str, Dict],
+    prefer: str = "cheapest",
+    timeout: Optional[float] = None
+) -> Dict[str, object]:
+    """
+    Quote every configured provider in parallel and pick the best option
+
+    Args:
+        origin: Origin address/code
+        destination: Destination address/code
+        weight: Package weight in kg
+        providers: Credentials by provider name, e.g. {"anicam": {"api_key": ...}}
+        prefer: "cheapest" (price, then days) or "fastest" (days, then price)
+        timeout: Seconds to wait for each provider (defaults to RATE_QUOTE_TIMEOUT)
+
+    Returns:
+        {"best": option or None, "options": all options sorted by preference, "errors": {provider: message}}
+    """
+    if prefer not in ("cheapest", "fastest"):
+        raise ValueError(f"Unsupported rate preference: {prefer}")
+    timeout = timeout or float(os.getenv("RATE_QUOTE_TIMEOUT", "5"))
+
+    errors: Dict[str, str] = {}
+
+    async def quote(provider_name: str, credentials: Dict) -> List[RateOption]:
+        try:
+            service = logistics_services.get_service(provider_name, credentials)
+            payload = await asyncio.wait_for(
+                rate_quote_cache.get_rates(service, origin, destination, weight),
+                timeout
+            )
+            return parse_rate_options(service.name, payload)
+        except asyncio.TimeoutError:
+            errors[provider_name] = f"No quote within {timeout:.0f}s"
+        except Exception as e:
+            # One provider failing in any way must not fail the whole quote
+            errors[provider_name] = f"{type(e).__name__}: {str(e)[:200]}"
+        return []
+
+    results = await asyncio.gather(*(quote(name, credentials) for name, credentials in providers.items()))
+    options = sorted((option for result in results for option in result), key=_sort_key(prefer))
+
+    return {
+        "best": options[0] if options else None,
+        "options": options,
+        "errors": errors
+    }
@@ -0,0 +1,261 @@
+"""
+Bulk tracking refresh for the shipments table
+Polls providers for every open shipment and writes back only status changes
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.orm import sessionmaker
+
+from models.database import SessionLocal
+from models.tables import LogisticsProvider as LogisticsProviderRow, Shipment
+from services.logistics import logistics_services
+
+# Shipment statuses that never change again
+TERMINAL_STATUSES = ("delivered", "cancelled", "returned", "failed")
+
+# Shipments read, tracked and written per batch
+TRACKING_BATCH_SIZE = int(os.getenv("TRACKING_REFRESH_BATCH_SIZE", "500"))
+
+# Tracking requests in flight per provider
+TRACKING_CONCURRENCY = int(os.getenv("TRACKING_REFRESH_CONCURRENCY", "10"))
+
+# Raw tracking statuses (as normalized by tracking_status) -> shipments.status vocabulary;
+# per-provider entries win over the common ones, anything unmapped is not written
+COMMON_TRACKING_STATUSES: Dict[str, str] = {
+    "pending": "pending",
+    "in_transit": "in_transit",
+    "delivered": "delivered",
+    "cancelled": "cancelled",
+    "returned": "returned",
+    "failed": "failed",
+    "pendiente": "pending",
+    "en_transito": "in_transit",
+    "en_tránsito": "in_transit",
+    "en_reparto": "in_transit",
+    "entregado": "delivered",
+    "cancelado": "cancelled",
+    "anulado": "cancelled",
+    "devuelto": "returned",
+    "fallido": "failed"
+}
+
+PROVIDER_TRACKING_STATUSES: Dict[str, Dict[str, str]] = {
+    "anicam": {
+        "creado": "pending",
+        "retirado": "in_transit",
+        "en_ruta": "in_transit"
+    },
+    "chilexpress": {
+        "recibido": "pending",
+        "en_proceso": "in_transit",
+        "devuelto_a_remitente": "returned",
+        "entrega_fallida": "failed"
+    }
+}
+
+ShipmentRow = Dict[str, object]
+RefreshReport = Dict[str, int]
+
+def tracking_status(payload: object) -> Optional[str]:
+    """
+    Normalized shipment status from a provider tracking payload
+
+    Accepts {"status": "..."}, {"estado": "..."}, {"data": {"status": ...}}
+    and status objects with a code or name; anything else (lists, errors) is None.
+    """
+    if not isinstance(payload, dict) or payload.get("error"):
+        return None
+
+    data = payload.get("data")
+    status = payload.get("status") or payload.get("estado") or (data.get("status") if isinstance(data, dict) else None)
+    if isinstance(status, dict):
+        status = status.get("code") or status.get("name")
+    if not status:
+        return None
+    return str(status).strip().lower().replace(" ", "_")[:50]
+
+def shipment_status(provider_name: str, payload: object) -> Optional[str]:
+    """
+    shipments.status value for a provider tracking payload
+
+    The provider's own map is checked first, then the common one; a payload
+    with no status, or a status in neither map, is None.
+    """
+    status = tracking_status(payload)
+    if status is None:
+        return None
+    provider_map = PROVIDER_TRACKING_STATUSES.get(provider_name.lower(), {})
+    return provider_map.get(status) or COMMON_TRACKING_STATUSES.get(status)
+
+def _load_providers(session_factory: sessionmaker) -> Dict[int, LogisticsProviderRow]:
+    """Every configured logistics provider by id"""
+    db = session_factory()
+    try:
+        providers = db.query(LogisticsProviderRow).all()
+        db.expunge_all()
+        return {provider.id: provider for provider in providers}
+    finally:
+        db.close()
+
+def _load_open_shipments(session_factory: sessionmaker, after_id: int, limit: int) -> List[ShipmentRow]:
+    """Next page of non-terminal shipments by id (keyset pagination)"""
+    db = session_factory()
+    try:
+        rows = db.query(
+            Shipment.id, Shipment.provider_id, Shipment.tracking_number, Shipment.status
+        ).filter(
+            Shipment.id > after_id,
+            Shipment.status.notin_(TERMINAL_STATUSES)
+        ).order_by(Shipment.id).limit(limit).all()
+        return [
+            {"id": row.id, "provider_id": row.provider_id, "tracking_number": row.tracking_number, "status": row.status}
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+def _write_changes(session_factory: sessionmaker, changes: List[ShipmentRow]) -> int:
+    """
+    Write new statuses in one executemany UPDATE
+
+    Each row is only updated if its status is still the one we read, so a
+    change made meanwhile (e.g. by an operator) is not overwritten.
+
+    Returns:
+        Number of rows updated
+    """
+    table = Shipment.__table__
+    statement = table.update().where(
+        and_(table.c.id == bindparam("b_id"), table.c.status == bindparam("b_old_status"))
+    ).values(status=bindparam("b_status"))
+
+    db = session_factory()
+    try:
+        result = db.connection().execute(statement, [
+            {"b_id": change["id"], "b_old_status": change["old_status"], "b_status": change["status"]}
+            for change in changes
+        ])
+        db.commit()
+        return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(changes)
+    finally:
+        db.close()
+
+async def _track_batch(
+    shipments: List[ShipmentRow],
+    providers: Dict[int, LogisticsProviderRow],
+    concurrency: int,
+    report: RefreshReport
+) -> List[ShipmentRow]:
+    """Fetch tracking for a batch, all providers in parallel; return changed rows"""
+    by_provider: Dict[int, List[ShipmentRow]] = {}
+    for shipment in shipments:
+        by_provider.setdefault(shipment["provider_id"], []).append(shipment)
+
+    async def track_provider(provider_id: int, rows: List[ShipmentRow]) -> List[ShipmentRow]:
+        provider = providers.get(provider_id)
+        credentials = (provider.credentials or {}) if provider is not None else {}
+        if provider is None or not credentials.get("api_key"):
+            print(f"WARNING: Tracking refresh skipped provider {provider_id}: not configured or no api_key")
+            report["skipped"] += len(rows)
+            return []
+
+        try:
+            # The provider row's api_endpoint is the host to poll unless credentials override it
+            service = logistics_services.get_service(
+                provider.name,
+                {"base_url": provider.api_endpoint, **credentials}
+            )
+        except ValueError as e:
+            print(f"WARNING: Tracking refresh skipped provider {provider_id}: {e}")
+            report["skipped"] += len(rows)
+            return []
+
+        try:
+            tracking = await service.get_tracking_batch(
+                list({row["tracking_number"] for row in rows}),
+                concurrency=concurrency
+            )
+        except Exception as e:
+            # One provider failing must not abort the other providers' batch
+            print(f"WARNING: Tracking refresh failed for provider {provider_id}: {type(e).__name__}: {e}")
+            report["failed"] += len(rows)
+            return []
+
+        changed = []
+        for row in rows:
+            payload = tracking.get(row["tracking_number"])
+            status = shipment_status(provider.name, payload)
+            if status is None:
+                raw_status = tracking_status(payload)
+                if raw_status is None:
+                    report["failed"] += 1
+                else:
+                    # Never write a status outside the shipments vocabulary
+                    print(f"WARNING: Tracking refresh got unmapped status {raw_status!r} from provider {provider_id}")
+                    report["unmapped"] += 1
+            elif status != row["status"]:
+                changed.append({"id": row["id"], "old_status": row["status"], "status": status})
+        return changed
+
+    results = await asyncio.gather(*(
+        track_provider(provider_id, rows) for provider_id, rows in by_provider.items()
+    ))
+    return [change for changes in results for change in changes]
+
+async def refresh_tracking(
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    session_factory: sessionmaker = SessionLocal
+) -> RefreshReport:
+    """
+    Refresh tracking status for every non-terminal shipment
+
+    Shipments are read in id order, batch_size at a time; each batch is
+    grouped by provider, tracked through that provider's pooled client,
+    mapped to the shipments vocabulary and only rows whose status changed
+    are written back, in one UPDATE per batch.
+
+    Args:
+        batch_size: Shipments per batch (defaults to TRACKING_REFRESH_BATCH_SIZE)
+        concurrency: Tracking requests in flight per provider (defaults to TRACKING_REFRESH_CONCURRENCY)
+        session_factory: SQLAlchemy session factory
+
+    Returns:
+        Counters: scanned, changed, written, failed, unmapped, skipped, batches
+    """
+    batch_size = batch_size or TRACKING_BATCH_SIZE
+    concurrency = concurrency or TRACKING_CONCURRENCY
+    report: RefreshReport = {
+        "scanned": 0, "changed": 0, "written": 0, "failed": 0, "unmapped": 0, "skipped": 0, "batches": 0
+    }
+
+    providers = await asyncio.to_thread(_load_providers, session_factory)
+    after_id = 0
+
+    while True:
+        shipments = await asyncio.to_thread(_load_open_shipments, session_factory, after_id, batch_size)
+        if not shipments:
+            break
+        after_id = shipments[-1]["id"]
+        report["scanned"] += len(shipments)
+        report["batches"] += 1
+
+        changes = await _track_batch(shipments, providers, concurrency, report)
+        if changes:
+            report["changed"] += len(changes)
+            report["written"] += await asyncio.to_thread(_write_changes, session_factory, changes)
+
+    return report
+
+async def _main() -> None:
+    try:
+        report = await refresh_tracking()
+    finally:
+        await logistics_services.aclose()
+    print(f"Tracking refresh: {report}")
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,30 @@
+"""
+Verified token cache - concurrent use from the threadpool
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import jwt
+
+from backend.auth_tokens import VerifiedTokenCache
+from backend.settings import get_settings
+
+
+def test_concurrent_verify_with_eviction():
+    settings = get_settings()
+    cache = VerifiedTokenCache(max_entries=5)
+    tokens = [
+        jwt.encode({"user_id": i, "exp": int(time.time()) + 60}, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+        for i in range(50)
+    ]
+
+    def verify_all(_):
+        for _ in range(50):
+            for user_id, token in enumerate(tokens):
+                assert cache.verify(token)["user_id"] == user_id
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(verify_all, range(8)))
+
+    assert cache.stats()["entries"] <= 5
@@ -0,0 +1,130 @@
+"""
+ML API gateway transport - retries, deadlines and circuit breaking
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from backend.ml_api_gateway import MLGatewayTransport, MLPriority, ml_priority
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """Inner transport that raises `error` or answers `status_code`."""
+
+    def __init__(self, status_code=200, error=None):
+        self.status_code = status_code
+        self.error = error
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return httpx.Response(self.status_code, json={}, request=request)
+
+
+def make_gateway(inner, **settings):
+    gateway = MLGatewayTransport(inner)
+    gateway.backoff_base = 0.001
+    gateway.backoff_max = 0.001
+    for name, value in settings.items():
+        setattr(gateway, name, value)
+    return gateway
+
+
+async def get(gateway, path="/orders/1", priority=MLPriority.INTERACTIVE):
+    async with httpx.AsyncClient(transport=gateway, base_url="https://api.mercadolibre.com") as client:
+        with ml_priority(priority):
+            return await client.get(path, headers={'Authorization': 'Bearer token'})
+
+
+def test_interactive_timeout_is_not_retried():
+    inner = CountingTransport(error=httpx.ReadTimeout("timed out"))
+    gateway = make_gateway(inner)
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(get(gateway))
+
+    assert inner.calls == 1
+
+
+def test_background_timeout_is_retried():
+    inner = CountingTransport(error=httpx.ReadTimeout("timed out"))
+    gateway = make_gateway(inner)
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(get(gateway, priority=MLPriority.BACKGROUND))
+
+    assert inner.calls == gateway.max_retries + 1
+
+
+def test_interactive_retries_stop_at_deadline():
+    inner = CountingTransport(status_code=503)
+    gateway = make_gateway(inner, max_wait=0.05, backoff_base=1.0, backoff_max=1.0)
+
+    response = asyncio.run(get(gateway))
+
+    assert response.status_code == 503
+    assert inner.calls == 1
+
+
+def test_throttled_half_open_probe_is_released():
+    inner = CountingTransport(status_code=200)
+    gateway = make_gateway(inner, max_wait=0.01)
+    gateway._family(httpx.Request("GET", "https://api.mercadolibre.com/orders/1"))
+    breaker = gateway._breakers["orders"]
+    breaker.reset_timeout = 0.0
+    breaker._open()
+
+    # Seller bucket empty: the probe is allowed by the breaker but throttled locally
+    gateway._seller_bucket(gateway._seller_key(
+        httpx.Request("GET", "https://api.mercadolibre.com/orders/1", headers={'Authorization': 'Bearer token'})
+    )).block(60)
+    throttled = asyncio.run(get(gateway))
+    assert throttled.json()["error"] == "local_throttle"
+    assert inner.calls == 0
+
+    # A request with another token may probe right away and closes the breaker
+    breaker.reset_timeout = 30.0
+    async def probe():
+        async with httpx.AsyncClient(transport=gateway, base_url="https://api.mercadolibre.com") as client:
+            return await client.get("/orders/1", headers={'Authorization': 'Bearer other'})
+    response = asyncio.run(probe())
+
+    assert response.status_code == 200
+    assert inner.calls == 1
+    assert breaker.stats()["state"] == "closed"
+
+
+def test_background_only_yields_to_interactive_on_the_same_bucket():
+    inner = CountingTransport(status_code=200)
+    gateway = make_gateway(inner, max_wait=2.0)
+    gateway._seller_bucket(gateway._seller_key(
+        httpx.Request("GET", "https://api.mercadolibre.com/orders/1", headers={'Authorization': 'Bearer seller-a'})
+    )).block(0.5)
+
+    async def call(client, token, priority):
+        with ml_priority(priority):
+            return await client.get("/orders/1", headers={'Authorization': f'Bearer {token}'})
+
+    async def run():
+        async with httpx.AsyncClient(transport=gateway, base_url="https://api.mercadolibre.com") as client:
+            interactive = asyncio.create_task(call(client, "seller-a", MLPriority.INTERACTIVE))
+            await asyncio.sleep(0.05)
+
+            # Seller B's background sync is not held up by seller A's blocked bucket
+            background = await asyncio.wait_for(call(client, "seller-b", MLPriority.BACKGROUND), 0.3)
+            assert not interactive.done()
+
+            # ...but seller A's own background traffic still waits behind its interactive request
+            queued = asyncio.create_task(call(client, "seller-a", MLPriority.BACKGROUND))
+            first = await interactive
+            assert not queued.done()
+            return background, first, await queued
+
+    responses = asyncio.run(run())
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert gateway._app_bucket.interactive_waiting == 0
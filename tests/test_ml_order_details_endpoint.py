@@ -0,0 +1,89 @@
+"""
+Batch order details endpoint - request parsing and multiget responses
+"""
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import httpx
+
+import endpoints.ml_orders_endpoint as ml_orders_endpoint
+from backend.auth_tokens import verify_token
+from backend.ml_http_client import get_ml_http_client
+from backend.ml_order_cache import CachedOrder
+from backend.ml_order_details import fetch_order_details
+from backend.settings import get_db
+
+
+def make_client(monkeypatch, cached_ids):
+    app = FastAPI()
+    app.include_router(ml_orders_endpoint.router)
+    app.dependency_overrides[verify_token] = lambda: {"user_id": 1}
+    app.dependency_overrides[get_ml_http_client] = lambda: None
+    app.dependency_overrides[get_db] = lambda: None
+
+    async def require_owner(db, user_id, store_id):
+        return None
+
+    async def get_many(db, store_id, order_ids):
+        return {
+            order_id: CachedOrder({"id": int(order_id)}, '"etag"', 0, "local")
+            for order_id in order_ids if order_id in cached_ids
+        }
+
+    monkeypatch.setattr(ml_orders_endpoint.store_ownership, "require_owner", require_owner)
+    monkeypatch.setattr(ml_orders_endpoint.ml_order_cache, "get_many", get_many)
+    return TestClient(app)
+
+
+def test_numeric_order_ids_are_accepted(monkeypatch):
+    client = make_client(monkeypatch, {"123", "456"})
+
+    response = client.post("/api/ml/stores/7/orders/details", json={"order_ids": [123, "456", 123]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body["orders"]) == {"123", "456"}
+    assert body["from_cache"] == 2
+    assert body["errors"] == {}
+
+
+def test_empty_order_ids_are_rejected(monkeypatch):
+    client = make_client(monkeypatch, set())
+
+    response = client.post("/api/ml/stores/7/orders/details", json={"order_ids": []})
+
+    assert response.status_code == 400
+
+
+def test_malformed_multiget_bodies_become_per_id_errors():
+    bodies = {
+        "1,2": {"message": "not a list"},
+        "3,4,5": [{"code": 200, "body": {"id": 3}}, "oops"]
+    }
+
+    def handler(request):
+        return httpx.Response(200, json=bodies[request.url.params["ids"]])
+
+    async def fetch():
+        async with httpx.AsyncClient(base_url="https://api.mercadolibre.com", transport=httpx.MockTransport(handler)) as client:
+            details = await fetch_order_details(client, "token", ["1", "2"], batch_size=2)
+            more = await fetch_order_details(client, "token", ["3", "4", "5"], batch_size=3)
+            return details, more
+
+    details, more = asyncio.run(fetch())
+
+    assert details.orders == {}
+    assert set(details.errors) == {"1", "2"}
+    assert more.orders == {"3": {"id": 3}}
+    assert {order_id: error["status"] for order_id, error in more.errors.items()} == {"4": 502, "5": 502}
+
+
+def test_non_numeric_order_ids_are_rejected(monkeypatch):
+    client = make_client(monkeypatch, {"123"})
+
+    for bad_id in ["../users/me", "1,2&x=y", "123\n", -5]:
+        response = client.post("/api/ml/stores/7/orders/details", json={"order_ids": [123, bad_id]})
+
+        assert response.status_code == 400
@@ -0,0 +1,113 @@
+"""
+Order sync endpoint - background backfills, one sync per store, saved seller ids
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import endpoints.ml_orders_endpoint as ml_orders_endpoint
+from backend.auth_tokens import verify_token
+from backend.ml_http_client import get_ml_http_client
+from backend.ml_oauth_service import ml_oauth_service
+from backend.settings import get_db
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+
+    def update(self, fields):
+        self.fields = fields
+        return self
+
+    def eq(self, column, value):
+        self.id = value
+        return self
+
+
+class FakeRepository:
+    def __init__(self):
+        self.updates = []
+
+    def __bool__(self):
+        return True
+
+    def table(self, name):
+        return FakeQuery(name)
+
+    async def execute(self, query):
+        self.updates.append((query.table, query.id, query.fields))
+
+
+def make_client(monkeypatch, store, runs, db=None):
+    app = FastAPI()
+    app.include_router(ml_orders_endpoint.router)
+    app.dependency_overrides[verify_token] = lambda: {"user_id": 1}
+    app.dependency_overrides[get_ml_http_client] = lambda: None
+    app.dependency_overrides[get_db] = lambda: db
+
+    async def get_ml_access_token(db, store_id, user_id):
+        return "token", store
+
+    async def sync_store_orders(client, db, store, access_token, ml_user_id, mode, concurrency=None, chunk_size=None):
+        runs.append(mode)
+        return {
+            "mode": mode.value, "since": None, "total": 0, "inserted": 0, "updated": 0,
+            "pages": 1, "total_orders": 0, "last_sync_at": "2024-05-03T14:00:00+00:00"
+        }
+
+    monkeypatch.setattr(ml_orders_endpoint, "get_ml_access_token", get_ml_access_token)
+    monkeypatch.setattr(ml_orders_endpoint, "sync_store_orders", sync_store_orders)
+    return TestClient(app)
+
+
+def test_first_sync_runs_full_backfill_in_background(monkeypatch):
+    runs = []
+    client = make_client(monkeypatch, {"id": 1, "user_id": 1, "ml_user_id": 987654321, "last_sync_at": None}, runs)
+
+    response = client.post("/api/ml/stores/1/sync-orders")
+
+    assert response.status_code == 202
+    assert response.json()["mode"] == "full"
+    assert runs == [ml_orders_endpoint.SyncMode.FULL]
+
+
+def test_incremental_sync_runs_inline(monkeypatch):
+    runs = []
+    store = {"id": 1, "user_id": 1, "ml_user_id": 987654321, "last_sync_at": "2024-05-03T13:00:00+00:00"}
+    client = make_client(monkeypatch, store, runs)
+
+    response = client.post("/api/ml/stores/1/sync-orders")
+
+    assert response.status_code == 200
+    assert response.json()["mode"] == "incremental"
+    assert runs == [ml_orders_endpoint.SyncMode.INCREMENTAL]
+
+
+def test_sync_is_refused_while_another_runs(monkeypatch):
+    runs = []
+    store = {"id": 1, "user_id": 1, "ml_user_id": 987654321, "last_sync_at": "2024-05-03T13:00:00+00:00"}
+    client = make_client(monkeypatch, store, runs)
+    monkeypatch.setattr(ml_orders_endpoint, "sync_in_progress", lambda store_id: True)
+
+    response = client.post("/api/ml/stores/1/sync-orders")
+
+    assert response.status_code == 409
+    assert runs == []
+
+
+def test_sync_saves_the_looked_up_seller_id(monkeypatch):
+    runs = []
+    db = FakeRepository()
+    store = {"id": 1, "user_id": 1, "ml_user_id": None, "last_sync_at": "2024-05-03T13:00:00+00:00"}
+    client = make_client(monkeypatch, store, runs, db)
+
+    async def get_user_info(access_token):
+        return {"id": 987654321, "nickname": "VENDEDOR_TEST"}
+
+    monkeypatch.setattr(ml_oauth_service, "get_user_info", get_user_info)
+
+    response = client.post("/api/ml/stores/1/sync-orders")
+
+    assert response.status_code == 200
+    assert db.updates == [("ml_accounts", 1, {"ml_user_id": 987654321, "ml_nickname": "VENDEDOR_TEST"})]
@@ -0,0 +1,241 @@
+"""
+Order listings - ML payloads with numeric ids through the local read path
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+import pytest
+
+import endpoints.ml_orders_endpoint as ml_orders_endpoint
+from backend.auth_tokens import verify_token
+from backend.ml_http_client import get_ml_http_client
+from backend.ml_order_reads import decode_cursor, decode_multi_cursor, encode_cursor
+from backend.settings import get_db
+
+
+def ml_order(order_id, date_created, status="paid"):
+    """Order shaped like GET /orders/{id} (and ml_orders.order_data)."""
+    return {
+        "id": order_id,
+        "status": status,
+        "date_created": date_created,
+        "date_closed": date_created,
+        "last_updated": date_created,
+        "buyer": {"id": 1234567890, "nickname": "COMPRADOR_TEST"},
+        "seller": {"id": 987654321},
+        "total_amount": 19990.0,
+        "paid_amount": 19990.0,
+        "currency_id": "CLP",
+        "order_items": [{
+            "item": {"id": "MLC1234567890", "title": "Audífonos Bluetooth", "variation_id": None},
+            "quantity": 1,
+            "unit_price": 19990.0,
+            "currency_id": "CLP"
+        }],
+        "payments": [{"id": 81234567890, "status": "approved", "transaction_amount": 19990.0}],
+        "shipping": {"id": 44123456789},
+        "tags": ["paid", "not_delivered"]
+    }
+
+
+def store_row(store_id, nickname):
+    return {
+        "id": store_id,
+        "user_id": 1,
+        "nickname": nickname,
+        "site_id": "MLC",
+        "status": "connected",
+        "access_token": "token",
+        "last_sync_at": (datetime.now(timezone.utc) - timedelta(seconds=30)).isoformat()
+    }
+
+
+STORE_ORDERS = {
+    1: [
+        ml_order(2000003508419013, "2024-05-03T10:00:00.000-04:00"),
+        ml_order(2000003508419001, "2024-05-01T10:00:00.000-04:00")
+    ],
+    2: [
+        ml_order(2000003508419020, "2024-05-02T10:00:00.000-04:00", status="cancelled")
+    ]
+}
+
+
+async def fetch_local_orders(db, store_id, limit, status=None, date_from=None, date_to=None, cursor=None):
+    orders = STORE_ORDERS[store_id][:limit]
+    return {"orders": orders, "total": len(orders), "next_cursor": None}
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.rows = [row for row in self.rows if row.get(column) == value]
+        return self
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeRepository:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __bool__(self):
+        return True
+
+    def table(self, name):
+        return FakeQuery(list(self.rows))
+
+    async def execute(self, query):
+        return FakeResponse(query.rows)
+
+
+def make_client(monkeypatch, db):
+    app = FastAPI()
+    app.include_router(ml_orders_endpoint.router)
+    app.dependency_overrides[verify_token] = lambda: {"user_id": 1}
+    app.dependency_overrides[get_ml_http_client] = lambda: None
+    app.dependency_overrides[get_db] = lambda: db
+
+    async def token_for_store(db, store):
+        return "token"
+
+    monkeypatch.setattr(ml_orders_endpoint, "fetch_local_orders", fetch_local_orders)
+    monkeypatch.setattr(ml_orders_endpoint.ml_token_cache, "token_for_store", token_for_store)
+    return TestClient(app)
+
+
+def test_store_listing_reads_numeric_ids_from_local_copy(monkeypatch):
+    store = store_row(1, "TIENDA_UNO")
+
+    async def get_ml_store(db, store_id, user_id):
+        return store
+
+    client = make_client(monkeypatch, FakeRepository([store]))
+    monkeypatch.setattr(ml_orders_endpoint, "get_ml_store", get_ml_store)
+
+    response = client.get("/api/ml/stores/1/orders")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["source"] == "local"
+    assert [order["id"] for order in body["orders"]] == ["2000003508419013", "2000003508419001"]
+
+
+def test_all_orders_merges_stores_with_numeric_ids(monkeypatch):
+    db = FakeRepository([store_row(1, "TIENDA_UNO"), store_row(2, "TIENDA_DOS")])
+    client = make_client(monkeypatch, db)
+
+    response = client.get("/api/ml/orders", params={"limit": 10})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [store["status"] for store in body["stores"]] == ["ok", "ok"]
+    assert [(order["id"], order["store_id"]) for order in body["orders"]] == [
+        ("2000003508419013", 1),
+        ("2000003508419020", 2),
+        ("2000003508419001", 1)
+    ]
+    assert body["next_cursor"] is None
+
+
+def test_store_listing_rejects_offset_on_fresh_local_copy(monkeypatch):
+    store = store_row(1, "TIENDA_UNO")
+
+    async def get_ml_store(db, store_id, user_id):
+        return store
+
+    client = make_client(monkeypatch, FakeRepository([store]))
+    monkeypatch.setattr(ml_orders_endpoint, "get_ml_store", get_ml_store)
+
+    response = client.get("/api/ml/stores/1/orders", params={"offset": 50})
+
+    assert response.status_code == 400
+    assert "cursor" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("payload", [
+    {"date_created": '2024-05-01T10:00:00.000-04:00",ml_order_id.gt.0', "ml_order_id": 1, "total": 2},
+    {"date_created": "2024-05-01T10:00:00.000-04:00", "ml_order_id": "1),id.gt.(0", "total": 2},
+    {"date_created": "2024-05-01T10:00:00.000-04:00", "ml_order_id": 1, "total": "2"},
+    {"date_created": "2024-05-01T10:00:00.000-04:00", "ml_order_id": 1}
+])
+def test_decode_cursor_rejects_tampered_fields(payload):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(encode_cursor(payload))
+
+    assert error.value.status_code == 400
+
+
+def test_decode_cursor_reserializes_date():
+    position = decode_cursor(encode_cursor({
+        "source": "ml_api", "date_created": "2024-05-01T14:00:00.000Z", "ml_order_id": 2000003508419001, "total": 2
+    }))
+
+    assert position["date_created"] == "2024-05-01T14:00:00.000+00:00"
+    assert position["ml_order_id"] == 2000003508419001
+
+
+def test_all_orders_keeps_cursor_for_failed_store(monkeypatch):
+    db = FakeRepository([store_row(1, "TIENDA_UNO"), store_row(2, "TIENDA_DOS")])
+    client = make_client(monkeypatch, db)
+
+    async def flaky_fetch_local_orders(db, store_id, limit, **filters):
+        if store_id == 2:
+            raise RuntimeError("connection reset")
+        return await fetch_local_orders(db, store_id, limit, **filters)
+
+    monkeypatch.setattr(ml_orders_endpoint, "fetch_local_orders", flaky_fetch_local_orders)
+
+    response = client.get("/api/ml/orders", params={"limit": 10})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [store["status"] for store in body["stores"]] == ["ok", "error"]
+    assert len(body["orders"]) == 2
+    assert decode_multi_cursor(body["next_cursor"]) == {2: None}
+
+
+def test_store_listing_reads_local_copy_without_a_token(monkeypatch):
+    store = store_row(1, "TIENDA_UNO")
+
+    async def get_ml_store(db, store_id, user_id):
+        return store
+
+    async def revoked_token(db, store):
+        raise HTTPException(status_code=401, detail="Store needs to be reconnected")
+
+    client = make_client(monkeypatch, FakeRepository([store]))
+    monkeypatch.setattr(ml_orders_endpoint, "get_ml_store", get_ml_store)
+    monkeypatch.setattr(ml_orders_endpoint.ml_token_cache, "token_for_store", revoked_token)
+
+    response = client.get("/api/ml/stores/1/orders")
+
+    assert response.status_code == 200
+    assert response.json()["source"] == "local"
+
+
+def test_all_orders_reads_local_stores_without_tokens(monkeypatch):
+    db = FakeRepository([store_row(1, "TIENDA_UNO"), store_row(2, "TIENDA_DOS")])
+    client = make_client(monkeypatch, db)
+
+    async def revoked_token(db, store):
+        raise HTTPException(status_code=401, detail="Store needs to be reconnected")
+
+    monkeypatch.setattr(ml_orders_endpoint.ml_token_cache, "token_for_store", revoked_token)
+
+    response = client.get("/api/ml/orders", params={"limit": 10})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [store["status"] for store in body["stores"]] == ["ok", "ok"]
+    assert len(body["orders"]) == 3
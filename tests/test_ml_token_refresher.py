@@ -0,0 +1,95 @@
+"""
+Token refresher - revoked refresh tokens
+"""
+
+from datetime import datetime, timedelta
+import asyncio
+
+from backend.ml_oauth_service import RefreshTokenRevoked, ml_oauth_service
+from backend.ml_token_cache import ml_token_cache
+from backend.ml_token_refresher import MLTokenRefresher
+
+
+class FakeQuery:
+    """Just enough of the PostgREST builder for ml_accounts selects/updates."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.update_fields = None
+
+    def select(self, columns):
+        return self
+
+    def update(self, fields):
+        self.update_fields = fields
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: str(row.get(column)) < value)
+        return self
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeRepository:
+    """In-memory ml_accounts standing in for the Supabase repository."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __bool__(self):
+        return True
+
+    def table(self, name):
+        assert name == 'ml_accounts'
+        return FakeQuery(self.rows)
+
+    async def execute(self, query):
+        matched = [row for row in query.rows if all(check(row) for check in query.filters)]
+        if query.update_fields is not None:
+            for row in matched:
+                row.update(query.update_fields)
+        return FakeResponse([dict(row) for row in matched])
+
+
+def test_revoked_refresh_token_marks_store_expired(monkeypatch):
+    calls = []
+
+    async def refresh_access_token(**kwargs):
+        calls.append(kwargs)
+        raise RefreshTokenRevoked()
+
+    monkeypatch.setattr(ml_oauth_service, "refresh_access_token", refresh_access_token)
+    monkeypatch.setattr(ml_oauth_service, "decrypt_secret", lambda secret: secret)
+
+    store = {
+        "id": 42,
+        "status": "connected",
+        "access_token": "old-access",
+        "refresh_token": "revoked-refresh",
+        "app_id": "app",
+        "app_secret_encrypted": "secret",
+        "site_id": "MLC",
+        "token_expires_at": (datetime.now() + timedelta(seconds=60)).isoformat()
+    }
+    db = FakeRepository([store])
+    refresher = MLTokenRefresher(window=900, interval=300, concurrency=1)
+    refresher.db = db
+    ml_token_cache.invalidate(42)
+
+    assert asyncio.run(refresher.refresh_expiring()) == 0
+    assert store["status"] == "expired"
+    assert refresher.stats()["revoked"] == 1
+
+    # The next scan no longer picks the store up
+    assert asyncio.run(refresher.refresh_expiring()) == 0
+    assert len(calls) == 1
+    assert refresher.stats()["last_batch_size"] == 0
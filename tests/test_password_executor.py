@@ -0,0 +1,39 @@
+"""
+Password hash executor - admission counts follow the pool, not the callers
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from backend.password_executor import PasswordHashExecutor
+
+
+def test_cancelled_callers_keep_their_slot_until_the_job_ends():
+    executor = PasswordHashExecutor(workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        caller = asyncio.create_task(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        await asyncio.sleep(0)
+
+        # The bcrypt job is still running, so the pool is still full
+        with pytest.raises(HTTPException) as error:
+            await asyncio.wait_for(executor.run(lambda: True), 1)
+        assert error.value.status_code == 503
+
+        release.set()
+        while executor._pending:
+            await asyncio.sleep(0.01)
+        return await executor.run(lambda: True)
+
+    try:
+        assert asyncio.run(scenario()) is True
+        assert executor.stats()["rejected"] == 1
+    finally:
+        release.set()
+        executor.shutdown()
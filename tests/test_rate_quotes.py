@@ -0,0 +1,75 @@
+"""
+Shipping rate quote cache and quote_all
+"""
+
+import asyncio
+
+import services.rate_quotes as rate_quotes
+from services.logistics import AnicamService, ChilexpressService
+from services.rate_quotes import RateQuoteCache
+
+
+class FakeAnicam(AnicamService):
+    def __init__(self, api_key, price=10.0, error=None):
+        super().__init__(api_key)
+        self.price = price
+        self.error = error
+        self.calls = []
+
+    async def get_shipping_rates(self, origin, destination, weight):
+        self.calls.append((origin, destination, weight))
+        if self.error is not None:
+            raise self.error
+        return {"rates": [{"service": "standard", "price": self.price, "transit_days": 3}]}
+
+
+class FakeChilexpress(ChilexpressService):
+    async def get_shipping_rates(self, origin, destination, weight):
+        return [{"service": "express", "price": 15.0, "transit_days": 1}]
+
+
+def test_accounts_do_not_share_quotes():
+    cache = RateQuoteCache()
+    first, second = FakeAnicam("key-a", price=10.0), FakeAnicam("key-b", price=8.0)
+
+    async def run():
+        return (
+            await cache.get_rates(first, "Santiago", "Valparaíso", 1.2),
+            await cache.get_rates(second, "Santiago", "Valparaíso", 1.2)
+        )
+
+    quote_a, quote_b = asyncio.run(run())
+
+    assert quote_a["rates"][0]["price"] == 10.0
+    assert quote_b["rates"][0]["price"] == 8.0
+    assert len(first.calls) == len(second.calls) == 1
+
+
+def test_provider_gets_caller_strings_and_bucket_weight():
+    cache = RateQuoteCache()
+    service = FakeAnicam("key-a")
+
+    async def run():
+        await cache.get_rates(service, " Av. Providencia 123 ", "CL-rm-13101", 1.2)
+        await cache.get_rates(service, "av. providencia 123", "cl-RM-13101", 1.4)
+
+    asyncio.run(run())
+
+    assert service.calls == [(" Av. Providencia 123 ", "CL-rm-13101", 1.5)]
+
+
+def test_quote_all_isolates_unexpected_provider_errors(monkeypatch):
+    services = {
+        "anicam": FakeAnicam("key-a", error=TypeError("bad payload")),
+        "chilexpress": FakeChilexpress("key-c")
+    }
+    monkeypatch.setattr(rate_quotes, "rate_quote_cache", RateQuoteCache())
+    monkeypatch.setattr(rate_quotes.logistics_services, "get_service", lambda name, credentials: services[name])
+
+    result = asyncio.run(rate_quotes.quote_all(
+        "Santiago", "Valparaíso", 2.0,
+        {"anicam": {"api_key": "key-a"}, "chilexpress": {"api_key": "key-c"}}
+    ))
+
+    assert result["best"]["provider"] == "chilexpress"
+    assert "TypeError" in result["errors"]["anicam"]
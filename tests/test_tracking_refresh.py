@@ -0,0 +1,117 @@
+"""
+Tracking refresh - per tracking number and per provider error isolation
+"""
+
+from types import SimpleNamespace
+import asyncio
+import os
+
+import pytest
+
+from services.logistics import AnicamService, logistics_services
+
+
+class FakeAnicam(AnicamService):
+    """Answers from `payloads`; exceptions in it are raised for that number."""
+
+    def __init__(self, payloads):
+        super().__init__("key-a")
+        self.payloads = payloads
+
+    async def get_tracking_info(self, tracking_number):
+        payload = self.payloads[tracking_number]
+        if isinstance(payload, Exception):
+            raise payload
+        return payload
+
+
+class BrokenService(AnicamService):
+    async def get_tracking_batch(self, tracking_numbers, concurrency=10):
+        raise RuntimeError("provider down")
+
+
+@pytest.fixture
+def tracking_refresh(monkeypatch):
+    # models.database needs SQLAlchemy and a DATABASE_URL (the engine never connects here)
+    pytest.importorskip("sqlalchemy")
+    if not os.getenv("DATABASE_URL"):
+        monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    import services.tracking_refresh as module
+    return module
+
+
+def test_tracking_batch_isolates_bad_responses():
+    service = FakeAnicam({
+        "A1": {"status": "in_transit"},
+        "A2": ValueError("Expecting value: line 1 column 1 (char 0)"),
+        "A3": KeyError("estado")
+    })
+
+    tracking = asyncio.run(service.get_tracking_batch(["A1", "A2", "A3"]))
+
+    assert tracking["A1"] == {"status": "in_transit"}
+    assert tracking["A2"]["error"].startswith("ValueError")
+    assert tracking["A3"]["error"].startswith("KeyError")
+
+
+def test_tracking_status_ignores_unexpected_shapes(tracking_refresh):
+    assert tracking_refresh.tracking_status([{"status": "delivered"}]) is None
+    assert tracking_refresh.tracking_status({"data": [{"status": "delivered"}]}) is None
+    assert tracking_refresh.tracking_status({"data": {"status": {"code": "In Transit"}}}) == "in_transit"
+
+
+def test_failing_provider_does_not_abort_batch(tracking_refresh, monkeypatch):
+    services = {
+        "anicam": FakeAnicam({"A1": {"status": "delivered"}, "A2": [{"status": "delivered"}]}),
+        "chilexpress": BrokenService("key-c")
+    }
+    monkeypatch.setattr(logistics_services, "get_service", lambda name, credentials: services[name])
+    providers = {
+        1: SimpleNamespace(id=1, name="anicam", api_endpoint=None, credentials={"api_key": "key-a"}),
+        2: SimpleNamespace(id=2, name="chilexpress", api_endpoint=None, credentials={"api_key": "key-c"})
+    }
+    shipments = [
+        {"id": 1, "provider_id": 1, "tracking_number": "A1", "status": "in_transit"},
+        {"id": 2, "provider_id": 1, "tracking_number": "A2", "status": "in_transit"},
+        {"id": 3, "provider_id": 2, "tracking_number": "C1", "status": "in_transit"},
+        {"id": 4, "provider_id": 2, "tracking_number": "C2", "status": "in_transit"}
+    ]
+    report = {"scanned": 0, "changed": 0, "written": 0, "failed": 0, "skipped": 0, "batches": 0}
+
+    changes = asyncio.run(tracking_refresh._track_batch(shipments, providers, 10, report))
+
+    assert changes == [{"id": 1, "old_status": "in_transit", "status": "delivered"}]
+    assert report["failed"] == 3
+
+
+def test_spanish_terminal_status_leaves_the_refresh(tracking_refresh, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from models.tables import LogisticsProvider, Shipment
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    LogisticsProvider.__table__.create(engine)
+    Shipment.__table__.create(engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        db.add(LogisticsProvider(id=1, name="Anicam", api_endpoint="https://api.anicam.com", credentials={"api_key": "key-a"}))
+        db.add(Shipment(id=1, order_id=1, provider_id=1, tracking_number="A1", status="in_transit"))
+        db.add(Shipment(id=2, order_id=1, provider_id=1, tracking_number="A2", status="in_transit"))
+        db.commit()
+
+    service = FakeAnicam({"A1": {"estado": "Entregado"}, "A2": {"estado": "Extraviado en bodega"}})
+    monkeypatch.setattr(logistics_services, "get_service", lambda name, credentials: service)
+
+    report = asyncio.run(tracking_refresh.refresh_tracking(session_factory=session_factory))
+
+    assert report["written"] == 1
+    assert report["unmapped"] == 1
+    with session_factory() as db:
+        assert db.get(Shipment, 1).status == "delivered"
+        assert db.get(Shipment, 2).status == "in_transit"
+
+    report = asyncio.run(tracking_refresh.refresh_tracking(session_factory=session_factory))
+
+    assert report["scanned"] == 1